@@ -264,4 +264,55 @@ VALUES
     ('Western Sydney Flood Prediction', 'Predicts flood risks in Western Sydney areas and potential impacts on logistics operations', 'weather', 94.2, NOW() - INTERVAL '3 days', 'active', ARRAY['rainfall_mm', 'river_levels', 'historical_patterns', 'terrain_data', 'infrastructure_vulnerability']),
     ('Parramatta Route Optimization', 'Optimizes delivery routes in the Parramatta area based on traffic patterns', 'routing', 89.2, NOW() - INTERVAL '5 days', 'active', ARRAY['traffic_patterns', 'time_of_day', 'historical_delivery_times', 'construction_zones', 'special_events']),
     ('Penrith Warehouse Inventory Prediction', 'Predicts inventory needs for Penrith warehouse based on seasonal demand', 'inventory', 91.5, NOW() - INTERVAL '7 days', 'active', ARRAY['historical_orders', 'seasonal_patterns', 'local_events', 'supplier_lead_times', 'stock_thresholds'])
-ON CONFLICT DO NOTHING;
\ No newline at end of file
+ON CONFLICT DO NOTHING;
+
+-- Create precomputed flood forecast grid table (time-series)
+CREATE TABLE IF NOT EXISTS ml_data.flood_forecast_grid (
+    id SERIAL,
+    region VARCHAR(255) NOT NULL,
+    forecast_time TIMESTAMPTZ NOT NULL,
+    issued_at TIMESTAMPTZ NOT NULL,
+    flood_probability NUMERIC(6,5) NOT NULL,
+    flood_risk VARCHAR(50) CHECK (flood_risk IN ('low', 'medium', 'high')),
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Convert to hypertable for time-series analysis
+SELECT create_hypertable('ml_data.flood_forecast_grid', 'issued_at', if_not_exists => TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_flood_forecast_grid_region ON ml_data.flood_forecast_grid(region, forecast_time);
+
+-- Create raw weather gauge readings table (time-series, bulk loaded with COPY)
+CREATE TABLE IF NOT EXISTS ml_data.weather_readings (
+    time TIMESTAMPTZ NOT NULL,
+    gauge_id VARCHAR(255) NOT NULL,
+    region VARCHAR(255),
+    rainfall_mm DOUBLE PRECISION,
+    river_level_m DOUBLE PRECISION,
+    soil_moisture DOUBLE PRECISION,
+    temperature_c DOUBLE PRECISION,
+    wind_speed_kmh DOUBLE PRECISION,
+    batch_id VARCHAR(255),
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Convert to hypertable for time-series analysis
+SELECT create_hypertable('ml_data.weather_readings', 'time', if_not_exists => TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_weather_readings_gauge ON ml_data.weather_readings(gauge_id, time DESC);
+
+-- Typed route optimization columns alongside the training data JSONB, so
+-- training can read them without decoding JSON per row
+ALTER TABLE ml_data.training_data
+    ADD COLUMN IF NOT EXISTS region VARCHAR(255),
+    ADD COLUMN IF NOT EXISTS time_of_day SMALLINT,
+    ADD COLUMN IF NOT EXISTS day_of_week SMALLINT,
+    ADD COLUMN IF NOT EXISTS is_holiday SMALLINT,
+    ADD COLUMN IF NOT EXISTS rainfall_mm DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS temperature DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS traffic_index DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS road_type SMALLINT,
+    ADD COLUMN IF NOT EXISTS distance_km DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS construction_zones SMALLINT,
+    ADD COLUMN IF NOT EXISTS special_events SMALLINT,
+    ADD COLUMN IF NOT EXISTS travel_time_minutes DOUBLE PRECISION;
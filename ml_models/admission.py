@@ -0,0 +1,232 @@
+"""
+ML API Admission Control
+------------------------
+Bounded, prioritised admission for request classes (interactive
+predictions, batch scoring, training). Each class has a concurrency limit
+and a bounded wait queue; all classes share a global slot budget that is
+handed to waiting interactive requests before batch and training ones.
+Requests whose deadline cannot be met are rejected up front with a
+Retry-After hint instead of timing out in the queue.
+"""
+
+import math
+import os
+import threading
+import time
+
+import metrics
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+TRAINING = 'training'
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# priority (lower is served first), concurrency limit, queue bound, default deadline in seconds
+DEFAULT_CLASSES = {
+    INTERACTIVE: {
+        'priority': 0,
+        'max_concurrent': _env_int('ML_ADMISSION_INTERACTIVE_CONCURRENCY', 32),
+        'max_queue': _env_int('ML_ADMISSION_INTERACTIVE_QUEUE', 128),
+        'deadline': float(os.environ.get('ML_ADMISSION_INTERACTIVE_DEADLINE', 2.0))
+    },
+    BATCH: {
+        'priority': 1,
+        'max_concurrent': _env_int('ML_ADMISSION_BATCH_CONCURRENCY', 2),
+        'max_queue': _env_int('ML_ADMISSION_BATCH_QUEUE', 16),
+        'deadline': float(os.environ.get('ML_ADMISSION_BATCH_DEADLINE', 30.0))
+    },
+    TRAINING: {
+        'priority': 2,
+        'max_concurrent': _env_int('ML_ADMISSION_TRAINING_CONCURRENCY', 1),
+        'max_queue': _env_int('ML_ADMISSION_TRAINING_QUEUE', 2),
+        'deadline': float(os.environ.get('ML_ADMISSION_TRAINING_DEADLINE', 600.0))
+    }
+}
+
+DEFAULT_TOTAL_SLOTS = _env_int('ML_ADMISSION_SLOTS', 34)
+
+# Weight of the newest observation in the service time moving average
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    """Request was shed; retry_after is a hint in seconds"""
+
+    def __init__(self, request_class, reason, retry_after):
+        super().__init__(f"{request_class} request rejected: {reason}")
+        self.request_class = request_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _RequestClass:
+    """Limits and live state for one request class"""
+
+    def __init__(self, name, priority, max_concurrent, max_queue, deadline):
+        self.name = name
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.in_flight = 0
+        self.waiters = []
+        self.service_time = None
+        self.admitted = 0
+        self.rejected = 0
+
+    def expected_wait(self, position):
+        """Rough wait for the request at a queue position, from the service time average"""
+        service_time = self.service_time or 0.0
+        return service_time * (position // max(self.max_concurrent, 1) + 1)
+
+
+class _Waiter:
+    __slots__ = ('request_class', 'granted')
+
+    def __init__(self, request_class):
+        self.request_class = request_class
+        self.granted = False
+
+
+class Ticket:
+    """An admitted request; release() when it finishes"""
+
+    __slots__ = ('controller', 'request_class', 'started', 'released')
+
+    def __init__(self, controller, request_class):
+        self.controller = controller
+        self.request_class = request_class
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Admits requests per class against shared slots, in priority order"""
+
+    def __init__(self, classes=None, total_slots=DEFAULT_TOTAL_SLOTS):
+        self.total_slots = total_slots
+        self.in_flight = 0
+        self.classes = {
+            name: _RequestClass(name, **config)
+            for name, config in (classes or DEFAULT_CLASSES).items()
+        }
+        self._condition = threading.Condition()
+
+    def _can_run(self, request_class):
+        return request_class.in_flight < request_class.max_concurrent and self.in_flight < self.total_slots
+
+    def _higher_priority_waiting(self, request_class):
+        """Whether queued requests of this or a higher priority class could take the slot"""
+        return any(
+            other.waiters and other.priority <= request_class.priority
+            and (other is request_class or other.in_flight < other.max_concurrent)
+            for other in self.classes.values()
+        )
+
+    def _take_slot(self, request_class):
+        request_class.in_flight += 1
+        request_class.admitted += 1
+        self.in_flight += 1
+
+    def _reject(self, request_class, reason, retry_after):
+        request_class.rejected += 1
+        metrics.ADMISSION_REJECTED.inc(request_class=request_class.name, reason=reason)
+        raise Rejected(request_class.name, reason, max(1, math.ceil(retry_after)))
+
+    def acquire(self, class_name, timeout=None):
+        """
+        Admit a request of class_name within timeout seconds, never longer
+        than the class deadline (the default). Returns a Ticket, or raises
+        Rejected when the queue is full, the expected wait exceeds the
+        deadline, or the deadline passes while queued.
+        """
+        request_class = self.classes[class_name]
+        timeout = request_class.deadline if timeout is None else min(timeout, request_class.deadline)
+        deadline = time.perf_counter() + timeout
+
+        with self._condition:
+            if self._can_run(request_class) and not self._higher_priority_waiting(request_class):
+                self._take_slot(request_class)
+                return Ticket(self, request_class)
+
+            position = len(request_class.waiters)
+            expected_wait = request_class.expected_wait(position)
+            if position >= request_class.max_queue:
+                self._reject(request_class, 'queue_full', expected_wait)
+            if expected_wait > timeout:
+                self._reject(request_class, 'deadline', expected_wait)
+
+            waiter = _Waiter(request_class)
+            request_class.waiters.append(waiter)
+            self._grant()
+            try:
+                while not waiter.granted:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            finally:
+                if not waiter.granted:
+                    request_class.waiters.remove(waiter)
+
+            if not waiter.granted:
+                self._reject(request_class, 'timeout', request_class.expected_wait(len(request_class.waiters)))
+            return Ticket(self, request_class)
+
+    def _release(self, ticket):
+        request_class = ticket.request_class
+        duration = time.perf_counter() - ticket.started
+        with self._condition:
+            request_class.in_flight -= 1
+            self.in_flight -= 1
+            if request_class.service_time is None:
+                request_class.service_time = duration
+            else:
+                request_class.service_time += SERVICE_TIME_ALPHA * (duration - request_class.service_time)
+            self._grant()
+
+    def _grant(self):
+        """Hand free slots to waiters, highest priority class first"""
+        granted = False
+        for request_class in sorted(self.classes.values(), key=lambda c: c.priority):
+            while request_class.waiters and self._can_run(request_class):
+                waiter = request_class.waiters.pop(0)
+                waiter.granted = True
+                self._take_slot(request_class)
+                granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def queue_depth(self, class_name):
+        return len(self.classes[class_name].waiters)
+
+    def snapshot(self):
+        """Current limits, depths and counters per class"""
+        with self._condition:
+            return {
+                'total_slots': self.total_slots,
+                'in_flight': self.in_flight,
+                'classes': {
+                    name: {
+                        'priority': c.priority,
+                        'in_flight': c.in_flight,
+                        'queued': len(c.waiters),
+                        'max_concurrent': c.max_concurrent,
+                        'max_queue': c.max_queue,
+                        'deadline_s': c.deadline,
+                        'avg_service_ms': None if c.service_time is None else c.service_time * 1000,
+                        'admitted': c.admitted,
+                        'rejected': c.rejected
+                    }
+                    for name, c in self.classes.items()
+                }
+            }
@@ -6,13 +6,32 @@ REST API for interacting with machine learning models.
 
 import os
 import sys
+import hmac
+import math
 import json
+import time
 import logging
 from datetime import datetime
 import subprocess
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from flood_prediction import FloodPredictionModel
 from route_optimization import RouteOptimizationModel
+import geo
+from scenario_engine import ScenarioEngine
+from flood_forecast import FloodForecastService
+import metrics
+import profiling
+import columnar
+import admission
+import resources
+from model_registry import MODEL_CLASSES, ModelRegistry, ShadowEvaluator
+from weather_features import WeatherFeatureEngine
+from residuals import ResidualCorrector
+import bulk_ingest
+from forest_quantiles import parse_quantiles
+import surrogate
+import backends
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +49,199 @@ app = Flask(__name__)
 # Initialize models
 flood_model = None
 route_model = None
+flood_forecast = None
+flood_surrogate = None
+
+# Versioned artifacts, and candidate models scored in shadow per model type
+registry = ModelRegistry()
+shadows = {}
+SHADOW_SAMPLE_RATE = float(os.environ.get('ML_SHADOW_SAMPLE_RATE', 0.1))
+
+# Live per-gauge weather state for region-only flood predictions
+weather_engine = WeatherFeatureEngine()
+metrics.WEATHER_GAUGES.set_function(lambda: len(weather_engine.gauges))
+
+# Bulk COPY loads of readings and delivery actuals, on their own connection
+ingestor = bulk_ingest.BulkIngestor()
+
+# Bias correction of route predictions learned from reported actual travel times
+residual_corrector = ResidualCorrector()
+metrics.RESIDUAL_CELLS.set_function(lambda: len(residual_corrector.stats))
+
+# Micro-batching of concurrent single route predictions
+ROUTE_BATCHING = os.environ.get('ML_ROUTE_BATCHING', 'true').lower() in ('1', 'true', 'yes')
+BATCH_MAX_SIZE = int(os.environ.get('ML_BATCH_MAX_SIZE', 64))
+BATCH_MAX_LATENCY_MS = float(os.environ.get('ML_BATCH_MAX_LATENCY_MS', 2.0))
+
+# Monte Carlo ensemble limits: samples per forecast, and sampled rows per request
+ENSEMBLE_MAX_SAMPLES = 100000
+ENSEMBLE_MAX_ROWS = 1000000
+
+# Rows scored per model call on the streaming endpoints
+STREAM_BATCH_SIZE = 1000
+MAX_STREAM_BATCH_SIZE = 10000
+
+# Clients allowed on /admin endpoints when ML_ADMIN_TOKEN is not set
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+# Admission control by request class; unlisted endpoints are not limited
+ADMISSION_ENABLED = os.environ.get('ML_ADMISSION', 'true').lower() in ('1', 'true', 'yes')
+ENDPOINT_CLASSES = {
+    '/predict/flood': admission.INTERACTIVE,
+    '/predict/route': admission.INTERACTIVE,
+    '/forecast/flood': admission.INTERACTIVE,
+    '/geo/nearest': admission.INTERACTIVE,
+    '/weather/features': admission.INTERACTIVE,
+    '/whatif/flood': admission.INTERACTIVE,
+    '/models/info': admission.INTERACTIVE,
+    '/models/drift': admission.INTERACTIVE,
+    '/models/residuals': admission.INTERACTIVE,
+    '/predict/flood/batch': admission.BATCH,
+    '/predict/route/batch': admission.BATCH,
+    '/predict/flood/ensemble': admission.BATCH,
+    '/predict/flood/stream': admission.BATCH,
+    '/predict/route/stream': admission.BATCH,
+    '/explain/flood': admission.BATCH,
+    '/explain/route': admission.BATCH,
+    '/forecast/flood/inputs': admission.BATCH,
+    '/weather/readings': admission.BATCH,
+    '/feedback/route': admission.BATCH,
+    '/ingest/weather': admission.BATCH,
+    '/ingest/deliveries': admission.BATCH,
+    '/scenarios/evaluate': admission.BATCH,
+    '/models/train': admission.TRAINING,
+    '/whatif/flood/build': admission.TRAINING
+}
+admission_controller = admission.AdmissionController()
+
+for _class_name in admission_controller.classes:
+    metrics.ADMISSION_QUEUE_DEPTH.set_function(
+        lambda name=_class_name: admission_controller.queue_depth(name), request_class=_class_name
+    )
+    metrics.ADMISSION_IN_FLIGHT.set_function(
+        lambda name=_class_name: admission_controller.classes[name].in_flight, request_class=_class_name
+    )
+
+@app.before_request
+def _start_request_metrics():
+    """Label this request's stage timings with its endpoint"""
+    g.request_start = time.perf_counter()
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.current_endpoint.set(endpoint)
+    
+    # Opt-in tracing via the X-Profile header or ML_TRACE_* config
+    if profiling.should_trace(request.headers.get('X-Profile')):
+        profiling.start_trace(f'{request.method} {endpoint}')
+    
+    # Shed load early rather than letting every class slow down together
+    request_class = ENDPOINT_CLASSES.get(endpoint)
+    if ADMISSION_ENABLED and request_class:
+        try:
+            g.admission_ticket = admission_controller.acquire(request_class, _request_deadline())
+        except admission.Rejected as e:
+            response = jsonify({'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+
+@app.after_request
+def _record_request_metrics(response):
+    """Count the request and record its latency"""
+    endpoint = metrics.current_endpoint.get()
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    if 'request_start' in g:
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    
+    trace = profiling.end_trace()
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.trace_id
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+@app.teardown_request
+def _end_request_trace(exc):
+    """Detach any trace left open by a failed request and free the admission slot"""
+    profiling.end_trace()
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
+
+def _connection_open(owner):
+    """1 if the model's database connection is open"""
+    model = globals().get(owner)
+    return int(bool(model is not None and model.conn and not model.conn.closed))
+
+def _connection_busy(owner):
+    """1 if the model's database connection is inside a transaction"""
+    if not _connection_open(owner):
+        return 0
+    return int(globals()[owner].conn.info.transaction_status != TRANSACTION_STATUS_IDLE)
+
+for _owner in ('flood_model', 'route_model'):
+    metrics.DB_CONNECTIONS_OPEN.set_function(lambda owner=_owner: _connection_open(owner), owner=_owner)
+    metrics.DB_CONNECTIONS_BUSY.set_function(lambda owner=_owner: _connection_busy(owner), owner=_owner)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/traces', methods=['GET'])
+def admin_traces():
+    """Recently completed request traces"""
+    if not _admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    limit = request.args.get('limit', 20, type=int)
+    traces = list(profiling.recent_traces)[-limit:]
+    return jsonify({
+        'traces': [trace.to_dict() for trace in reversed(traces)],
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """Run the sampling profiler and return folded stacks for a flame graph"""
+    try:
+        if not _admin_authorized():
+            return jsonify({'error': 'Unauthorized'}), 401
+            
+        seconds = request.args.get('seconds', 10, type=float)
+        interval_ms = request.args.get('interval_ms', 5, type=float)
+        if not 0 < seconds <= 300 or not 1 <= interval_ms <= 1000:
+            return jsonify({'error': 'seconds must be in (0, 300] and interval_ms in [1, 1000]'}), 400
+            
+        folded, samples = profiling.profiler.profile(seconds, interval_ms / 1000)
+        
+        response = Response(folded + '\n', mimetype='text/plain')
+        response.headers['X-Profile-Samples'] = str(samples)
+        return response
+        
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error profiling: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/queues', methods=['GET'])
+def admin_queues():
+    """Admission queue depths, limits and counters per request class"""
+    if not _admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({
+        'enabled': ADMISSION_ENABLED,
+        'queues': admission_controller.snapshot(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/admin/resources', methods=['GET'])
+def admin_resources():
+    """Thread budgets and the parallelism native libraries are using"""
+    if not _admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({
+        'resources': resources.report(),
+        'timestamp': datetime.now().isoformat()
+    })
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -54,24 +266,35 @@ def predict_flood():
             flood_model.load_model()
         
         # Get features from request
-        data = request.json
+        data = _request_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
+        # Assemble live weather features when only a region is given
+        with metrics.stage('derive'):
+            data = _live_flood_features(data)
+            
         # Validate required fields
-        required_fields = ['rainfall_mm_24h', 'rainfall_mm_72h', 'river_level_m']
-        missing_fields = [field for field in required_fields if field not in data]
+        with metrics.stage('validation'):
+            missing_fields = _missing_flood_fields(data)
         if missing_fields:
             return jsonify({'error': f'Missing required fields: {missing_fields}'}), 400
             
+        # Derive distance_to_river_km from a location if not supplied
+        with metrics.stage('derive'):
+            data = geo.derive_flood_features(data)
+            
         # Make prediction
         prediction = flood_model.predict(data)
+        _shadow_offer('flood', data, prediction)
         
         return jsonify({
             'prediction': prediction,
             'timestamp': datetime.now().isoformat()
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in flood prediction: {e}")
         return jsonify({'error': str(e)}), 500
@@ -83,79 +306,791 @@ def predict_route():
         # Initialize model if needed
         global route_model
         if route_model is None:
-            route_model = RouteOptimizationModel()
+            route_model = RouteOptimizationModel(residuals=residual_corrector)
             route_model.load_model()
+        if ROUTE_BATCHING:
+            route_model.enable_batching(BATCH_MAX_SIZE, BATCH_MAX_LATENCY_MS)
         
         # Get features from request
-        data = request.json
+        data = _request_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
         # Validate required fields
-        required_fields = ['time_of_day', 'day_of_week', 'distance_km']
-        missing_fields = [field for field in required_fields if field not in data]
+        with metrics.stage('validation'):
+            missing_fields = _missing_route_fields(data)
         if missing_fields:
             return jsonify({'error': f'Missing required fields: {missing_fields}'}), 400
             
-        # Make prediction
-        prediction = route_model.predict(data)
+        # Derive distance_km from origin/destination if not supplied
+        with metrics.stage('derive'):
+            data = geo.derive_route_features(data)
+            
+        # Make prediction, with per-tree quantiles if requested
+        quantiles = request.args.get('quantiles')
+        if quantiles:
+            prediction = route_model.predict_quantiles([data], parse_quantiles(quantiles))[0]
+        else:
+            prediction = route_model.predict(data)
+        _shadow_offer('route', data, prediction)
         
         return jsonify({
             'prediction': prediction,
             'timestamp': datetime.now().isoformat()
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in route prediction: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/models/train', methods=['POST'])
-def train_model():
-    """Train or retrain a model"""
+@app.route('/predict/flood/batch', methods=['POST'])
+def predict_flood_batch():
+    """Predict flood risk for a batch of locations"""
     try:
-        data = request.json
-        if not data or 'model_type' not in data:
-            return jsonify({'error': 'Model type not specified'}), 400
+        # Initialize model if needed
+        global flood_model
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        
+        # Arrow / MessagePack bodies or responses are scored as columns
+        request_type, response_type = _columnar_types()
+        if request_type or response_type:
+            return _predict_columnar(
+                flood_model, request_type, response_type,
+                _missing_flood_fields, geo.derive_flood_columns, geo.derive_flood_features
+            )
+        
+        # Get items from request
+        items = _batch_items(_request_json())
+        if not items:
+            return jsonify({'error': 'No data provided'}), 400
             
-        model_type = data['model_type']
+        # Assemble live weather features for items that only name a region
+        with metrics.stage('derive'):
+            items = [_live_flood_features(item) for item in items]
+            
+        # Validate required fields
+        error = _validate_items(items, _missing_flood_fields)
+        if error:
+            return jsonify({'error': error}), 400
+            
+        # Derive distance_to_river_km from locations if not supplied
+        with metrics.stage('derive'):
+            items = geo.derive_flood_features(items)
+            
+        # Make predictions
+        predictions = flood_model.predict_batch(items)
+        
+        return jsonify({
+            'predictions': predictions,
+            'count': len(predictions),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in batch flood prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/flood/ensemble', methods=['POST'])
+def predict_flood_ensemble():
+    """Monte Carlo flood forecast from rainfall and river level distributions"""
+    try:
+        # Initialize model if needed
+        global flood_model
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        
+        data = _request_json()
+        if not data or not data.get('forecasts'):
+            return jsonify({'error': 'No forecasts provided'}), 400
+            
+        n_samples = int(data.get('n_samples', 1000))
+        if not 1 <= n_samples <= ENSEMBLE_MAX_SAMPLES:
+            return jsonify({'error': f'n_samples must be between 1 and {ENSEMBLE_MAX_SAMPLES}'}), 400
+        if len(data['forecasts']) * n_samples > ENSEMBLE_MAX_ROWS:
+            return jsonify({
+                'error': f'forecasts x n_samples must not exceed {ENSEMBLE_MAX_ROWS}; send fewer forecasts or samples'
+            }), 400
+            
+        forecasts = flood_model.predict_ensemble(
+            data['forecasts'],
+            n_samples=n_samples,
+            quantiles=data.get('quantiles'),
+            thresholds=data.get('thresholds'),
+            seed=data.get('seed')
+        )
+        
+        return jsonify({
+            'forecasts': forecasts,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except KeyError as e:
+        return jsonify({'error': f'Forecast is missing field: {e.args[0]}'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in ensemble flood prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/route/batch', methods=['POST'])
+def predict_route_batch():
+    """Predict travel times for a batch of routes"""
+    try:
+        # Initialize model if needed
+        global route_model
+        if route_model is None:
+            route_model = RouteOptimizationModel(residuals=residual_corrector)
+            route_model.load_model()
+        
+        # Arrow / MessagePack bodies or responses are scored as columns
+        request_type, response_type = _columnar_types()
+        quantiles = request.args.get('quantiles')
+        if request_type or response_type:
+            if quantiles:
+                return jsonify({'error': 'Quantiles are only supported for JSON batches'}), 400
+            return _predict_columnar(
+                route_model, request_type, response_type,
+                _missing_route_fields, geo.derive_route_columns, geo.derive_route_features
+            )
+        
+        # Get items from request
+        items = _batch_items(_request_json())
+        if not items:
+            return jsonify({'error': 'No data provided'}), 400
+            
+        # Validate required fields
+        error = _validate_items(items, _missing_route_fields)
+        if error:
+            return jsonify({'error': error}), 400
+            
+        # Derive distance_km from origin/destination if not supplied
+        with metrics.stage('derive'):
+            items = geo.derive_route_features(items)
+            
+        # Make predictions, with per-tree quantiles if requested
+        if quantiles:
+            predictions = route_model.predict_quantiles(items, parse_quantiles(quantiles))
+        else:
+            predictions = route_model.predict_batch(items)
+        
+        return jsonify({
+            'predictions': predictions,
+            'count': len(predictions),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in batch route prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/flood/stream', methods=['POST'])
+def predict_flood_stream():
+    """Score newline-delimited JSON flood items, streaming NDJSON results back"""
+    try:
+        # Initialize model if needed
+        global flood_model
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        
+        batch_size = _stream_batch_size()
+        return _stream_predictions(flood_model, batch_size, _missing_flood_fields, geo.derive_flood_features)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in streaming flood prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/route/stream', methods=['POST'])
+def predict_route_stream():
+    """Score newline-delimited JSON route items, streaming NDJSON results back"""
+    try:
+        # Initialize model if needed
+        global route_model
+        if route_model is None:
+            route_model = RouteOptimizationModel(residuals=residual_corrector)
+            route_model.load_model()
+        
+        batch_size = _stream_batch_size()
+        return _stream_predictions(route_model, batch_size, _missing_route_fields, geo.derive_route_features)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in streaming route prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/explain/flood', methods=['POST'])
+def explain_flood():
+    """Per-feature attributions for flood predictions (one item or a batch)"""
+    try:
+        # Initialize model if needed
+        global flood_model
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        
+        return _explain(flood_model, _missing_flood_fields, geo.derive_flood_features)
         
-        if model_type == 'flood':
-            # Initialize model if needed
-            global flood_model
-            if flood_model is None:
-                flood_model = FloodPredictionModel()
-                
-            # Train model
-            result = flood_model.train()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error explaining flood predictions: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/explain/route', methods=['POST'])
+def explain_route():
+    """Per-feature attributions for route travel times (one item or a batch)"""
+    try:
+        # Initialize model if needed
+        global route_model
+        if route_model is None:
+            route_model = RouteOptimizationModel(residuals=residual_corrector)
+            route_model.load_model()
+        
+        return _explain(route_model, _missing_route_fields, geo.derive_route_features)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error explaining route predictions: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/feedback/route', methods=['POST'])
+def route_feedback():
+    """Report actual travel times of completed deliveries to correct route predictions online"""
+    try:
+        # Initialize model if needed
+        global route_model
+        if route_model is None:
+            route_model = RouteOptimizationModel(residuals=residual_corrector)
+            route_model.load_model()
+        
+        items = _batch_items(_request_json())
+        if not items:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        error = _validate_items(items, _missing_feedback_fields)
+        if error:
+            return jsonify({'error': error}), 400
+        try:
+            actuals = [float(item['actual_travel_time_minutes']) for item in items]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'actual_travel_time_minutes must be a number'}), 400
+        
+        with metrics.stage('derive'):
+            items = geo.derive_route_features(items)
+        
+        predicted = route_model.observe_actuals(items, actuals)
+        metrics.ROUTE_FEEDBACK.inc(len(items))
+        
+        return jsonify({
+            'observed': len(items),
+            'mean_residual_minutes': float(sum(actuals) - predicted.sum()) / len(items),
+            'model_version': route_model.model_version,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error recording route feedback: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/weather/readings', methods=['POST'])
+def ingest_weather_readings():
+    """Ingest raw gauge readings into the live weather feature engine"""
+    try:
+        data = _request_json()
+        readings = data.get('readings') if isinstance(data, dict) else data
+        if not isinstance(readings, list) or not readings:
+            return jsonify({'error': 'No readings provided'}), 400
+            
+        accepted, errors = weather_engine.ingest(readings)
+        metrics.WEATHER_READINGS.inc(accepted, status='accepted')
+        if errors:
+            metrics.WEATHER_READINGS.inc(len(errors), status='rejected')
+            
+        return jsonify({
+            'accepted': accepted,
+            'rejected': len(errors),
+            'errors': errors[:20],
+            'timestamp': datetime.now().isoformat()
+        }), 200 if accepted or not errors else 400
+        
+    except Exception as e:
+        logger.error(f"Error ingesting weather readings: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/weather/features', methods=['GET'])
+def get_weather_features():
+    """Live weather features assembled per region"""
+    try:
+        region = request.args.get('region')
+        try:
+            regions = weather_engine.snapshot(region)
+        except KeyError:
+            return jsonify({'error': f'No live weather readings for region: {region}'}), 404
+            
+        return jsonify({
+            'regions': regions,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error reading weather features: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ingest/weather', methods=['POST'])
+def bulk_ingest_weather():
+    """Bulk load raw gauge readings into the database and the live feature engine"""
+    try:
+        return _bulk_ingest(bulk_ingest.WEATHER)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error ingesting weather readings: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ingest/deliveries', methods=['POST'])
+def bulk_ingest_deliveries():
+    """Bulk load completed deliveries as route training data"""
+    try:
+        return _bulk_ingest(bulk_ingest.DELIVERIES)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error ingesting deliveries: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/forecast/flood/inputs', methods=['POST'])
+def submit_flood_forecast_inputs():
+    """Submit new hourly weather inputs and precompute the flood forecast grid"""
+    try:
+        data = _request_json()
+        if not data or not isinstance(data.get('regions'), dict):
+            return jsonify({'error': 'Hourly inputs per region not provided'}), 400
+            
+        base_time = _parse_time(data.get('base_time'))
+        service = _get_flood_forecast()
+        # Reject malformed inputs here; the background precompute can only log them
+        regions = service.validate_inputs(data['regions'])
+        
+        # Precompute in the background unless the caller asks to wait
+        if data.get('wait'):
+            grid = service.precompute(regions, base_time)
             return jsonify({
-                'status': 'success',
-                'model': 'flood_prediction',
-                'training_results': result,
+                'status': 'completed',
+                'issued_at': grid.issued_at.isoformat(),
+                'base_time': grid.base_time.isoformat(),
                 'timestamp': datetime.now().isoformat()
             })
             
-        elif model_type == 'route':
-            # Initialize model if needed
-            global route_model
-            if route_model is None:
-                route_model = RouteOptimizationModel()
-                
-            # Train model
-            result = route_model.train()
+        service.submit(regions, base_time)
+        return jsonify({
+            'status': 'accepted',
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error submitting flood forecast inputs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/forecast/flood', methods=['GET'])
+def get_flood_forecast():
+    """Look up precomputed flood risk by region and time window"""
+    try:
+        grid = _get_flood_forecast().grid
+        metrics.cache_lookup('flood_forecast_grid', grid is not None)
+        if grid is None:
+            return jsonify({'error': 'Flood forecast not yet computed'}), 503
+            
+        region = request.args.get('region')
+        start = _parse_time(request.args.get('from'))
+        end = _parse_time(request.args.get('to'))
+        
+        try:
+            cells = grid.query(region, start, end)
+        except KeyError:
+            return jsonify({'error': f'Unknown region: {region}'}), 404
+            
+        return jsonify({
+            'forecast': cells,
+            'issued_at': grid.issued_at.isoformat(),
+            'base_time': grid.base_time.isoformat(),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading flood forecast: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/whatif/flood', methods=['GET'])
+def whatif_flood():
+    """Flood probability for slider values, interpolated from the surrogate lookup table"""
+    try:
+        table = _get_flood_surrogate()
+        if table is None:
+            return jsonify({'error': 'No what-if table has been built'}), 404
+        
+        region = request.args.get('region')
+        if region not in table.region_index:
+            return jsonify({'error': f'Unknown region: {region}'}), 404
+        
+        # Sliders left out take the region's live readings, then its defaults
+        current = dict(table.defaults[region])
+        try:
+            current.update(weather_engine.region_features(region)[0])
+        except KeyError:
+            pass
+        missing_fields = [name for name in table.axes if name not in request.args and name not in current]
+        if missing_fields:
+            return jsonify({'error': f'Missing required fields: {missing_fields}'}), 400
+        values = [float(request.args.get(name, current.get(name))) for name in table.axes]
+        non_finite = [name for name, value in zip(table.axes, values) if not math.isfinite(value)]
+        if non_finite:
+            return jsonify({'error': f'Slider values must be finite: {non_finite}'}), 400
+        probability, low, high, clamped = table.lookup(region, values)
+        
+        return jsonify({
+            'region': region,
+            'inputs': dict(zip(table.axes, values)),
+            'flood_probability': probability,
+            'flood_risk': 'high' if probability > 0.7 else 'medium' if probability > 0.4 else 'low',
+            'cell_range': [low, high],
+            'error_bound': table.validation.get('regions', {}).get(region),
+            'clamped': clamped,
+            'model_version': table.model_version,
+            'stale': flood_model is not None and flood_model.model_version != table.model_version
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in what-if lookup: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/whatif/flood/build', methods=['POST'])
+def build_whatif_flood():
+    """Rebuild the what-if lookup table by sweeping the serving flood model"""
+    try:
+        global flood_model, flood_surrogate
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        
+        data = request.get_json(silent=True) or {}
+        table = surrogate.FloodSurrogate.build(
+            flood_model, data.get('axes'), int(data.get('points', surrogate.DEFAULT_POINTS))
+        )
+        table.save()
+        flood_surrogate = table
+        
+        return jsonify({
+            'status': 'success',
+            'surrogate': table.describe(),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building what-if table: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/scenarios/evaluate', methods=['POST'])
+def evaluate_scenarios():
+    """Evaluate combined flood/route what-if scenarios"""
+    try:
+        global flood_model, route_model
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        if route_model is None:
+            route_model = RouteOptimizationModel(residuals=residual_corrector)
+            route_model.load_model()
+        engine = ScenarioEngine(flood_model, route_model)
+        
+        data = _request_json()
+        if not data or not data.get('scenarios'):
+            return jsonify({'error': 'No scenarios provided'}), 400
+            
+        # Flatten scenarios into aligned flood and route frames
+        scenarios = data['scenarios']
+        flood_rows = [geo.derive_flood_features(s.get('flood', {})) for s in scenarios]
+        route_rows = []
+        route_scenario = []
+        for i, scenario in enumerate(scenarios):
+            routes = geo.derive_route_features(scenario.get('routes', []))
+            route_rows.extend(routes)
+            route_scenario.extend([i] * len(routes))
+            
+        sweep = data.get('sweep')
+        if sweep:
+            if 'feature' not in sweep or 'values' not in sweep:
+                return jsonify({'error': 'Sweep requires feature and values'}), 400
+            flood_probability, adjusted_time = engine.sweep(
+                flood_rows, route_rows, route_scenario, sweep['feature'], sweep['values']
+            )
             return jsonify({
-                'status': 'success',
-                'model': 'route_optimization',
-                'training_results': result,
+                'sweep': {
+                    'feature': sweep['feature'],
+                    'values': sweep['values'],
+                    'flood_probability': flood_probability.tolist(),
+                    'flood_adjusted_time_minutes': adjusted_time.tolist()
+                },
+                'route_scenario': route_scenario,
                 'timestamp': datetime.now().isoformat()
             })
             
+        result = engine.evaluate(flood_rows, route_rows, route_scenario)
+        return jsonify({
+            'flood_probability': result.flood_probability.tolist(),
+            'flood_risk': result.flood_risk.tolist(),
+            'travel_time_minutes': result.travel_time.tolist(),
+            'flood_adjusted_time_minutes': result.flood_adjusted_time.tolist(),
+            'delay_minutes': result.delay_minutes.tolist(),
+            'route_scenario': route_scenario,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error evaluating scenarios: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/geo/nearest', methods=['GET'])
+def geo_nearest():
+    """Find the nearest depots, warehouses or suburbs to a coordinate"""
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        if lat is None or lon is None:
+            return jsonify({'error': 'lat and lon are required'}), 400
+            
+        kind = request.args.get('kind')
+        radius_km = request.args.get('radius_km', type=float)
+        index = geo.get_location_index()
+        
+        if radius_km is not None:
+            locations = index.within_radius(lat, lon, radius_km, kind=kind)
         else:
+            locations = index.nearest(lat, lon, k=request.args.get('k', 1, type=int), kind=kind)
+            
+        return jsonify({
+            'locations': locations,
+            'distance_to_river_km': float(geo.distance_to_river_km(lat, lon)[0]),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in nearest location lookup: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/models/train', methods=['POST'])
+def train_model():
+    """
+    Train a new model version and publish it to the registry. By default
+    the new version is activated and hot-swapped in; with "shadow": true it
+    becomes a candidate scored against a sample of live traffic instead.
+    """
+    try:
+        data = _request_json()
+        if not data or 'model_type' not in data:
+            return jsonify({'error': 'Model type not specified'}), 400
+            
+        model_type = data['model_type']
+        model_names = {'flood': 'flood_prediction', 'route': 'route_optimization'}
+        if model_type not in model_names:
             return jsonify({'error': f'Unknown model type: {model_type}'}), 400
+        backend = data.get('backend')
+        if backend is not None and not backends.available(backend):
+            return jsonify({'error': f'Unknown or uninstalled training backend: {backend}'}), 400
+        
+        # Only retrain when live features have drifted from the training data
+        if data.get('if_drifted'):
+            current = flood_model if model_type == 'flood' else route_model
+            if current is not None and current.drift is not None:
+                drift_scores = current.drift.scores()
+                if not drift_scores['drifted']:
+                    return jsonify({
+                        'status': 'skipped',
+                        'model': model_names[model_type],
+                        'reason': 'No feature drift detected',
+                        'drift': drift_scores,
+                        'timestamp': datetime.now().isoformat()
+                    })
+        
+        # Keep the currently deployed artifact available for rollback
+        registry.import_legacy(model_type)
+        
+        # Train into a fresh instance so serving continues on the active model
+        model = MODEL_CLASSES[model_type](backend=backend)
+        default_path = model.model_path
+        model.model_path = registry.staging_path(model_type)
+        result = _timed_training(model_names[model_type], model.train)
+        version = registry.publish(model_type, model)
+        model.model_path = default_path
+        
+        if data.get('shadow'):
+            registry.set_candidate(model_type, version)
+            # Shadow scores must not be saved next to the serving model's predictions
+            _detach_db(model)
+            _start_shadow(model_type, model, float(data.get('sample_rate', SHADOW_SAMPLE_RATE)))
+        else:
+            registry.activate(model_type, version)
+            _swap_model(model_type, model)
+        
+        return jsonify({
+            'status': 'success',
+            'model': model_names[model_type],
+            'version': version,
+            'deployment': 'shadow' if data.get('shadow') else 'active',
+            'training_results': result,
+            'timestamp': datetime.now().isoformat()
+        })
             
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error training model: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/models/drift', methods=['GET'])
+def model_drift():
+    """PSI/KS drift of live prediction features against each model's training data"""
+    try:
+        models = {'flood': flood_model, 'route': route_model}
+        requested = request.args.get('model_type')
+        if requested and requested not in models:
+            return jsonify({'error': f'Unknown model type: {requested}'}), 400
+        
+        result = {}
+        for model_type, model in models.items():
+            if requested and model_type != requested:
+                continue
+            if model is None or model.drift is None:
+                result[model_type] = None
+            else:
+                result[model_type] = {'version': model.model_version, **model.drift.scores()}
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error getting model drift: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/models/residuals', methods=['GET'])
+def get_route_residuals():
+    """Online route residual statistics and the largest per-cell corrections"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        return jsonify({
+            'residuals': residual_corrector.summary(limit),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading route residuals: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/models/registry', methods=['GET'])
+def model_registry_info():
+    """Published versions, active/candidate pointers and shadow comparisons"""
+    try:
+        return jsonify({
+            model_type: {
+                **registry.state(model_type),
+                'versions': registry.versions(model_type),
+                'shadow': shadows[model_type].summary() if model_type in shadows else None
+            }
+            for model_type in MODEL_CLASSES
+        })
+    except Exception as e:
+        logger.error(f"Error getting model registry: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/models/registry/candidate', methods=['POST'])
+def set_model_candidate():
+    """Shadow-evaluate a published version against live traffic"""
+    try:
+        data = _request_json()
+        if not data or 'model_type' not in data or 'version' not in data:
+            return jsonify({'error': 'model_type and version are required'}), 400
+        model_type, version = data['model_type'], data['version']
+        
+        registry.set_candidate(model_type, version)
+        candidate = registry.load(model_type, version)
+        _start_shadow(model_type, candidate, float(data.get('sample_rate', SHADOW_SAMPLE_RATE)))
+        return jsonify({'status': 'success', 'model_type': model_type, 'candidate': version})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error setting model candidate: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/models/registry/promote', methods=['POST'])
+def promote_model():
+    """Activate the candidate (or a given) version and hot-swap it in"""
+    try:
+        data = _request_json()
+        if not data or 'model_type' not in data:
+            return jsonify({'error': 'Model type not specified'}), 400
+        model_type = data['model_type']
+        version = data.get('version') or registry.state(model_type)['candidate']
+        if not version:
+            return jsonify({'error': f'No {model_type} candidate to promote'}), 400
+        
+        shadow = shadows.get(model_type)
+        if shadow is not None and shadow.candidate.model_version == version:
+            model = shadow.candidate
+        else:
+            model = registry.load(model_type, version)
+        registry.activate(model_type, version)
+        _swap_model(model_type, model)
+        _stop_shadow(model_type)
+        return jsonify({'status': 'success', 'model_type': model_type, 'active': version})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error promoting model: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/models/registry/rollback', methods=['POST'])
+def rollback_model():
+    """Reactivate the previously active version"""
+    try:
+        data = _request_json()
+        if not data or 'model_type' not in data:
+            return jsonify({'error': 'Model type not specified'}), 400
+        model_type = data['model_type']
+        
+        version = registry.rollback(model_type)
+        _swap_model(model_type, registry.load(model_type, version))
+        return jsonify({'status': 'success', 'model_type': model_type, 'active': version})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error rolling back model: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/models/info', methods=['GET'])
 def model_info():
     """Get information about available models"""
@@ -209,7 +1144,7 @@ def model_info():
 def schedule_training():
     """Schedule model training using cron jobs"""
     try:
-        data = request.json
+        data = _request_json()
         if not data or 'model_type' not in data or 'schedule' not in data:
             return jsonify({'error': 'Model type or schedule not specified'}), 400
             
@@ -241,29 +1176,435 @@ def schedule_training():
         logger.error(f"Error scheduling training: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _admin_authorized():
+    """
+    Check the X-Admin-Token header against ML_ADMIN_TOKEN. Without a
+    configured token only loopback clients are allowed.
+    """
+    token = os.environ.get('ML_ADMIN_TOKEN')
+    if not token:
+        return request.remote_addr in LOOPBACK_ADDRESSES
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+def _request_deadline():
+    """Client time budget in seconds from X-Request-Deadline-Ms, if given; it can only shorten the class deadline"""
+    value = request.headers.get('X-Request-Deadline-Ms')
+    try:
+        return max(float(value), 0) / 1000 if value else None
+    except ValueError:
+        return None
+
+def _request_json():
+    """Parse the JSON request body, timing the parse stage"""
+    with metrics.stage('parse'):
+        return request.json
+
+def _validate_items(items, missing_fields_fn):
+    """Error message for the first batch item missing required fields, if any"""
+    with metrics.stage('validation'):
+        for i, item in enumerate(items):
+            missing_fields = missing_fields_fn(item)
+            if missing_fields:
+                return f'Item {i}: missing required fields: {missing_fields}'
+    return None
+
+def _timed_training(model_name, train_fn):
+    """Run a training job, recording its duration and outcome"""
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        result = train_fn()
+        status = 'success'
+        return result
+    finally:
+        metrics.TRAINING_DURATION.observe(time.perf_counter() - start, model=model_name, status=status)
+
+def _get_flood_forecast():
+    """Forecast service sharing the flood model, created on first use"""
+    global flood_model, flood_forecast
+    if flood_forecast is None:
+        if flood_model is None:
+            flood_model = FloodPredictionModel()
+            flood_model.load_model()
+        flood_forecast = FloodForecastService(flood_model)
+        flood_forecast.load_latest()
+    return flood_forecast
+
+def _get_flood_surrogate():
+    """What-if lookup table, loaded from disk on first use; None if none was built"""
+    global flood_surrogate
+    if flood_surrogate is None and os.path.exists(surrogate.SURROGATE_PATH):
+        flood_surrogate = surrogate.FloodSurrogate.load()
+    return flood_surrogate
+
+def _swap_model(model_type, model):
+    """
+    Replace the serving model. Requests already holding the previous instance
+    finish on it; new requests pick up the new one.
+    """
+    global flood_model, route_model
+    current = flood_model if model_type == 'flood' else route_model
+    if current is not None and (model.conn is None or current.conn is not None):
+        # The new model takes over the serving connection; its own one, opened
+        # for training, is closed rather than leaked
+        _detach_db(model)
+        model.use_db, model.conn = current.use_db, current.conn
+    
+    if model_type == 'flood':
+        flood_model = model
+        if flood_forecast is not None:
+            flood_forecast.flood_model = model
+    else:
+        model.residuals = residual_corrector
+        route_model = model
+        if current is not None and current is not model:
+            # Its batcher thread would otherwise keep the old forest alive
+            current.disable_batching()
+    logger.info(f"Serving {model_type} model version {model.model_version}")
+
+def _detach_db(model):
+    """Close a model's own database connection; it no longer persists predictions"""
+    if model.conn is not None and not model.conn.closed:
+        model.conn.close()
+    model.use_db, model.conn = False, None
+
+def _start_shadow(model_type, candidate, sample_rate):
+    """Shadow-evaluate a candidate, replacing any running evaluation"""
+    _stop_shadow(model_type)
+    shadows[model_type] = ShadowEvaluator(model_type, candidate, sample_rate=sample_rate)
+
+def _stop_shadow(model_type):
+    shadow = shadows.pop(model_type, None)
+    if shadow is not None:
+        shadow.stop()
+
+def _shadow_offer(model_type, features, result):
+    """Queue a live prediction for shadow comparison, if a candidate is running"""
+    shadow = shadows.get(model_type)
+    if shadow is not None:
+        shadow.offer(features, result)
+
+def _parse_time(value):
+    """Parse an optional ISO 8601 timestamp"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+
+def _columnar_types():
+    """(request, response) columnar content types of a batch request; None means JSON"""
+    request_type = request.mimetype if columnar.is_columnar(request.mimetype) else None
+    return request_type, columnar.negotiate(request.accept_mimetypes, default=request_type)
+
+def _predict_columnar(model, request_type, response_type, missing_fields_fn, derive_columns, derive_items):
+    """Score a batch as feature columns, decoding and encoding bodies per content negotiation"""
+    for mimetype in (request_type, response_type):
+        if mimetype and not columnar.available(mimetype):
+            return jsonify({'error': f'Unsupported media type: {mimetype}'}), 415
+    
+    if request_type:
+        with metrics.stage('parse'):
+            columns = columnar.decode(request.get_data(), request_type)
+        if not columns:
+            return jsonify({'error': 'No data provided'}), 400
+        with metrics.stage('validation'):
+            missing_fields = missing_fields_fn(columns)
+        if missing_fields:
+            return jsonify({'error': f'Missing required columns: {missing_fields}'}), 400
+        with metrics.stage('derive'):
+            columns = derive_columns(columns)
+    else:
+        items = _batch_items(_request_json())
+        if not items:
+            return jsonify({'error': 'No data provided'}), 400
+        error = _validate_items(items, missing_fields_fn)
+        if error:
+            return jsonify({'error': error}), 400
+        with metrics.stage('derive'):
+            columns = columnar.columns_from_records(derive_items(items), model.feature_names)
+    
+    predictions = model.predict_columns(columns)
+    
+    if response_type:
+        with metrics.stage('serialize'):
+            body = columnar.encode(predictions, response_type)
+        return Response(body, mimetype=response_type)
+    return jsonify({
+        'predictions': {name: values.tolist() for name, values in predictions.items()},
+        'count': len(next(iter(predictions.values()))),
+        'timestamp': datetime.now().isoformat()
+    })
+
+def _explain(model, missing_fields_fn, derive_items):
+    """Validate, derive and explain a single item or a batch of items"""
+    data = _request_json()
+    items = _batch_items(data) or ([data] if isinstance(data, dict) and data else None)
+    if not items:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    error = _validate_items(items, missing_fields_fn)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    with metrics.stage('derive'):
+        items = derive_items(items)
+    
+    explanations = model.explain_batch(items)
+    return jsonify({
+        'explanations': explanations,
+        'count': len(explanations),
+        'model_version': model.model_version,
+        'timestamp': datetime.now().isoformat()
+    })
+
+def _stream_batch_size():
+    """Micro-batch size from the batch_size query parameter"""
+    batch_size = request.args.get('batch_size', STREAM_BATCH_SIZE, type=int)
+    if not 1 <= batch_size <= MAX_STREAM_BATCH_SIZE:
+        raise ValueError(f'batch_size must be between 1 and {MAX_STREAM_BATCH_SIZE}')
+    return batch_size
+
+def _iter_ndjson_batches(stream, batch_size):
+    """
+    Read NDJSON lines incrementally, yielding lists of (line_number, item,
+    error) with at most batch_size items each
+    """
+    batch = []
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            error = None if isinstance(item, dict) else 'Line is not a JSON object'
+        except ValueError as e:
+            item, error = None, f'Invalid JSON: {e}'
+        batch.append((line_number, item, error))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _score_stream_batch(model, batch, missing_fields_fn, derive_items):
+    """NDJSON result lines for one micro-batch, scored in a single model call"""
+    lines = {}
+    valid = []
+    with metrics.stage('validation'):
+        for line_number, item, error in batch:
+            if error is None:
+                missing_fields = missing_fields_fn(item)
+                if missing_fields:
+                    error = f'Missing required fields: {missing_fields}'
+            if error is None:
+                valid.append((line_number, item))
+            else:
+                lines[line_number] = {'line': line_number, 'error': error}
+    
+    if valid:
+        with metrics.stage('derive'):
+            records = _stream_records([item for _, item in valid], model.feature_names, derive_items)
+        # A bad record fails only its own line
+        scored = []
+        for (line_number, item), (record, error) in zip(valid, records):
+            if error is None:
+                scored.append((line_number, item, record))
+            else:
+                lines[line_number] = {'line': line_number, 'error': error}
+        valid = [(line_number, item) for line_number, item, _ in scored]
+    
+    if valid:
+        try:
+            columns = columnar.columns_from_records([record for _, _, record in scored], model.feature_names)
+            predictions = model.predict_columns(columns)
+            for i, (line_number, item) in enumerate(valid):
+                result = {'line': line_number}
+                if 'id' in item:
+                    result['id'] = item['id']
+                for name, values in predictions.items():
+                    result[name] = values[i].item()
+                lines[line_number] = result
+        except Exception as e:
+            logger.error(f"Error scoring stream batch: {e}")
+            for line_number, _ in valid:
+                lines[line_number] = {'line': line_number, 'error': str(e)}
+    
+    with metrics.stage('serialize'):
+        return ''.join(json.dumps(lines[line_number]) + '\n' for line_number, _, _ in batch)
+
+def _stream_records(items, feature_names, derive_items):
+    """
+    (features, error) per stream item: derived features coerced to floats,
+    or why the item cannot be scored. Items are derived together, and one
+    at a time only if that fails, to find the ones at fault.
+    """
+    try:
+        derived = [(item, None) for item in derive_items(items)]
+    except (TypeError, ValueError):
+        derived = []
+        for item in items:
+            try:
+                derived.append((derive_items(item), None))
+            except (TypeError, ValueError) as e:
+                derived.append((None, str(e)))
+    
+    records = []
+    for item, error in derived:
+        record = {}
+        for name in feature_names:
+            if error is not None:
+                break
+            value = item.get(name)
+            try:
+                record[name] = None if value is None else float(value)
+            except (TypeError, ValueError):
+                error = f"Feature '{name}' must be numeric, got {value!r}"
+        records.append((None, error) if error is not None else (record, None))
+    return records
+
+def _stream_predictions(model, batch_size, missing_fields_fn, derive_items):
+    """
+    Stream NDJSON predictions for an NDJSON request body. Input is read and
+    scored one micro-batch at a time, so memory stays flat with input size.
+    Each output line carries the input line number (and id, if given).
+    Results start flowing before the upload finishes, so clients sending
+    large bodies should read the response while they write.
+    """
+    def generate():
+        for batch in _iter_ndjson_batches(request.stream, batch_size):
+            yield _score_stream_batch(model, batch, missing_fields_fn, derive_items)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _bulk_ingest(kind):
+    """Validate a JSON or columnar batch of one kind and COPY it into the database"""
+    request_type, _ = _columnar_types()
+    if request_type and not columnar.available(request_type):
+        return jsonify({'error': f'Unsupported media type: {request_type}'}), 415
+    
+    with metrics.stage('parse'):
+        if request_type:
+            frame = bulk_ingest.frame_from_columns(columnar.decode(request.get_data(), request_type))
+        else:
+            data = _request_json()
+            items = data.get('readings') if isinstance(data, dict) and 'readings' in data else _batch_items(data)
+            frame = bulk_ingest.frame_from_records(items) if items else None
+    if frame is None or frame.empty:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    with metrics.stage('validation'):
+        valid, rejected, errors = bulk_ingest.validate(kind, frame)
+    batch_id = ingestor.write(kind, valid, request.args.get('source', 'api'))
+    metrics.INGESTED_ROWS.inc(len(valid), kind=kind, status='inserted')
+    if rejected:
+        metrics.INGESTED_ROWS.inc(rejected, kind=kind, status='rejected')
+    
+    live_errors = []
+    if kind == bulk_ingest.WEATHER and not valid.empty:
+        # Keep live flood features in step with what was stored
+        _, live_errors = weather_engine.ingest(bulk_ingest.reading_dicts(valid, hours=72))
+    
+    return jsonify({
+        'inserted': len(valid),
+        'rejected': rejected,
+        'errors': errors,
+        'live_rejected': len(live_errors),
+        'batch_id': batch_id,
+        'timestamp': datetime.now().isoformat()
+    }), 200 if len(valid) or not rejected else 400
+
+def _batch_items(data):
+    """Extract the list of items from a batch request body"""
+    if isinstance(data, dict):
+        data = data.get('items')
+    return data if isinstance(data, list) else None
+
+def _live_flood_features(data):
+    """Fill in weather features from live gauge state for a request that names a region"""
+    if data.get('region') is None or not _missing_flood_fields(data):
+        return data
+    return weather_engine.flood_features(data)
+
+def _missing_flood_fields(data):
+    """Required flood fields absent from a request item"""
+    required_fields = ['rainfall_mm_24h', 'rainfall_mm_72h', 'river_level_m']
+    return [field for field in required_fields if field not in data]
+
+def _missing_route_fields(data):
+    """Required route fields absent from a request item"""
+    required_fields = ['time_of_day', 'day_of_week']
+    missing_fields = [field for field in required_fields if field not in data]
+    
+    # distance_km may be derived from origin and destination coordinates
+    has_origin = 'origin' in data or ('origin_lat' in data and 'origin_lon' in data)
+    has_destination = 'destination' in data or ('destination_lat' in data and 'destination_lon' in data)
+    if 'distance_km' not in data and not (has_origin and has_destination):
+        missing_fields.append('distance_km')
+    return missing_fields
+
+def _missing_feedback_fields(data):
+    """Required fields absent from a completed delivery report"""
+    missing_fields = _missing_route_fields(data)
+    if 'actual_travel_time_minutes' not in data:
+        missing_fields.append('actual_travel_time_minutes')
+    return missing_fields
+
 def _is_valid_cron(expression):
     """Validate a cron expression (simplified)"""
     parts = expression.split()
     return len(parts) == 5
 
-if __name__ == '__main__':
-    # Initialize models at startup
+def init_app():
+    """
+    Startup shared by every entry point: thread budget, models, and the
+    state kept across restarts. A step that fails is logged; models are
+    then loaded on first request.
+    """
+    global flood_model, route_model
+    if not resources.is_configured():
+        resources.configure()
+    
     try:
         logger.info("Initializing ML models...")
+        for model_type in MODEL_CLASSES:
+            registry.import_legacy(model_type)
+        
         flood_model = FloodPredictionModel()
         flood_model.load_model()
         
-        route_model = RouteOptimizationModel()
+        route_model = RouteOptimizationModel(residuals=residual_corrector)
         route_model.load_model()
         
+        # Serve the last persisted flood forecast until new inputs arrive
+        _get_flood_forecast()
+        
         logger.info("ML models initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing models: {e}")
         logger.info("Will initialize models on first request")
     
+    # Resume route bias correction from its last saved state
+    try:
+        residual_corrector.load()
+    except Exception as e:
+        logger.warning(f"Could not load saved route residuals: {e}")
+    residual_corrector.start_autosave()
+    
+    # Rebuild live weather state from readings stored before a restart
+    try:
+        accepted, _ = weather_engine.ingest(ingestor.recent_weather_readings())
+        logger.info(f"Restored {accepted} stored weather readings")
+    except Exception as e:
+        logger.warning(f"Could not restore stored weather readings: {e}")
+
+if __name__ == '__main__':
+    init_app()
+    
     # Get port from environment or use default
     port = int(os.environ.get('ML_API_PORT', 5050))
     
     # Start the Flask app
     logger.info(f"Starting ML API on port {port}")
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,135 @@
+"""
+Training Backends
+-----------------
+Estimator factories for the flood classifier and route regressor:
+
+- sklearn: the original GradientBoostingClassifier / RandomForestRegressor
+- hist: scikit-learn HistGradientBoosting
+- lightgbm: LightGBM (LGBMClassifier / LGBMRegressor)
+- xgboost: XGBoost with the CPU histogram tree method
+
+Each model picks its backend from ML_FLOOD_BACKEND / ML_ROUTE_BACKEND
+(default sklearn) or an explicit choice at train time. Every backend
+exposes the scikit-learn estimator API, so the fitted estimator takes the
+same place in the model artifact and predictions are unchanged. LightGBM
+and XGBoost are imported only when chosen.
+"""
+
+import os
+import numpy as np
+
+import resources
+
+FLOOD = 'flood'
+ROUTE = 'route'
+
+SKLEARN = 'sklearn'
+HIST = 'hist'
+LIGHTGBM = 'lightgbm'
+XGBOOST = 'xgboost'
+
+BACKENDS = (SKLEARN, HIST, LIGHTGBM, XGBOOST)
+
+# Route forests compacted after training (forest_compaction.py); not trainable
+COMPACT = 'compact'
+
+# Module providing each optional backend
+_MODULES = {LIGHTGBM: 'lightgbm', XGBOOST: 'xgboost'}
+
+# Boosting settings shared by the histogram backends, per model
+_BOOSTING = {
+    FLOOD: {'rounds': 100, 'learning_rate': 0.1, 'max_depth': 5},
+    ROUTE: {'rounds': 300, 'learning_rate': 0.05, 'max_depth': 8}
+}
+
+
+def configured(model_type):
+    """Backend chosen for a model type by environment, default sklearn"""
+    return os.environ.get(f'ML_{model_type.upper()}_BACKEND', SKLEARN).lower()
+
+
+def available(name):
+    """Whether a backend's library is installed"""
+    if name not in BACKENDS:
+        return False
+    if name not in _MODULES:
+        return True
+    try:
+        __import__(_MODULES[name])
+        return True
+    except ImportError:
+        return False
+
+
+def _check(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown training backend: {name}. Choose from {list(BACKENDS)}")
+    if not available(name):
+        raise ValueError(f"Training backend '{name}' is not installed")
+
+
+def make_estimator(model_type, name=None, n_jobs=None):
+    """Unfitted estimator for a model type ('flood' classifier or 'route' regressor)"""
+    name = (name or configured(model_type)).lower()
+    _check(name)
+    n_jobs = n_jobs or resources.n_jobs(resources.TRAINING)
+    classify = model_type == FLOOD
+
+    if name == SKLEARN:
+        from sklearn.ensemble import GradientBoostingClassifier, RandomForestRegressor
+        if classify:
+            return GradientBoostingClassifier(n_estimators=100, learning_rate=0.1, max_depth=5, random_state=42)
+        return RandomForestRegressor(n_estimators=100, max_depth=15, random_state=42, n_jobs=n_jobs)
+
+    params = _BOOSTING[model_type]
+    if name == HIST:
+        from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+        estimator = HistGradientBoostingClassifier if classify else HistGradientBoostingRegressor
+        return estimator(
+            max_iter=params['rounds'], learning_rate=params['learning_rate'],
+            max_depth=params['max_depth'], early_stopping=False, random_state=42
+        )
+    if name == LIGHTGBM:
+        import lightgbm
+        estimator = lightgbm.LGBMClassifier if classify else lightgbm.LGBMRegressor
+        return estimator(
+            n_estimators=params['rounds'], learning_rate=params['learning_rate'],
+            max_depth=params['max_depth'], num_leaves=min(31, 2 ** params['max_depth']),
+            random_state=42, n_jobs=n_jobs, verbose=-1
+        )
+    import xgboost
+    estimator = xgboost.XGBClassifier if classify else xgboost.XGBRegressor
+    return estimator(
+        n_estimators=params['rounds'], learning_rate=params['learning_rate'],
+        max_depth=params['max_depth'], tree_method='hist', random_state=42, n_jobs=n_jobs
+    )
+
+
+def backend_of(estimator):
+    """Backend name of a fitted estimator, from its class"""
+    module = type(estimator).__module__
+    if module == 'forest_compaction':
+        return COMPACT
+    if module.startswith('lightgbm'):
+        return LIGHTGBM
+    if module.startswith('xgboost'):
+        return XGBOOST
+    if type(estimator).__name__.startswith('HistGradientBoosting'):
+        return HIST
+    return SKLEARN
+
+
+def set_n_jobs(estimator, n_jobs):
+    """Apply a thread budget to an estimator that takes n_jobs; others follow OpenMP limits"""
+    if hasattr(estimator, 'get_params') and 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+
+
+def feature_importances(estimator):
+    """Normalized feature importances, or None for estimators without them (HistGradientBoosting)"""
+    importances = getattr(estimator, 'feature_importances_', None)
+    if importances is None:
+        return None
+    importances = np.asarray(importances, dtype=np.float64)
+    total = importances.sum()
+    return importances / total if total > 0 else importances
@@ -0,0 +1,131 @@
+"""
+Adaptive Micro-Batching
+-----------------------
+Collects concurrent single-row predictions into one vectorized model call.
+Requests queue their feature row and block; a worker thread drains the
+queue, waits up to max_latency_ms for more rows only while concurrent
+traffic has been observed, scores the batch once and scatters the
+results back. An isolated request is scored immediately.
+
+close() stops the worker once the rows already queued are scored; later
+calls are scored inline on the caller's thread.
+"""
+
+import queue
+import threading
+import time
+import numpy as np
+
+import metrics
+
+
+class _Pending:
+    """A queued row waiting for its result"""
+
+    __slots__ = ('row', 'queued', 'done', 'result', 'error')
+
+    def __init__(self, row):
+        self.row = row
+        self.queued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Queued by close() after the last row
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Batches concurrent calls to score_fn, which maps an (n, n_features)
+    float64 matrix to n results.
+    """
+
+    def __init__(self, score_fn, name, max_batch_size=64, max_latency_ms=2.0):
+        self.score_fn = score_fn
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self._queue = queue.Queue()
+        self._last_batch_size = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name=f'{name}-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, row):
+        """Score one feature row, blocking until its batch has run"""
+        pending = _Pending(row)
+        with self._lock:
+            if self._closed:
+                return self.score_fn(row)[0]
+            self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def close(self, timeout=5.0):
+        """Score what is queued, then stop the worker thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def _collect(self):
+        """Next batch: everything queued, plus late arrivals while traffic is concurrent"""
+        batch = [self._queue.get()]
+        if batch[0] is _STOP:
+            return batch
+        deadline = batch[0].queued + self.max_latency
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                if batch[-1] is _STOP:
+                    break
+                continue
+            except queue.Empty:
+                pass
+            # Only hold the batch open if the previous one found company
+            remaining = deadline - time.perf_counter()
+            if self._last_batch_size <= 1 or remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            if batch[-1] is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        """Worker loop scoring batches and scattering results"""
+        while True:
+            batch = self._collect()
+            # The stop marker is always the last row ever queued
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+                if not batch:
+                    break
+            self._last_batch_size = len(batch)
+            started = time.perf_counter()
+            metrics.BATCH_SIZE.observe(len(batch), batcher=self.name)
+            for pending in batch:
+                metrics.BATCH_WAIT.observe(started - pending.queued, batcher=self.name)
+
+            try:
+                results = self.score_fn(np.vstack([pending.row for pending in batch]))
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+            if stopping:
+                break
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+ML Models Benchmark Suite
+-------------------------
+Reproducible, offline performance benchmarks for the flood prediction and
+route optimization models. Models are trained on their synthetic data with
+the database stubbed out, and results are written to a JSON file that can
+be compared against a previous run to flag regressions.
+
+Each installed training backend is also trained on the same data, to
+compare training time, accuracy and serving speed against the default.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json --threshold 0.15
+    python benchmark.py --backends hist,lightgbm
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+import numpy as np
+
+# Add the current directory to the path so we can import the ML models
+ML_MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ML_MODELS_DIR)
+
+from flood_prediction import FloodPredictionModel
+from route_optimization import RouteOptimizationModel
+import backends
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+# Metrics where a larger value is better; everything else is lower-is-better
+HIGHER_IS_BETTER_SUFFIXES = ('_rows_per_s', '_score')
+
+
+class StubCursor:
+    """Cursor that accepts any statement without a database"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+
+    def execute(self, query, args=None):
+        self.connection.statements += 1
+
+    def mogrify(self, template, args):
+        return b'()'
+
+    def fetchone(self):
+        # Model ID lookups
+        return (1,)
+
+    def fetchall(self):
+        return []
+
+
+class StubConnection:
+    """Connection stub so prediction persistence runs without PostgreSQL"""
+
+    encoding = 'UTF8'
+    closed = 0
+
+    def __init__(self):
+        self.statements = 0
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def _percentiles_ms(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'mean_ms': float(samples.mean())
+    }
+
+
+def _time_calls(fn, repeat):
+    """Per-call wall times in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _sample_features(model, n, seed):
+    """Feature dicts drawn from the model's own synthetic data"""
+    X, _ = model._generate_synthetic_data()
+    rng = np.random.default_rng(seed)
+    rows = X.iloc[rng.integers(0, len(X), n)]
+    return rows.to_dict('records')
+
+
+def benchmark_model(name, model_class, workdir, repeat, batch_sizes, seed):
+    """Train, load and score one model, returning flat metrics"""
+    results = {}
+    np.random.seed(seed)
+
+    model = model_class(use_db=False)
+    model.model_path = os.path.join(workdir, f'{name}_model.joblib')
+
+    # Train time (synthetic data, DB stubbed)
+    start = time.perf_counter()
+    train_result = model.train()
+    results[f'{name}.train_s'] = time.perf_counter() - start
+    results[f'{name}.test_score'] = float(train_result['test_score'])
+    results[f'{name}.artifact_bytes'] = os.path.getsize(model.model_path)
+
+    # Artifact load time
+    load_times = _time_calls(model.load_model, max(3, repeat // 100))
+    results[f'{name}.load_ms'] = float(np.median(load_times) * 1000)
+
+    features = _sample_features(model, max(batch_sizes + [repeat]), seed)
+
+    # Single-predict latency, with and without the persistence path
+    for label, conn in [('predict', None), ('predict_persist', StubConnection())]:
+        model.conn = conn
+        model.predict(features[0])  # Warm up
+        calls = iter(features * (repeat // len(features) + 1))
+        timings = _time_calls(lambda: model.predict(next(calls)), repeat)
+        for key, value in _percentiles_ms(timings).items():
+            results[f'{name}.{label}.{key}'] = value
+    model.conn = None
+
+    # Batch throughput
+    for size in batch_sizes:
+        batch = features[:size]
+        model.predict_batch(batch)  # Warm up
+        rounds = max(3, min(50, 20000 // size))
+        timings = _time_calls(lambda: model.predict_batch(batch), rounds)
+        results[f'{name}.batch_{size}_rows_per_s'] = float(size / np.median(timings))
+
+    if hasattr(model, 'predict_quantiles'):
+        results.update(benchmark_quantiles(name, model, features, repeat, batch_sizes))
+
+    return results
+
+
+def benchmark_quantiles(name, model, features, repeat, batch_sizes):
+    """Per-tree quantile predictions, and their cost relative to a plain predict_batch"""
+    results = {}
+    model.predict_quantiles(features[:1])  # Warm up, builds the packed forest
+    calls = iter(features * (repeat // len(features) + 1))
+    timings = _time_calls(lambda: model.predict_quantiles([next(calls)]), repeat)
+    for key, value in _percentiles_ms(timings).items():
+        results[f'{name}.predict_quantiles.{key}'] = value
+
+    for size in batch_sizes:
+        batch = features[:size]
+        rounds = max(3, min(50, 20000 // size))
+        plain = np.median(_time_calls(lambda: model.predict_batch(batch), rounds))
+        quantile = np.median(_time_calls(lambda: model.predict_quantiles(batch), rounds))
+        results[f'{name}.quantiles_{size}_rows_per_s'] = float(size / quantile)
+        results[f'{name}.quantiles_{size}_overhead_ratio'] = float(quantile / plain)
+    return results
+
+
+def benchmark_backend(name, model_class, backend, workdir, repeat, seed):
+    """Training time, accuracy and serving speed of one model on one training backend"""
+    results = {}
+    prefix = f'{name}.backend.{backend}'
+    np.random.seed(seed)
+
+    model = model_class(use_db=False, backend=backend)
+    model.model_path = os.path.join(workdir, f'{name}_{backend}_model.joblib')
+
+    start = time.perf_counter()
+    train_result = model.train()
+    results[f'{prefix}.train_s'] = time.perf_counter() - start
+    results[f'{prefix}.train_score'] = float(train_result['train_score'])
+    results[f'{prefix}.test_score'] = float(train_result['test_score'])
+    results[f'{prefix}.artifact_bytes'] = os.path.getsize(model.model_path)
+
+    features = _sample_features(model, max(1000, repeat), seed)
+    model.predict(features[0])  # Warm up
+    calls = iter(features * (repeat // len(features) + 1))
+    timings = _time_calls(lambda: model.predict(next(calls)), repeat)
+    results[f'{prefix}.predict.p50_ms'] = _percentiles_ms(timings)['p50_ms']
+
+    batch = features[:1000]
+    model.predict_batch(batch)  # Warm up
+    timings = _time_calls(lambda: model.predict_batch(batch), 10)
+    results[f'{prefix}.batch_1000_rows_per_s'] = float(len(batch) / np.median(timings))
+    return results
+
+
+def benchmark_import(module, repeat):
+    """Median cold import time of a module in a fresh interpreter"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=ML_MODELS_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return float(np.median(timings) * 1000)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ML_MODELS_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(repeat=1000, batch_sizes=None, import_repeat=5, seed=42, training_backends=None):
+    """Run the full suite and return a results document"""
+    import sklearn
+    batch_sizes = batch_sizes or DEFAULT_BATCH_SIZES
+    if training_backends is None:
+        training_backends = [name for name in backends.BACKENDS if backends.available(name)]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results.update(benchmark_model('flood', FloodPredictionModel, workdir, repeat, batch_sizes, seed))
+        results.update(benchmark_model('route', RouteOptimizationModel, workdir, repeat, batch_sizes, seed))
+        for backend in training_backends:
+            for name, model_class in [('flood', FloodPredictionModel), ('route', RouteOptimizationModel)]:
+                results.update(benchmark_backend(name, model_class, backend, workdir, min(repeat, 200), seed))
+
+    for module in ['flood_prediction', 'route_optimization', 'api']:
+        results[f'import.{module}_ms'] = benchmark_import(module, import_repeat)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'seed': seed,
+            'backends': training_backends
+        },
+        'results': results
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    Compare two results documents. Returns a list of regressions where a
+    metric got worse by more than `threshold` (a fraction).
+    """
+    regressions = []
+    for key, value in current['results'].items():
+        previous = baseline['results'].get(key)
+        if previous is None or previous == 0:
+            continue
+        change = (value - previous) / abs(previous)
+        worse = -change if key.endswith(HIGHER_IS_BETTER_SUFFIXES) else change
+        if worse > threshold:
+            regressions.append({
+                'metric': key,
+                'baseline': previous,
+                'current': value,
+                'change_pct': round(change * 100, 1)
+            })
+    return regressions
+
+
+def main():
+    """Main function to run the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description='Benchmark the ML models offline')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='File to write results to')
+    parser.add_argument('--compare', type=str, help='Baseline results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative change flagged as a regression')
+    parser.add_argument('--repeat', type=int, default=1000, help='Single-predict calls per model')
+    parser.add_argument('--batch-sizes', type=str, help='Comma-separated batch sizes')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--backends', type=str,
+                        help='Comma-separated training backends to compare (default: all installed, "" for none)')
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')] if args.batch_sizes else None
+    training_backends = None
+    if args.backends is not None:
+        training_backends = [name for name in args.backends.split(',') if name]
+    document = run_benchmarks(repeat=args.repeat, batch_sizes=batch_sizes, seed=args.seed,
+                              training_backends=training_backends)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        document['regressions'] = compare(document, baseline, args.threshold)
+        document['baseline'] = baseline.get('meta', {})
+
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+    width = max(len(key) for key in document['results'])
+    for key, value in sorted(document['results'].items()):
+        print(f"{key:<{width}}  {value:,.3f}")
+
+    regressions = document.get('regressions', [])
+    for regression in regressions:
+        print(f"REGRESSION {regression['metric']}: {regression['baseline']:,.3f} -> "
+              f"{regression['current']:,.3f} ({regression['change_pct']:+.1f}%)")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
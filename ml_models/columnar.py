@@ -0,0 +1,138 @@
+"""
+Columnar Batch Encoding
+-----------------------
+Binary request/response bodies for batch scoring, negotiated through the
+Content-Type and Accept headers:
+
+- Arrow IPC stream (application/vnd.apache.arrow.stream), one column per
+  feature.
+- MessagePack (application/msgpack), a map of
+  {"length": n, "columns": {name: column}} where a numeric column is a bin
+  of n little-endian float64 values (or a plain array of numbers) and a
+  text column is an array of strings.
+
+Numeric columns are wrapped zero-copy into NumPy arrays where the buffer
+layout allows it.
+"""
+
+import numpy as np
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+MSGPACK = 'application/msgpack'
+
+COLUMNAR_TYPES = (ARROW_STREAM, MSGPACK)
+
+_ALIASES = {'application/x-msgpack': MSGPACK}
+
+
+def _canonical(mimetype):
+    mimetype = (mimetype or '').split(';')[0].strip().lower()
+    return _ALIASES.get(mimetype, mimetype)
+
+
+def is_columnar(mimetype):
+    """Whether a Content-Type names one of the columnar formats"""
+    return _canonical(mimetype) in COLUMNAR_TYPES
+
+
+def available(mimetype):
+    """Whether the library for a columnar format is installed"""
+    try:
+        if _canonical(mimetype) == ARROW_STREAM:
+            import pyarrow  # noqa: F401
+        elif _canonical(mimetype) == MSGPACK:
+            import msgpack  # noqa: F401
+        else:
+            return False
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate(accept_mimetypes, default=None):
+    """
+    Columnar response type preferred by a request's Accept header (a
+    werkzeug MIMEAccept), None for JSON, or `default` without an Accept
+    header. JSON wins ties such as */*.
+    """
+    if not accept_mimetypes.provided:
+        return default
+    best = accept_mimetypes.best_match(('application/json',) + COLUMNAR_TYPES)
+    return best if best in COLUMNAR_TYPES else None
+
+
+def _numeric(values):
+    """NumPy view of a decoded column; bin columns are wrapped without copying"""
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        return np.frombuffer(values, dtype='<f8')
+    array = np.asarray(values)
+    if array.dtype.kind in 'biuf':
+        return array.astype(np.float64, copy=False)
+    return array
+
+
+def decode(body, mimetype):
+    """Decode a columnar request body into {name: np.ndarray}"""
+    mimetype = _canonical(mimetype)
+
+    if mimetype == ARROW_STREAM:
+        import pyarrow as pa
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        columns = {}
+        for name, column in zip(table.column_names, table.columns):
+            if column.num_chunks == 1 and column.null_count == 0:
+                # Single contiguous chunk without nulls is viewed in place
+                columns[name] = column.chunk(0).to_numpy(zero_copy_only=False)
+            else:
+                columns[name] = column.to_numpy()
+        return columns
+
+    if mimetype == MSGPACK:
+        import msgpack
+        payload = msgpack.unpackb(body, raw=False)
+        if not isinstance(payload, dict) or not isinstance(payload.get('columns'), dict):
+            raise ValueError("MessagePack body must be a map with a 'columns' map")
+        columns = {name: _numeric(values) for name, values in payload['columns'].items()}
+        length = payload.get('length')
+        for name, values in columns.items():
+            if length is not None and len(values) != length:
+                raise ValueError(f"Column '{name}' has {len(values)} values, expected {length}")
+        return columns
+
+    raise ValueError(f"Unsupported columnar content type: {mimetype}")
+
+
+def encode(columns, mimetype):
+    """Encode {name: array-like} as a columnar response body"""
+    mimetype = _canonical(mimetype)
+    length = len(next(iter(columns.values()))) if columns else 0
+
+    if mimetype == ARROW_STREAM:
+        import pyarrow as pa
+        table = pa.table({name: pa.array(np.asarray(values)) for name, values in columns.items()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    if mimetype == MSGPACK:
+        import msgpack
+        packed = {}
+        for name, values in columns.items():
+            array = np.asarray(values)
+            if array.dtype.kind in 'biuf':
+                packed[name] = np.ascontiguousarray(array, dtype='<f8').tobytes()
+            else:
+                packed[name] = [str(value) for value in array]
+        return msgpack.packb({'length': length, 'columns': packed}, use_bin_type=True)
+
+    raise ValueError(f"Unsupported columnar content type: {mimetype}")
+
+
+def columns_from_records(records, names):
+    """Numeric columns for `names` from a list of dicts, NaN where missing"""
+    columns = {}
+    for name in names:
+        values = [record.get(name) for record in records]
+        columns[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return columns
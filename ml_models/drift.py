@@ -0,0 +1,143 @@
+"""
+Feature Drift Monitoring
+------------------------
+Compares the distribution of live prediction features with the training
+distribution. At training time each feature's values are summarised as a
+reference histogram over quantile bin edges and stored with the model
+artifact. At serving time DriftMonitor counts incoming values into the
+same bins - a fixed-size sketch per feature, updated in O(1) memory on
+every prediction - and reports PSI and KS scores against the reference.
+
+Counts are halved whenever the window fills, so scores follow recent
+traffic rather than everything seen since the model was loaded.
+"""
+
+import os
+import bisect
+import threading
+import numpy as np
+
+# Interior quantile cut points per reference histogram (bins = edges + 1)
+REFERENCE_BINS = 10
+
+# Observations after which counts are halved
+DRIFT_WINDOW = int(os.environ.get('ML_DRIFT_WINDOW', 100000))
+
+# Observations needed before drift is reported
+MIN_SAMPLES = int(os.environ.get('ML_DRIFT_MIN_SAMPLES', 500))
+
+# PSI above this marks a feature as drifted (0.1 moderate, 0.25 major shift)
+PSI_THRESHOLD = float(os.environ.get('ML_DRIFT_PSI_THRESHOLD', 0.2))
+
+# Floor for empty bin proportions in PSI
+EPSILON = 1e-4
+
+
+def reference_histograms(X, feature_names, bins=REFERENCE_BINS):
+    """
+    Quantile-binned distribution of each feature in a training matrix:
+    {feature: {'edges': [...], 'proportions': [...]}}. Features with no
+    values are left out.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    reference = {}
+    for i, name in enumerate(feature_names):
+        column = X[:, i]
+        column = column[~np.isnan(column)]
+        if not len(column):
+            continue
+        edges = np.unique(np.quantile(column, np.linspace(0, 1, bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, column, side='right'), minlength=len(edges) + 1)
+        reference[name] = {
+            'edges': edges.tolist(),
+            'proportions': (counts / len(column)).tolist()
+        }
+    return reference
+
+
+def psi(expected, actual):
+    """Population stability index between two bin proportion vectors"""
+    expected = np.maximum(expected, EPSILON)
+    actual = np.maximum(actual, EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks(expected, actual):
+    """Kolmogorov-Smirnov statistic on the binned cumulative distributions"""
+    return float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected))))
+
+
+class DriftMonitor:
+    """Streaming per-feature bin counts compared with reference histograms"""
+
+    def __init__(self, feature_names, reference, window=DRIFT_WINDOW):
+        self.window = window
+        self.features = [
+            (i, name) for i, name in enumerate(feature_names) if name in reference
+        ]
+        self._edges = [reference[name]['edges'] for _, name in self.features]
+        self._expected = [np.array(reference[name]['proportions']) for _, name in self.features]
+        self._counts = [np.zeros(len(edges) + 1) for edges in self._edges]
+        self._total = 0.0
+        self.observed = 0
+        self._lock = threading.Lock()
+
+    def update_row(self, row):
+        """Count one model-ordered feature row"""
+        row = row.tolist()
+        bins = [bisect.bisect_right(edges, row[i]) for (i, _), edges in zip(self.features, self._edges)]
+        with self._lock:
+            for counts, b in zip(self._counts, bins):
+                counts[b] += 1
+            self._observed(1)
+
+    def update(self, X):
+        """Count the rows of a model-ordered feature matrix"""
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            return
+        bins = [
+            np.bincount(np.searchsorted(edges, X[:, i], side='right'), minlength=len(edges) + 1)
+            for (i, _), edges in zip(self.features, self._edges)
+        ]
+        with self._lock:
+            for counts, b in zip(self._counts, bins):
+                counts += b
+            self._observed(len(X))
+
+    def _observed(self, n):
+        self.observed += n
+        self._total += n
+        if self._total >= self.window:
+            for counts in self._counts:
+                counts *= 0.5
+            self._total *= 0.5
+
+    def scores(self, psi_threshold=PSI_THRESHOLD, min_samples=MIN_SAMPLES):
+        """PSI and KS per feature, and the features whose PSI exceeds the threshold"""
+        with self._lock:
+            counts = [c.copy() for c in self._counts]
+            total = self._total
+            observed = self.observed
+
+        sufficient = observed >= min_samples
+        features = {}
+        for (_, name), expected, c in zip(self.features, self._expected, counts):
+            if not total:
+                features[name] = {'psi': None, 'ks': None}
+                continue
+            actual = c / total
+            features[name] = {'psi': psi(expected, actual), 'ks': ks(expected, actual)}
+
+        drifted = sorted(
+            name for name, score in features.items()
+            if sufficient and score['psi'] is not None and score['psi'] > psi_threshold
+        )
+        return {
+            'observed': observed,
+            'sufficient_samples': sufficient,
+            'psi_threshold': psi_threshold,
+            'drifted_features': drifted,
+            'drifted': bool(drifted),
+            'features': features
+        }
@@ -0,0 +1,132 @@
+"""
+Precompiled Feature Schema
+--------------------------
+Maps a request's feature dict straight into a float64 NumPy row in model
+feature order, so single predictions skip building a pandas DataFrame.
+"""
+
+import threading
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+
+class FeatureSchema:
+    """
+    Feature layout for one model. Missing or null features take their
+    default (0 unless given) and values are coerced to float.
+    """
+
+    def __init__(self, feature_names, defaults=None):
+        self.feature_names = list(feature_names)
+        self.index = {name: i for i, name in enumerate(self.feature_names)}
+        defaults = defaults or {}
+        self.defaults = np.array([float(defaults.get(name, 0.0)) for name in self.feature_names])
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.feature_names)
+
+    def _buffer(self):
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty((1, len(self.feature_names)), dtype=np.float64)
+        return row
+
+    def _fill(self, values, features):
+        """Write one feature dict into a row of values; returns the missing features"""
+        values[:] = self.defaults
+        missing = []
+        for i, name in enumerate(self.feature_names):
+            value = features.get(name)
+            if value is None:
+                missing.append(name)
+                continue
+            try:
+                values[i] = value
+            except (TypeError, ValueError):
+                raise ValueError(f"Feature '{name}' must be numeric, got {value!r}")
+        return missing
+
+    def row(self, features):
+        """
+        (1, n_features) float64 row for a feature dict, plus the list of
+        features that were missing. The row is a per-thread buffer that is
+        overwritten by the next call on the same thread; use rows() for
+        several dicts.
+        """
+        row = self._buffer()
+        return row, self._fill(row[0], features)
+
+    def rows(self, features_list):
+        """
+        (n, n_features) float64 matrix with one freshly allocated row per
+        feature dict, plus the missing features of each dict.
+        """
+        X = np.empty((len(features_list), len(self.feature_names)), dtype=np.float64)
+        missing = [self._fill(X[i], features) for i, features in enumerate(features_list)]
+        return X, missing
+
+    def matrix(self, columns):
+        """
+        (n, n_features) float64 matrix from {name: array} columns, plus the
+        list of features that were missing. Missing columns and NaN values
+        take their defaults.
+        """
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError('All columns must have the same length')
+        n = lengths.pop() if lengths else 0
+
+        X = np.empty((n, len(self.feature_names)), dtype=np.float64)
+        missing = []
+        for i, name in enumerate(self.feature_names):
+            values = columns.get(name)
+            if values is None:
+                X[:, i] = self.defaults[i]
+                missing.append(name)
+                continue
+            try:
+                X[:, i] = values
+            except (TypeError, ValueError):
+                raise ValueError(f"Feature '{name}' must be a numeric column")
+            nan = np.isnan(X[:, i])
+            if nan.any():
+                X[nan, i] = self.defaults[i]
+        return X, missing
+
+
+def split_scaler(model):
+    """
+    (StandardScaler or None, estimator) for a model that is either a plain
+    estimator or a Pipeline of a StandardScaler followed by an estimator.
+    """
+    if isinstance(model, Pipeline) and len(model.steps) == 2 and isinstance(model.steps[0][1], StandardScaler):
+        return model.steps[0][1], model.steps[-1][1]
+    return None, model
+
+
+def scale_row(row, scaler):
+    """Apply a fitted StandardScaler to rows in place, skipping sklearn's input validation"""
+    if scaler is None:
+        return row
+    if scaler.with_mean:
+        row -= scaler.mean_
+    if scaler.with_std:
+        row /= scaler.scale_
+    return row
+
+
+def forest_predict(forest, X):
+    """
+    Predictions of a fitted single-output forest regressor, averaging leaf
+    values from each tree's low-level apply(). Matches forest.predict but
+    skips its per-tree input validation and joblib dispatch, which dominate
+    the cost for a single row.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    total = np.zeros(len(X))
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        total += tree.value[tree.apply(X), 0, 0]
+    return total / len(forest.estimators_)
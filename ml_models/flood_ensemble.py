@@ -0,0 +1,158 @@
+"""
+Monte Carlo Ensemble Flood Forecasting
+--------------------------------------
+Scores uncertain rainfall and river level forecasts by drawing samples from
+per-suburb distributions (or resampling ensemble members) and running every
+sample through FloodPredictionModel in a single predict_proba call.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+
+import geo
+
+logger = logging.getLogger('flood_ensemble')
+
+# Features that may be given as distributions or ensemble members
+UNCERTAIN_FEATURES = ['rainfall_mm_24h', 'rainfall_mm_72h', 'river_level_m']
+
+# Defaults for the weather features that are not part of a suburb profile
+WEATHER_DEFAULTS = {
+    'soil_moisture': 0.5,
+    'temperature_c': 20.0,
+    'wind_speed_kmh': 15.0
+}
+
+DEFAULT_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Exceedance thresholds matching the medium and high flood risk bands
+DEFAULT_THRESHOLDS = [0.4, 0.7]
+
+
+def draw_samples(spec, n, rng):
+    """
+    Draw n samples for one feature. spec is either a number (held fixed),
+    a list of ensemble members (resampled with replacement) or a dict with
+    'members', or 'distribution' of normal, lognormal, gamma, uniform or
+    triangular with its parameters.
+    """
+    if isinstance(spec, (int, float)):
+        return np.full(n, float(spec))
+    if isinstance(spec, (list, tuple)):
+        spec = {'members': spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid feature spec: {spec}")
+
+    if 'members' in spec:
+        members = np.asarray(spec['members'], dtype=np.float64)
+        if members.size == 0:
+            raise ValueError("Ensemble members must not be empty")
+        return members[rng.integers(0, members.size, n)]
+
+    distribution = spec.get('distribution', 'normal')
+    if distribution == 'normal':
+        return rng.normal(spec['mean'], spec['std'], n)
+    if distribution in ('lognormal', 'gamma'):
+        mean, std = float(spec['mean']), float(spec['std'])
+        if mean <= 0 or std <= 0:
+            return np.full(n, max(mean, 0.0))
+        if distribution == 'gamma':
+            shape = (mean / std) ** 2
+            return rng.gamma(shape, mean / shape, n)
+        sigma2 = np.log1p((std / mean) ** 2)
+        return rng.lognormal(np.log(mean) - sigma2 / 2, np.sqrt(sigma2), n)
+    if distribution == 'uniform':
+        return rng.uniform(spec['low'], spec['high'], n)
+    if distribution == 'triangular':
+        return rng.triangular(spec['low'], spec['mode'], spec['high'], n)
+    raise ValueError(f"Unknown distribution: {distribution}")
+
+
+class FloodEnsembleForecaster:
+    """Monte Carlo flood risk forecasts over a loaded FloodPredictionModel"""
+
+    def __init__(self, flood_model):
+        self.flood_model = flood_model
+
+    def _base_features(self, entry):
+        """Fixed (non-sampled) features for a forecast entry"""
+        features = dict(WEATHER_DEFAULTS)
+        region = entry.get('region')
+        if region in geo.SUBURB_PROFILES:
+            features.update(geo.suburb_static_features(region))
+        for name in self.flood_model.feature_names:
+            if name not in UNCERTAIN_FEATURES and isinstance(entry.get(name), (int, float)):
+                features[name] = float(entry[name])
+        return features
+
+    def sample_matrix(self, entries, n_samples, rng):
+        """
+        Feature matrix of shape (len(entries) * n_samples, n_features), with
+        the samples for each entry stored contiguously.
+        """
+        feature_names = self.flood_model.feature_names
+        X = np.empty((len(entries), n_samples, len(feature_names)), dtype=np.float64)
+
+        for i, entry in enumerate(entries):
+            base = self._base_features(entry)
+            for j, name in enumerate(feature_names):
+                if name in UNCERTAIN_FEATURES and entry.get(name) is not None:
+                    X[i, :, j] = draw_samples(entry[name], n_samples, rng)
+                else:
+                    X[i, :, j] = base.get(name, 0.0)
+
+        # Rainfall and river levels cannot be negative, and the 72h total
+        # includes the last 24h
+        uncertain = [feature_names.index(name) for name in UNCERTAIN_FEATURES if name in feature_names]
+        X[:, :, uncertain] = np.maximum(X[:, :, uncertain], 0)
+        if 'rainfall_mm_24h' in feature_names and 'rainfall_mm_72h' in feature_names:
+            r24 = feature_names.index('rainfall_mm_24h')
+            r72 = feature_names.index('rainfall_mm_72h')
+            X[:, :, r72] = np.maximum(X[:, :, r72], X[:, :, r24])
+
+        return X.reshape(-1, len(feature_names))
+
+    def forecast(self, entries, n_samples=1000, quantiles=None, thresholds=None, seed=None):
+        """
+        Monte Carlo forecast for a list of entries (one per suburb, or per
+        suburb and forecast hour). Returns one summary per entry with flood
+        probability quantiles, exceedance probabilities and risk level
+        probabilities.
+        """
+        if not entries:
+            return []
+        if not self.flood_model.model:
+            self.flood_model.load_model()
+
+        quantiles = DEFAULT_QUANTILES if quantiles is None else quantiles
+        thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+        rng = np.random.default_rng(seed)
+
+        # Score every sample of every entry in one vectorized pass
+        X = self.sample_matrix(entries, n_samples, rng)
+        X = pd.DataFrame(X, columns=self.flood_model.feature_names)
+        probabilities = self.flood_model.model.predict_proba(X)[:, 1].reshape(len(entries), n_samples)
+
+        quantile_values = np.quantile(probabilities, quantiles, axis=1)
+        exceedance = np.stack([(probabilities > t).mean(axis=1) for t in thresholds])
+        mean = probabilities.mean(axis=1)
+        high = (probabilities > 0.7).mean(axis=1)
+        medium = ((probabilities > 0.4) & (probabilities <= 0.7)).mean(axis=1)
+
+        results = []
+        for i, entry in enumerate(entries):
+            results.append({
+                'region': entry.get('region'),
+                'hour': entry.get('hour'),
+                'n_samples': n_samples,
+                'mean_flood_probability': float(mean[i]),
+                'quantiles': {str(q): float(quantile_values[k, i]) for k, q in enumerate(quantiles)},
+                'exceedance_probability': {str(t): float(exceedance[k, i]) for k, t in enumerate(thresholds)},
+                'risk_probabilities': {
+                    'high': float(high[i]),
+                    'medium': float(medium[i]),
+                    'low': float(1 - high[i] - medium[i])
+                }
+            })
+        return results
@@ -0,0 +1,262 @@
+"""
+Precomputed Flood Risk Forecast Grid
+------------------------------------
+Scores every suburb x forecast hour for the next 48 hours whenever new
+weather inputs arrive, keeps the result in an in-memory grid for constant
+time lookups and persists it to ml_data.flood_forecast_grid.
+"""
+
+import math
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+import geo
+from flood_ensemble import WEATHER_DEFAULTS
+
+logger = logging.getLogger('flood_forecast')
+
+FORECAST_HOURS = 48
+
+RISK_LEVELS = np.array(['low', 'medium', 'high'], dtype=object)
+
+
+def _hour_floor(value):
+    """Truncate a datetime to the hour, converting aware datetimes to local time"""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class FloodForecastGrid:
+    """Immutable region x hour grid of flood probabilities"""
+
+    def __init__(self, regions, base_time, probabilities, issued_at=None):
+        self.regions = list(regions)
+        self.region_index = {region: i for i, region in enumerate(self.regions)}
+        self.base_time = _hour_floor(base_time)
+        self.probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.risk_codes = (self.probabilities > 0.4).astype(np.int8) + (self.probabilities > 0.7)
+        self.issued_at = issued_at or datetime.now()
+        self.times = [self.base_time + timedelta(hours=h) for h in range(self.probabilities.shape[1])]
+
+    @property
+    def hours(self):
+        return self.probabilities.shape[1]
+
+    def _hour_range(self, start, end):
+        """Clamp a [start, end] time window to grid hour offsets"""
+        first = 0 if start is None else int((_hour_floor(start) - self.base_time).total_seconds() // 3600)
+        last = self.hours - 1 if end is None else int((_hour_floor(end) - self.base_time).total_seconds() // 3600)
+        return max(first, 0), min(last, self.hours - 1)
+
+    def query(self, region=None, start=None, end=None):
+        """
+        Forecast cells for one region (or all) between start and end,
+        inclusive. Returns a list of dicts ordered by region then time.
+        """
+        if region is not None and region not in self.region_index:
+            raise KeyError(region)
+        rows = [self.region_index[region]] if region is not None else range(len(self.regions))
+        first, last = self._hour_range(start, end)
+
+        cells = []
+        for row in rows:
+            probabilities = self.probabilities[row, first:last + 1].tolist()
+            risks = RISK_LEVELS[self.risk_codes[row, first:last + 1]]
+            for offset, (probability, risk) in enumerate(zip(probabilities, risks)):
+                cells.append({
+                    'region': self.regions[row],
+                    'time': self.times[first + offset].isoformat(),
+                    'flood_probability': probability,
+                    'flood_risk': risk
+                })
+        return cells
+
+
+class FloodForecastService:
+    """
+    Precomputes the forecast grid from weather inputs on a background
+    thread and serves lookups from the latest grid.
+    """
+
+    def __init__(self, flood_model, hours=FORECAST_HOURS):
+        self.flood_model = flood_model
+        self.hours = hours
+        self.grid = None
+        self._pending = None
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def validate_inputs(self, inputs):
+        """
+        Check inputs before they are queued: a map of region -> list of
+        hourly feature dicts (or nulls) with finite numeric model features.
+        Returns the inputs with those values as floats; raises ValueError.
+        """
+        if not isinstance(inputs, dict):
+            raise ValueError("regions must map each region to a list of hourly inputs")
+        feature_names = set(self.flood_model.feature_names)
+        validated = {}
+        for region, hourly in inputs.items():
+            if not isinstance(hourly, list):
+                raise ValueError(f"Region {region}: hourly inputs must be a list, got {type(hourly).__name__}")
+            hours = []
+            for h, values in enumerate(hourly):
+                if values is None:
+                    hours.append(None)
+                    continue
+                if not isinstance(values, dict):
+                    raise ValueError(f"Region {region} hour {h}: inputs must be an object")
+                features = {}
+                for name, value in values.items():
+                    if name not in feature_names:
+                        continue
+                    try:
+                        features[name] = float(value)
+                    except (TypeError, ValueError):
+                        raise ValueError(f"Region {region} hour {h}: {name} must be numeric, got {value!r}")
+                    if not math.isfinite(features[name]):
+                        raise ValueError(f"Region {region} hour {h}: {name} must be finite, got {value!r}")
+                hours.append(features)
+            validated[region] = hours
+        return validated
+
+    def build_matrix(self, inputs, regions):
+        """
+        Feature matrix of shape (len(regions) * hours, n_features) from
+        per-region hourly weather inputs. Hours without inputs carry the
+        last known values forward.
+        """
+        feature_names = self.flood_model.feature_names
+        X = np.empty((len(regions), self.hours, len(feature_names)), dtype=np.float64)
+
+        for i, region in enumerate(regions):
+            base = dict(WEATHER_DEFAULTS)
+            if region in geo.SUBURB_PROFILES:
+                base.update(geo.suburb_static_features(region))
+            hourly = inputs.get(region, [])
+            current = dict(base)
+            for h in range(self.hours):
+                if h < len(hourly) and hourly[h]:
+                    current.update({k: v for k, v in hourly[h].items() if k in feature_names})
+                X[i, h, :] = [float(current.get(name, 0.0)) for name in feature_names]
+
+        return X.reshape(-1, len(feature_names))
+
+    def precompute(self, inputs, base_time=None):
+        """
+        Score every region x forecast hour in one model call, swap in the new
+        grid and persist it. inputs maps region -> list of hourly feature
+        dicts starting at base_time (default: the current hour).
+        """
+        if not self.flood_model.model:
+            self.flood_model.load_model()
+
+        base_time = _hour_floor(base_time or datetime.now())
+        regions = sorted(set(geo.SUBURB_CENTROIDS) | set(inputs))
+        X = pd.DataFrame(self.build_matrix(inputs, regions), columns=self.flood_model.feature_names)
+
+        started = datetime.now()
+        probabilities = self.flood_model.model.predict_proba(X)[:, 1].reshape(len(regions), self.hours)
+        grid = FloodForecastGrid(regions, base_time, probabilities)
+
+        # Swapping the reference publishes the grid atomically to readers
+        self.grid = grid
+        logger.info(f"Precomputed flood forecast grid for {len(regions)} regions x {self.hours} hours "
+                    f"in {(datetime.now() - started).total_seconds() * 1000:.1f} ms")
+
+        if self.flood_model.conn and not self.flood_model.conn.closed:
+            self._save_grid(grid)
+        return grid
+
+    def _save_grid(self, grid):
+        """Persist a forecast grid to the database"""
+        conn = self.flood_model.conn
+        try:
+            rows = [
+                (region, grid.times[h], grid.issued_at, float(grid.probabilities[r, h]),
+                 RISK_LEVELS[grid.risk_codes[r, h]])
+                for r, region in enumerate(grid.regions)
+                for h in range(grid.hours)
+            ]
+            cursor = conn.cursor()
+            execute_values(
+                cursor,
+                """
+                INSERT INTO ml_data.flood_forecast_grid
+                (region, forecast_time, issued_at, flood_probability, flood_risk)
+                VALUES %s
+                """,
+                rows
+            )
+            conn.commit()
+            logger.info(f"Saved {len(rows)} flood forecast cells to database")
+        except Exception as e:
+            logger.error(f"Error saving flood forecast grid: {e}")
+            conn.rollback()
+
+    def load_latest(self):
+        """Restore the most recently issued grid from the database"""
+        conn = self.flood_model.conn
+        if not conn or conn.closed:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT region, forecast_time, issued_at, flood_probability
+                FROM ml_data.flood_forecast_grid
+                WHERE issued_at = (SELECT MAX(issued_at) FROM ml_data.flood_forecast_grid)
+                ORDER BY region, forecast_time
+                """
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            if not rows:
+                return None
+
+            regions = sorted({row[0] for row in rows})
+            base_time = min(row[1] for row in rows)
+            hours = max(int((row[1] - base_time).total_seconds() // 3600) for row in rows) + 1
+            probabilities = np.zeros((len(regions), hours))
+            region_index = {region: i for i, region in enumerate(regions)}
+            for region, forecast_time, _, probability in rows:
+                hour = int((forecast_time - base_time).total_seconds() // 3600)
+                probabilities[region_index[region], hour] = float(probability)
+
+            self.grid = FloodForecastGrid(regions, base_time, probabilities, issued_at=rows[0][2])
+            logger.info(f"Loaded flood forecast grid issued at {self.grid.issued_at}")
+            return self.grid
+        except Exception as e:
+            logger.error(f"Error loading flood forecast grid: {e}")
+            conn.rollback()
+            return None
+
+    def submit(self, inputs, base_time=None):
+        """
+        Queue new weather inputs for precomputation. If inputs arrive while a
+        grid is being computed only the latest set is processed next.
+        """
+        with self._condition:
+            self._pending = (inputs, base_time)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='flood-forecast-precompute', daemon=True)
+                self._worker.start()
+            self._condition.notify()
+
+    def _run(self):
+        """Background loop precomputing grids for submitted inputs"""
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                inputs, base_time = self._pending
+                self._pending = None
+            try:
+                self.precompute(inputs, base_time)
+            except Exception as e:
+                logger.error(f"Error precomputing flood forecast grid: {e}")
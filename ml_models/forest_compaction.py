@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Route Forest Compaction
+-----------------------
+Post-training compaction of the route RandomForest, trading a little
+accuracy for a smaller artifact and faster scoring:
+
+1. Prune: inside each tree, subtrees whose splits together remove less
+   than a fraction min_gain of the tree's training variance are collapsed
+   into a leaf predicting their mean.
+2. Select: trees are added greedily, each time the one that most reduces
+   squared error of the averaged prediction on held-out data, and the
+   smallest prefix within a tolerance of the full forest's R² is kept.
+3. Pack: the kept trees are stored as flat node arrays in compact dtypes
+   (int16 feature indices, float32 thresholds and leaf values, int32
+   child links) and scored by descending all trees in lockstep.
+
+Greedy selection overfits the rows it is run on, so the prefix length is
+chosen by cross-fitting: the held-out split of the training data is
+halved, each half orders the trees and the other half scores every prefix
+of that order. The averaged scores pick the length for each tolerance and
+are the R² reported; the saved trees are then ordered on all held-out
+rows. The result is written as a variant of the model artifact in the
+same format, and a report gives size, latency and R² for every operating
+point tried:
+
+    python forest_compaction.py --tolerances 0,0.005,0.01,0.02 --min-gain 0.001
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import logging
+import argparse
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+# Add the current directory to the path so we can import the ML models
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from feature_schema import forest_predict
+from forest_quantiles import TREE_LEAF, float32_thresholds
+
+logger = logging.getLogger('forest_compaction')
+
+# Rows scored per lockstep pass, bounding the (rows x trees) index matrix
+CHUNK_ROWS = 4096
+
+DEFAULT_MIN_GAIN = 0.001
+DEFAULT_TOLERANCES = (0.0, 0.005, 0.01, 0.02)
+
+# Single-row calls and 1000-row batches timed per operating point
+LATENCY_REPEAT = 200
+
+
+def _prune(tree, min_gain):
+    """
+    Nodes of one sklearn tree with low-gain subtrees collapsed: a list of
+    (feature, threshold, left, right, value) in depth-first order, children
+    as indices into the list (TREE_LEAF for leaves)
+    """
+    t = tree.tree_
+    left, right = t.children_left, t.children_right
+    weighted = t.weighted_n_node_samples * t.impurity
+    gain = np.zeros(t.node_count)
+    internal = left != TREE_LEAF
+    gain[internal] = weighted[internal] - weighted[left[internal]] - weighted[right[internal]]
+
+    # Children always follow their parent, so a reverse sweep sums each subtree
+    subtree_gain = gain.copy()
+    for node in range(t.node_count - 1, -1, -1):
+        if internal[node]:
+            subtree_gain[node] += subtree_gain[left[node]] + subtree_gain[right[node]]
+    cutoff = min_gain * max(weighted[0], 1e-12)
+
+    nodes = []
+
+    def add(node):
+        index = len(nodes)
+        nodes.append(None)
+        if not internal[node] or subtree_gain[node] < cutoff:
+            nodes[index] = (0, 0.0, TREE_LEAF, TREE_LEAF, t.value[node, 0, 0])
+            return index
+        left_index = add(left[node])
+        right_index = add(right[node])
+        nodes[index] = (t.feature[node], t.threshold[node], left_index, right_index, t.value[node, 0, 0])
+        return index
+
+    add(0)
+    return nodes
+
+
+def _depth(nodes):
+    depth, stack = 0, [(0, 0)]
+    while stack:
+        node, d = stack.pop()
+        depth = max(depth, d)
+        if nodes[node][2] != TREE_LEAF:
+            stack.append((nodes[node][2], d + 1))
+            stack.append((nodes[node][3], d + 1))
+    return depth
+
+
+class CompactForest:
+    """Averaged regression trees as flat compact-dtype node arrays"""
+
+    def __init__(self, trees, n_features):
+        self.n_features = n_features
+        self.n_trees = len(trees)
+        self.roots = np.cumsum([0] + [len(nodes) for nodes in trees[:-1]]).astype(np.int32)
+        self.depth = max(_depth(nodes) for nodes in trees)
+
+        features, thresholds, children, values = [], [], [], []
+        for nodes, root in zip(trees, self.roots):
+            for i, (feature, threshold, left, right, value) in enumerate(nodes):
+                features.append(feature)
+                thresholds.append(threshold)
+                # Leaves loop back to themselves so every row can take depth steps
+                children.extend((i + root, i + root) if left == TREE_LEAF else (left + root, right + root))
+                values.append(value)
+
+        self.features = np.array(features, dtype=np.int16)
+        self.thresholds = float32_thresholds(np.array(thresholds, dtype=np.float64))
+        self.children = np.array(children, dtype=np.int32)
+        self.values = np.array(values, dtype=np.float32)
+
+    @property
+    def n_nodes(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.roots, self.features, self.thresholds, self.children, self.values))
+
+    def tree_predictions(self, X):
+        """(n, n_trees) per-tree outputs for already scaled rows"""
+        # Thresholds are compared against float32 inputs, as in sklearn
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.empty((len(X), self.n_trees))
+        for start in range(0, len(X), CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            flat = chunk.ravel()
+            offsets = (np.arange(len(chunk)) * self.n_features)[:, None]
+            nodes = np.broadcast_to(self.roots.astype(np.intp), (len(chunk), self.n_trees)).copy()
+            for _ in range(self.depth):
+                go_right = flat.take(offsets + self.features.take(nodes)) > self.thresholds.take(nodes)
+                nodes = self.children.take(nodes * 2 + go_right)
+            out[start:start + CHUNK_ROWS] = self.values.take(nodes)
+        return out
+
+    def predict(self, X):
+        return self.tree_predictions(X).mean(axis=1)
+
+    def predict_quantiles(self, X, quantiles):
+        """Mean over trees and (n, len(quantiles)) quantiles, as PackedForest"""
+        outputs = self.tree_predictions(X)
+        return outputs.mean(axis=1), np.quantile(outputs, quantiles, axis=1).T
+
+
+def _r2(y, prediction):
+    y = np.asarray(y, dtype=np.float64)
+    total = ((y - y.mean()) ** 2).sum()
+    return float(1.0 - ((y - prediction) ** 2).sum() / total) if total > 0 else 0.0
+
+
+def greedy_order(tree_outputs, y):
+    """
+    Tree indices in greedy forward-selection order, and the R² of the
+    average of each prefix of that order
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n_trees = tree_outputs.shape[1]
+    remaining = list(range(n_trees))
+    order, scores = [], []
+    total = np.zeros(len(y))
+    for k in range(1, n_trees + 1):
+        candidates = tree_outputs[:, remaining]
+        errors = ((y[:, None] - (total[:, None] + candidates) / k) ** 2).sum(axis=0)
+        best = remaining.pop(int(np.argmin(errors)))
+        order.append(best)
+        total += tree_outputs[:, best]
+        scores.append(_r2(y, total / k))
+    return order, scores
+
+
+def _latency_ms(predict, X_row, X_batch, repeat=LATENCY_REPEAT):
+    """Median single-row and 1000-row batch latency of a predict function"""
+    def median(fn, n):
+        timings = []
+        for _ in range(n):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return float(np.median(timings) * 1000)
+
+    predict(X_row)  # Warm up
+    return median(lambda: predict(X_row), repeat), median(lambda: predict(X_batch), max(3, repeat // 20))
+
+
+def compact(model, tolerances=DEFAULT_TOLERANCES, min_gain=DEFAULT_MIN_GAIN, n_trees=None, seed=42):
+    """
+    Compact a loaded RouteOptimizationModel's forest. Returns the
+    CompactForest for the first tolerance (or for exactly n_trees trees)
+    and a report covering every operating point.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    if not isinstance(model.model, RandomForestRegressor):
+        raise ValueError(f"Compaction needs a RandomForestRegressor, not {type(model.model).__name__}")
+    forest = model.model
+
+    # Held-out rows, split the way training split them, then halved
+    X, y = model.load_training_data()
+    X = X.reindex(columns=model.feature_names).fillna(0)
+    _, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_a, X_b, y_a, y_b = train_test_split(X_test, y_test, test_size=0.5, random_state=seed)
+    X_a, X_b = model.scaler.transform(X_a), model.scaler.transform(X_b)
+    y_a, y_b = np.asarray(y_a, dtype=np.float64), np.asarray(y_b, dtype=np.float64)
+
+    started = time.perf_counter()
+    pruned = [_prune(estimator, min_gain) for estimator in forest.estimators_]
+    pruned_forest = CompactForest(pruned, len(model.feature_names))
+    outputs_a, outputs_b = pruned_forest.tree_predictions(X_a), pruned_forest.tree_predictions(X_b)
+
+    # Each half orders the trees, the other half scores every prefix of that order
+    order_a, _ = greedy_order(outputs_a, y_a)
+    order_b, _ = greedy_order(outputs_b, y_b)
+    scores = [
+        (_r2(y_b, outputs_b[:, order_a[:k]].mean(axis=1)) + _r2(y_a, outputs_a[:, order_b[:k]].mean(axis=1))) / 2
+        for k in range(1, len(pruned) + 1)
+    ]
+    order, _ = greedy_order(np.vstack([outputs_a, outputs_b]), np.concatenate([y_a, y_b]))
+    logger.info(f"Pruned and ordered {len(pruned)} trees in {time.perf_counter() - started:.1f}s")
+
+    X_eval = np.vstack([X_a, X_b])
+    X_row, X_batch = X_eval[:1], np.resize(X_eval, (1000, X_eval.shape[1]))
+    original_r2 = (_r2(y_a, forest_predict(forest, X_a)) + _r2(y_b, forest_predict(forest, X_b))) / 2
+    original_row_ms, original_batch_ms = _latency_ms(lambda X: forest_predict(forest, X), X_row, X_batch)
+    original_bytes = len(pickle.dumps(forest))
+
+    if n_trees is not None:
+        targets = [(None, min(max(n_trees, 1), len(order)))]
+    else:
+        # Pruning can cost more than a tolerance allows; then every tree is kept
+        targets = [
+            (tolerance, next(
+                (k for k, score in enumerate(scores, 1) if score >= original_r2 - tolerance), len(order)
+            ))
+            for tolerance in tolerances
+        ]
+
+    points, chosen = [], None
+    for tolerance, k in targets:
+        candidate = CompactForest([pruned[i] for i in order[:k]], len(model.feature_names))
+        r2 = scores[k - 1]
+        row_ms, batch_ms = _latency_ms(candidate.predict, X_row, X_batch)
+        size = len(pickle.dumps(candidate))
+        points.append({
+            'tolerance': tolerance,
+            'trees': k,
+            'nodes': candidate.n_nodes,
+            'depth': candidate.depth,
+            'bytes': size,
+            'array_bytes': candidate.nbytes,
+            'size_ratio': size / original_bytes,
+            'r2': r2,
+            'r2_delta': r2 - original_r2,
+            'row_ms': row_ms,
+            'row_speedup': original_row_ms / row_ms,
+            'batch_1000_ms': batch_ms,
+            'batch_speedup': original_batch_ms / batch_ms
+        })
+        chosen = chosen or candidate
+
+    report = {
+        'model_version': model.model_version,
+        'min_gain': min_gain,
+        'held_out_rows': len(y_a) + len(y_b),
+        'original': {
+            'trees': len(forest.estimators_),
+            'nodes': int(sum(estimator.tree_.node_count for estimator in forest.estimators_)),
+            'depth': int(max(estimator.tree_.max_depth for estimator in forest.estimators_)),
+            'bytes': original_bytes,
+            'r2': original_r2,
+            'row_ms': original_row_ms,
+            'batch_1000_ms': original_batch_ms
+        },
+        'operating_points': points
+    }
+    return chosen, report
+
+
+def main():
+    """Compact the current route model and write the variant artifact and report"""
+    parser = argparse.ArgumentParser(description='Prune and compact the route RandomForest')
+    parser.add_argument('--model', type=str, help='Route model artifact (default: the model path)')
+    parser.add_argument('--output', type=str, help='Compacted artifact (default: <model>.compact.joblib)')
+    parser.add_argument('--report', type=str, help='Write the JSON report to this file')
+    parser.add_argument('--tolerances', type=str,
+                        help='Comma-separated R² tolerances to report; the first is saved')
+    parser.add_argument('--trees', type=int, help='Keep exactly this many trees instead')
+    parser.add_argument('--min-gain', type=float, default=DEFAULT_MIN_GAIN,
+                        help="Collapse subtrees removing less than this fraction of a tree's variance")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Run as a script this module is __main__; compact through the importable
+    # module so the saved artifact references forest_compaction.CompactForest
+    import forest_compaction
+    from route_optimization import RouteOptimizationModel
+    model = RouteOptimizationModel()
+    model.load_model(args.model)
+    source = args.model or model.model_path
+
+    tolerances = [float(t) for t in args.tolerances.split(',')] if args.tolerances else DEFAULT_TOLERANCES
+    compacted, report = forest_compaction.compact(model, tolerances, args.min_gain, args.trees)
+
+    # Same artifact format; the version marks the variant
+    model.model = compacted
+    model.model_version = f"{model.model_version}-compact{compacted.n_trees}"
+    output = args.output or f"{os.path.splitext(source)[0]}.compact.joblib"
+    model.save_model(output)
+    report['artifact'] = output
+    report['artifact_version'] = model.model_version
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    original = report['original']
+    print(f"original: {original['trees']} trees, {original['bytes']:,} bytes, R² {original['r2']:.4f}, "
+          f"row {original['row_ms']:.3f} ms, batch 1000 {original['batch_1000_ms']:.2f} ms")
+    for point in report['operating_points']:
+        print(f"tolerance {point['tolerance']}: {point['trees']} trees, {point['bytes']:,} bytes "
+              f"({point['size_ratio']:.1%}), R² {point['r2']:.4f} ({point['r2_delta']:+.4f}), "
+              f"row {point['row_ms']:.3f} ms (x{point['row_speedup']:.1f}), "
+              f"batch 1000 {point['batch_1000_ms']:.2f} ms (x{point['batch_speedup']:.1f})")
+
+
+if __name__ == '__main__':
+    main()
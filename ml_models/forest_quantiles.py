@@ -0,0 +1,109 @@
+"""
+Forest Prediction Quantiles
+---------------------------
+Prediction intervals for the route RandomForest from the spread of its
+individual trees, with no extra training. The trees' node arrays are
+packed once per model version into flat arrays, with leaves pointing at
+themselves, so every sample descends every tree in lockstep: one gather
+per level of depth for the whole (samples x trees) index matrix. Quantiles
+are then taken across each sample's tree outputs.
+
+For large batches sklearn's per-tree apply() is faster than the lockstep
+walk, so those are scored tree by tree instead.
+"""
+
+import numpy as np
+
+TREE_LEAF = -1
+
+# Batches larger than this are scored with per-tree apply()
+PACKED_MAX_ROWS = 256
+
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def parse_quantiles(value):
+    """Sorted quantiles from a comma-separated string or list, each in [0, 1]"""
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+    try:
+        quantiles = sorted({float(q) for q in value})
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantiles: {value!r}")
+    if not quantiles or any(q < 0 or q > 1 for q in quantiles):
+        raise ValueError(f"Quantiles must be between 0 and 1: {value!r}")
+    return quantiles
+
+
+def quantile_label(q):
+    """Response key for a quantile, e.g. 0.9 -> 'p90', 0.975 -> 'p97.5'"""
+    return f"p{round(q * 100, 3):g}"
+
+
+def float32_thresholds(thresholds):
+    """
+    Thresholds as float32 that split float32 inputs exactly as the float64
+    originals do: rounded down, never up, so x <= t keeps its answer
+    """
+    rounded = np.asarray(thresholds, dtype=np.float32)
+    up = rounded.astype(np.float64) > thresholds
+    rounded[up] = np.nextafter(rounded[up], np.float32(-np.inf))
+    return rounded
+
+
+class PackedForest:
+    """All trees of a fitted forest regressor as flat node arrays"""
+
+    def __init__(self, forest, version=None):
+        self.forest = forest
+        self.version = version
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        self.roots = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        self.depth = max(tree.max_depth for tree in trees)
+
+        features, thresholds, children, values = [], [], [], []
+        for tree, root in zip(trees, self.roots):
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == TREE_LEAF
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # Interleaved (left, right) children; leaves loop back to themselves
+            children.append(np.stack([
+                np.where(leaf, nodes, tree.children_left),
+                np.where(leaf, nodes, tree.children_right)
+            ], axis=1).ravel() + root)
+            values.append(tree.value[:, 0, 0])
+
+        self.features = np.concatenate(features).astype(np.intp)
+        self.thresholds = float32_thresholds(np.concatenate(thresholds))
+        self.children = np.concatenate(children).astype(np.intp)
+        self.values = np.concatenate(values)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def tree_predictions(self, X):
+        """(n, n_trees) per-tree outputs for already scaled rows"""
+        # Trees compare float32 inputs against their thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        if n > PACKED_MAX_ROWS:
+            out = np.empty((n, self.n_trees))
+            for j, estimator in enumerate(self.forest.estimators_):
+                tree = estimator.tree_
+                out[:, j] = tree.value[tree.apply(X), 0, 0]
+            return out
+
+        flat = X.ravel()
+        offsets = (np.arange(n) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        for _ in range(self.depth):
+            go_right = flat.take(offsets + self.features.take(nodes)) > self.thresholds.take(nodes)
+            nodes = self.children.take(nodes * 2 + go_right)
+        return self.values.take(nodes)
+
+    def predict_quantiles(self, X, quantiles=DEFAULT_QUANTILES):
+        """Mean over trees (the forest prediction) and (n, len(quantiles)) quantiles"""
+        outputs = self.tree_predictions(X)
+        return outputs.mean(axis=1), np.quantile(outputs, quantiles, axis=1).T
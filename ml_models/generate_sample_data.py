@@ -15,6 +15,8 @@ from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Add the current directory to the path so we can import the ML models
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -22,6 +24,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Import the ML models
 from flood_prediction import FloodPredictionModel
 from route_optimization import RouteOptimizationModel
+from scenario_engine import ScenarioEngine
+import resources
 
 # Configure logging
 logging.basicConfig(
@@ -51,6 +55,24 @@ TIME_PERIODS = [
     'Early Morning (5-7 AM)'
 ]
 
+# Risk mix used for flood samples, in (high, medium, low) order
+FLOOD_RISK_WEIGHTS = [0.2, 0.3, 0.5]
+
+# Uniform feature ranges per flood risk level, in (high, medium, low) order
+FLOOD_FEATURE_RANGES = {
+    'rainfall_mm_24h': [(50, 100), (20, 50), (0, 20)],
+    'rainfall_mm_72h': [(120, 200), (50, 120), (0, 50)],
+    'river_level_m': [(2.8, 4.0), (1.8, 2.8), (0.5, 1.8)],
+    'soil_moisture': [(0.75, 0.95), (0.5, 0.75), (0.2, 0.5)],
+    'elevation_m': [(2, 15), (15, 30), (30, 60)],
+    'distance_to_river_km': [(0.1, 1.0), (1.0, 2.5), (2.5, 5.0)],
+    'impervious_surface_pct': [(70, 90), (40, 70), (10, 40)],
+    'drainage_capacity': [(0.2, 0.4), (0.4, 0.7), (0.7, 1.0)]
+}
+
+# Hour ranges (inclusive) matching TIME_PERIODS
+TIME_PERIOD_HOURS = [(7, 9), (11, 13), (16, 18), (19, 21), (22, 23), (5, 7)]
+
 def generate_flood_prediction_samples(count=10, output_file=None):
     """Generate sample data from the flood prediction model"""
     logger.info(f"Generating {count} flood prediction samples")
@@ -250,81 +272,51 @@ def generate_route_optimization_samples(count=10, output_file=None):
         logger.error(f"Error generating route optimization samples: {e}")
         return []
 
-def generate_combined_scenarios(count=5, output_file=None):
-    """Generate combined scenarios with both flood and route predictions"""
+def generate_combined_scenarios(count=5, output_file=None, engine=None, seed=None, routes_per_scenario=3):
+    """
+    Generate combined scenarios with both flood and route predictions.
+    Pass a ScenarioEngine to reuse already-loaded models.
+    """
     logger.info(f"Generating {count} combined scenarios")
     
     try:
-        scenarios = []
-        
-        # Generate more individual samples than we need for scenarios
-        flood_samples = generate_flood_prediction_samples(count * 2)
-        route_samples = generate_route_optimization_samples(count * 4)
+        if engine is None:
+            engine = ScenarioEngine.from_artifacts(use_db=False)
+        rng = np.random.default_rng(seed)
         
-        # Group by region
-        flood_by_region = {}
-        for sample in flood_samples:
-            region = sample['input']['region']
-            if region not in flood_by_region:
-                flood_by_region[region] = []
-            flood_by_region[region].append(sample)
+        # One flood sample per scenario, cycling through the regions
+        flood_frame = _flood_feature_block(rng, count)
+        regions = [WESTERN_SYDNEY_REGIONS[i % len(WESTERN_SYDNEY_REGIONS)] for i in range(count)]
+        flood_frame['region'] = regions
         
-        route_by_region = {}
-        for sample in route_samples:
-            region = sample['input']['region']
-            if region not in route_by_region:
-                route_by_region[region] = []
-            route_by_region[region].append(sample)
+        # Several routes per scenario, aligned by scenario index
+        route_frame = _route_feature_block(rng, count * routes_per_scenario)
+        route_scenario = np.repeat(np.arange(count), routes_per_scenario)
         
-        # Create combined scenarios for regions that have both types of data
-        common_regions = set(flood_by_region.keys()) & set(route_by_region.keys())
+        result = engine.evaluate(flood_frame, route_frame, route_scenario)
         
-        # If not enough common regions, use any regions
-        if len(common_regions) < count:
-            all_regions = list(set(flood_by_region.keys()) | set(route_by_region.keys()))
-            common_regions = all_regions[:count]
+        flood_records = flood_frame.to_dict('records')
+        route_records = route_frame.to_dict('records')
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        scenarios = []
         
-        for i, region in enumerate(list(common_regions)[:count]):
-            # Get flood data for this region
-            region_flood = flood_by_region.get(region, [])[0] if region in flood_by_region else flood_samples[i % len(flood_samples)]
-            
-            # Get route data for this region (multiple routes)
-            region_routes = route_by_region.get(region, [])[:3] if region in route_by_region else route_samples[i*3:(i+1)*3]
-            
-            # Create the scenario
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Calculate impact on routes
-            flood_probability = region_flood['prediction']['flood_probability']
-            flood_logistics_impact = region_flood['prediction']['logistics_impact']
-            
-            # Adjust route times based on flood impact
-            for route in region_routes:
-                original_time = route['prediction']['travel_time_minutes']
-                flood_delay = 0
-                
-                if flood_probability > 0.7:  # High flood risk
-                    flood_delay = original_time * 0.5  # 50% longer
-                elif flood_probability > 0.4:  # Medium flood risk
-                    flood_delay = original_time * 0.25  # 25% longer
-                elif flood_probability > 0.2:  # Low flood risk
-                    flood_delay = original_time * 0.1  # 10% longer
-                
-                route['prediction']['flood_adjusted_time'] = original_time + flood_delay
-                route['prediction']['flood_delay_minutes'] = flood_delay
+        for i, region in enumerate(regions):
+            flood_input = flood_records[i]
+            flood_probability = float(result.flood_probability[i])
+            flood_logistics_impact = engine.flood_model._calculate_logistics_impact(flood_input, flood_probability)
             
             scenario = {
                 'region': region,
                 'timestamp': timestamp,
                 'weather_conditions': {
-                    'rainfall_24h': region_flood['input']['rainfall_mm_24h'],
-                    'rainfall_72h': region_flood['input']['rainfall_mm_72h'],
-                    'temperature': region_flood['input']['temperature_c'],
-                    'wind_speed': region_flood['input']['wind_speed_kmh']
+                    'rainfall_24h': flood_input['rainfall_mm_24h'],
+                    'rainfall_72h': flood_input['rainfall_mm_72h'],
+                    'temperature': flood_input['temperature_c'],
+                    'wind_speed': flood_input['wind_speed_kmh']
                 },
                 'flood_prediction': {
-                    'probability': region_flood['prediction']['flood_probability'],
-                    'risk_level': region_flood['prediction']['flood_risk'],
+                    'probability': flood_probability,
+                    'risk_level': str(result.flood_risk[i]),
                     'affected_areas': flood_logistics_impact.get('affected_areas', []),
                     'route_delays_minutes': flood_logistics_impact.get('route_delays_minutes', 0),
                     'affected_routes_percent': flood_logistics_impact.get('affected_routes_percent', 0),
@@ -334,15 +326,15 @@ def generate_combined_scenarios(count=5, output_file=None):
                 'route_predictions': [
                     {
                         'from': f"{region} Distribution Center",
-                        'to': f"{route['input']['region']} Delivery Hub",
-                        'distance_km': route['input']['distance_km'],
-                        'time_period': route['input']['time_period'],
-                        'traffic_index': route['input']['traffic_index'],
-                        'construction_zones': route['input']['construction_zones'],
-                        'normal_travel_time_minutes': route['prediction']['travel_time_minutes'],
-                        'flood_adjusted_time_minutes': route['prediction']['flood_adjusted_time'],
-                        'delay_minutes': route['prediction']['flood_delay_minutes']
-                    } for route in region_routes
+                        'to': f"{route_records[r]['region']} Delivery Hub",
+                        'distance_km': route_records[r]['distance_km'],
+                        'time_period': route_records[r]['time_period'],
+                        'traffic_index': route_records[r]['traffic_index'],
+                        'construction_zones': route_records[r]['construction_zones'],
+                        'normal_travel_time_minutes': float(result.travel_time[r]),
+                        'flood_adjusted_time_minutes': float(result.flood_adjusted_time[r]),
+                        'delay_minutes': float(result.delay_minutes[r])
+                    } for r in result.routes_for(i)
                 ],
                 'recommendations': [
                     f"Reschedule deliveries to avoid {flood_logistics_impact.get('affected_areas', [])[0]} area" if flood_logistics_impact.get('affected_areas', []) else "Normal delivery schedule recommended",
@@ -356,7 +348,7 @@ def generate_combined_scenarios(count=5, output_file=None):
         # Write to file if specified
         if output_file:
             with open(output_file, 'w') as f:
-                json.dump(scenarios, f, indent=2)
+                json.dump(scenarios, f, indent=2, default=_json_default)
             logger.info(f"Wrote {len(scenarios)} combined scenarios to {output_file}")
         
         return scenarios
@@ -365,6 +357,187 @@ def generate_combined_scenarios(count=5, output_file=None):
         logger.error(f"Error generating combined scenarios: {e}")
         return []
 
+def _json_default(value):
+    """JSON encoder fallback for NumPy scalars"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _flood_feature_block(rng, n):
+    """Vectorized equivalent of the per-sample draws in generate_flood_prediction_samples"""
+    risk = rng.choice(3, size=n, p=FLOOD_RISK_WEIGHTS)
+    block = {}
+    for feature, ranges in FLOOD_FEATURE_RANGES.items():
+        ranges = np.asarray(ranges, dtype=np.float64)[risk]
+        block[feature] = rng.uniform(ranges[:, 0], ranges[:, 1])
+    block['temperature_c'] = rng.uniform(15, 28, n)
+    block['wind_speed_kmh'] = rng.uniform(5, 40, n)
+    df = pd.DataFrame(block)
+    df['region'] = np.asarray(WESTERN_SYDNEY_REGIONS, dtype=object)[rng.integers(0, len(WESTERN_SYDNEY_REGIONS), n)]
+    return df
+
+def _route_feature_block(rng, n):
+    """Vectorized equivalent of the per-sample draws in generate_route_optimization_samples"""
+    period = rng.integers(0, len(TIME_PERIODS), n)
+    hours = np.asarray(TIME_PERIOD_HOURS)[period]
+    time_of_day = rng.integers(hours[:, 0], hours[:, 1] + 1)
+    day_of_week = rng.integers(0, 7, n)
+    is_holiday = (rng.random(n) < 0.1).astype(int)
+    rainfall = rng.uniform(0, 15, n)
+    
+    # Traffic conditions (0-100, higher is worse)
+    is_peak = np.array(['Peak' in p for p in TIME_PERIODS])[period]
+    base_traffic = (
+        30 + 30 * is_peak + 15 * (rainfall > 5) -
+        20 * is_holiday - 15 * (day_of_week >= 5)
+    )
+    traffic_index = np.clip(base_traffic + rng.uniform(-10, 10, n), 0, 100)
+    
+    df = pd.DataFrame({
+        'time_of_day': time_of_day,
+        'day_of_week': day_of_week,
+        'is_holiday': is_holiday,
+        'rainfall_mm': rainfall,
+        'temperature': rng.uniform(15, 30, n),
+        'traffic_index': traffic_index,
+        'road_type': rng.integers(1, 4, n),
+        'distance_km': rng.uniform(5, 30, n),
+        'construction_zones': rng.integers(0, 4, n),
+        'special_events': (rng.random(n) < 0.15).astype(int)
+    })
+    df['region'] = np.asarray(WESTERN_SYDNEY_REGIONS, dtype=object)[rng.integers(0, len(WESTERN_SYDNEY_REGIONS), n)]
+    df['time_period'] = np.asarray(TIME_PERIODS, dtype=object)[period]
+    return df
+
+# Model handle for the current worker process, set by _init_stream_worker
+_worker_model = None
+
+def _load_stream_model(kind, persist):
+    """Load a model for streaming generation, connecting to the DB only when persisting"""
+    model_class = FloodPredictionModel if kind == 'flood' else RouteOptimizationModel
+    model = model_class(use_db=persist)
+    model.load_model()
+    return model
+
+def _init_stream_worker(kind, persist, threads):
+    """Process pool initializer: apply the worker's thread budget and load the model once"""
+    global _worker_model
+    resources.configure(resources.BATCH, threads)
+    _worker_model = _load_stream_model(kind, persist)
+
+def _score_chunk(kind, seed, chunk_index, size, model=None):
+    """Generate and score one chunk of samples, returning a flat DataFrame"""
+    model = model or _worker_model
+    rng = np.random.default_rng([seed, chunk_index])
+    
+    if kind == 'flood':
+        df = _flood_feature_block(rng, size)
+        probability = model.model.predict_proba(df[model.feature_names])[:, 1]
+        df['flood_probability'] = probability
+        df['flood_risk'] = np.where(probability > 0.7, 'high', np.where(probability > 0.4, 'medium', 'low'))
+        
+        if model.conn and not model.conn.closed:
+            features = df.drop(columns=['flood_probability', 'flood_risk']).to_dict('records')
+            model._save_predictions([
+                (f, float(p), r, model._calculate_logistics_impact(f, p))
+                for f, p, r in zip(features, probability, df['flood_risk'])
+            ])
+    else:
+        df = _route_feature_block(rng, size)
+        travel_time = model.model.predict(model.scaler.transform(df[model.feature_names]))
+        df['travel_time_minutes'] = travel_time
+        
+        if model.conn and not model.conn.closed:
+            features = df.drop(columns=['travel_time_minutes']).to_dict('records')
+            model._save_predictions(list(zip(features, travel_time.astype(float))))
+    
+    return df
+
+def _iter_scored_chunks(kind, count, batch_size, workers, persist, seed):
+    """
+    Yield scored chunks in order. With workers > 1 chunks are scored in a
+    process pool, keeping at most two chunks per worker in flight so memory
+    stays constant regardless of count.
+    """
+    sizes = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    
+    if workers <= 1:
+        model = _load_stream_model(kind, persist)
+        for i, size in enumerate(sizes):
+            yield _score_chunk(kind, seed, i, size, model=model)
+        return
+    
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_stream_worker,
+        initargs=(kind, persist, max(1, resources.thread_budget(resources.BATCH) // workers))
+    ) as executor:
+        pending = deque()
+        chunks = iter(enumerate(sizes))
+        
+        def submit_next():
+            item = next(chunks, None)
+            if item is not None:
+                pending.append(executor.submit(_score_chunk, kind, seed, item[0], item[1]))
+        
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            df = pending.popleft().result()
+            submit_next()
+            yield df
+
+def stream_samples(kind, count, output_file, fmt='ndjson', batch_size=10000,
+                   workers=None, persist=False, seed=42):
+    """
+    Generate, score and stream `count` flood or route samples to
+    output_file as NDJSON or Parquet, one flat record per sample.
+    Predictions are only written to the database when persist is True.
+    """
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    logger.info(f"Streaming {count} {kind} samples to {output_file} "
+                f"({fmt}, batch_size={batch_size}, workers={workers}, persist={persist})")
+    
+    # Make sure a trained artifact exists before workers try to load it
+    if workers > 1:
+        _load_stream_model(kind, persist=False)
+    
+    chunks = _iter_scored_chunks(kind, count, batch_size, workers, persist, seed)
+    written = 0
+    
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in chunks:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_file, table.schema)
+                writer.write_table(table)
+                written += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(output_file, 'w') as f:
+            for df in chunks:
+                df.to_json(f, orient='records', lines=True)
+                written += len(df)
+    
+    logger.info(f"Wrote {written} {kind} samples to {output_file}")
+    return written
+
+def _positive_int(value):
+    """argparse type for options that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
 def main():
     """Main function to run the script from the command line"""
     parser = argparse.ArgumentParser(description='Generate sample data from ML models')
@@ -372,11 +545,30 @@ def main():
     parser.add_argument('--route', type=int, default=0, help='Number of route optimization samples to generate')
     parser.add_argument('--scenarios', type=int, default=0, help='Number of combined scenarios to generate')
     parser.add_argument('--output-dir', type=str, default='./sample_data', help='Directory to write output files')
+    parser.add_argument('--stream', action='store_true', help='Vectorized, parallel generation streamed to NDJSON/Parquet')
+    parser.add_argument('--format', choices=['ndjson', 'parquet'], default='ndjson', help='Output format for --stream')
+    parser.add_argument('--batch-size', type=_positive_int, default=10000, help='Samples scored per batch with --stream')
+    parser.add_argument('--workers', type=_positive_int, default=None, help='Worker processes for --stream (default: CPU count)')
+    parser.add_argument('--persist', action='store_true', help='Also save streamed predictions to the database')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for --stream')
     args = parser.parse_args()
     
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
     
+    if args.stream:
+        for kind, count, name in [('flood', args.flood, 'flood_predictions'),
+                                  ('route', args.route, 'route_optimizations')]:
+            if count > 0:
+                output_file = os.path.join(args.output_dir, f'{name}.{args.format}')
+                stream_samples(kind, count, output_file, fmt=args.format,
+                               batch_size=args.batch_size, workers=args.workers,
+                               persist=args.persist, seed=args.seed)
+        if args.scenarios > 0:
+            logger.warning("--scenarios is not supported with --stream; skipping")
+        logger.info("Sample data generation complete")
+        return
+    
     # Generate the requested samples
     if args.flood > 0:
         output_file = os.path.join(args.output_dir, 'flood_predictions.json')
@@ -0,0 +1,395 @@
+"""
+Western Sydney Geospatial Utilities
+-----------------------------------
+Vectorized haversine distances and a BallTree index of depots, warehouses,
+suburb centroids and river channels, so the ML API can derive distance
+features from raw coordinates instead of relying on callers to supply them.
+"""
+
+import logging
+from functools import lru_cache
+import numpy as np
+from sklearn.neighbors import BallTree
+
+logger = logging.getLogger('geo')
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Road distance is longer than the great-circle distance; 1.3 is the usual
+# circuity factor for suburban road networks in Australian cities.
+ROAD_CIRCUITY_FACTOR = 1.3
+
+# Spacing used when densifying river polylines into index points
+RIVER_POINT_SPACING_KM = 0.25
+
+# Suburb centroids (lat, lon)
+SUBURB_CENTROIDS = {
+    'Penrith': (-33.7507, 150.6877),
+    'Blacktown': (-33.7710, 150.9063),
+    'Parramatta': (-33.8150, 151.0011),
+    'Liverpool': (-33.9200, 150.9237),
+    'Fairfield': (-33.8722, 150.9561),
+    'Campbelltown': (-34.0650, 150.8142),
+    'Camden': (-34.0540, 150.6960),
+    'Windsor': (-33.6130, 150.8140),
+    'Richmond': (-33.5990, 150.7510),
+    'St Marys': (-33.7622, 150.7744),
+    'Mount Druitt': (-33.7675, 150.8198),
+    'Rouse Hill': (-33.6822, 150.9153)
+}
+
+# Static flood-relevant characteristics per suburb
+SUBURB_PROFILES = {
+    'Penrith': {'elevation_m': 28, 'impervious_surface_pct': 55, 'drainage_capacity': 0.6},
+    'Blacktown': {'elevation_m': 50, 'impervious_surface_pct': 65, 'drainage_capacity': 0.7},
+    'Parramatta': {'elevation_m': 10, 'impervious_surface_pct': 80, 'drainage_capacity': 0.6},
+    'Liverpool': {'elevation_m': 20, 'impervious_surface_pct': 70, 'drainage_capacity': 0.55},
+    'Fairfield': {'elevation_m': 30, 'impervious_surface_pct': 70, 'drainage_capacity': 0.6},
+    'Campbelltown': {'elevation_m': 70, 'impervious_surface_pct': 50, 'drainage_capacity': 0.75},
+    'Camden': {'elevation_m': 70, 'impervious_surface_pct': 35, 'drainage_capacity': 0.7},
+    'Windsor': {'elevation_m': 20, 'impervious_surface_pct': 35, 'drainage_capacity': 0.4},
+    'Richmond': {'elevation_m': 20, 'impervious_surface_pct': 30, 'drainage_capacity': 0.45},
+    'St Marys': {'elevation_m': 40, 'impervious_surface_pct': 60, 'drainage_capacity': 0.6},
+    'Mount Druitt': {'elevation_m': 55, 'impervious_surface_pct': 60, 'drainage_capacity': 0.65},
+    'Rouse Hill': {'elevation_m': 60, 'impervious_surface_pct': 50, 'drainage_capacity': 0.8}
+}
+
+# Distribution depots (lat, lon)
+DEPOTS = {
+    'Eastern Creek Depot': (-33.8040, 150.8510),
+    'Erskine Park Depot': (-33.8130, 150.7960),
+    'Moorebank Intermodal': (-33.9390, 150.9310),
+    'Smeaton Grange Depot': (-34.0370, 150.7600)
+}
+
+# Warehouses (lat, lon)
+WAREHOUSES = {
+    'Penrith Warehouse': (-33.7560, 150.6960),
+    'Wetherill Park Warehouse': (-33.8490, 150.9000),
+    'Prestons Warehouse': (-33.9430, 150.8700),
+    'Parramatta Warehouse': (-33.8240, 150.9900)
+}
+
+# River channels as coarse polylines (lat, lon), densified when indexed
+RIVERS = {
+    'Hawkesbury-Nepean River': [
+        (-34.0530, 150.6970), (-33.9700, 150.6550), (-33.8660, 150.6400),
+        (-33.7950, 150.6650), (-33.7520, 150.6800), (-33.6800, 150.6900),
+        (-33.6120, 150.7160), (-33.6030, 150.8200), (-33.5700, 150.8900)
+    ],
+    'South Creek': [
+        (-33.8800, 150.7400), (-33.7900, 150.7650), (-33.7600, 150.7700),
+        (-33.7000, 150.7900), (-33.6100, 150.8000)
+    ],
+    'Eastern Creek': [
+        (-33.8300, 150.8500), (-33.8000, 150.8500), (-33.7200, 150.8600),
+        (-33.6500, 150.8300)
+    ],
+    'Parramatta River': [
+        (-33.8100, 150.9700), (-33.8150, 151.0040), (-33.8220, 151.0400),
+        (-33.8300, 151.0800)
+    ],
+    'Georges River': [
+        (-34.0700, 150.8500), (-33.9700, 150.9000), (-33.9250, 150.9300),
+        (-33.9050, 150.9600), (-33.9400, 151.0100)
+    ]
+}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; all arguments broadcast as NumPy arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64))
+                              for v in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_matrix(points_a, points_b=None):
+    """
+    Pairwise great-circle distance matrix in km.
+    points_a is (n, 2) and points_b is (m, 2) as (lat, lon); returns (n, m).
+    """
+    a = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+    b = a if points_b is None else np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+    return haversine_km(a[:, 0, None], a[:, 1, None], b[None, :, 0], b[None, :, 1])
+
+
+def road_distance_km(from_lat, from_lon, to_lat, to_lon):
+    """Estimated road distance in km from great-circle distance"""
+    return haversine_km(from_lat, from_lon, to_lat, to_lon) * ROAD_CIRCUITY_FACTOR
+
+
+def _densify(polyline, spacing_km=RIVER_POINT_SPACING_KM):
+    """Interpolate points along a polyline at roughly fixed spacing"""
+    points = np.asarray(polyline, dtype=np.float64)
+    segments = []
+    for start, end in zip(points[:-1], points[1:]):
+        length = float(haversine_km(start[0], start[1], end[0], end[1]))
+        steps = max(1, int(np.ceil(length / spacing_km)))
+        t = np.linspace(0, 1, steps, endpoint=False)[:, None]
+        segments.append(start + t * (end - start))
+    segments.append(points[-1:])
+    return np.vstack(segments)
+
+
+class GeoIndex:
+    """BallTree index over named points for nearest-k and radius queries"""
+
+    def __init__(self, points):
+        """
+        points is an iterable of (name, kind, lat, lon) tuples.
+        """
+        points = list(points)
+        if not points:
+            raise ValueError("GeoIndex requires at least one point")
+        self.names = np.array([p[0] for p in points], dtype=object)
+        self.kinds = np.array([p[1] for p in points], dtype=object)
+        self.coords = np.array([(p[2], p[3]) for p in points], dtype=np.float64)
+        self.tree = BallTree(np.radians(self.coords), metric='haversine')
+
+    def __len__(self):
+        return len(self.names)
+
+    def query(self, coords, k=1):
+        """
+        Vectorized nearest-k query for (n, 2) coordinates.
+        Returns (distances_km, indices), both shaped (n, k).
+        """
+        coords = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        k = min(k, len(self))
+        distances, indices = self.tree.query(coords, k=k)
+        return distances * EARTH_RADIUS_KM, indices
+
+    def query_radius(self, coords, radius_km):
+        """
+        Vectorized radius query for (n, 2) coordinates.
+        Returns per-point arrays of indices and distances, nearest first.
+        """
+        coords = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        indices, distances = self.tree.query_radius(
+            coords, r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True, sort_results=True
+        )
+        return indices, [d * EARTH_RADIUS_KM for d in distances]
+
+    def _describe(self, index, distance):
+        return {
+            'name': self.names[index],
+            'kind': self.kinds[index],
+            'latitude': float(self.coords[index, 0]),
+            'longitude': float(self.coords[index, 1]),
+            'distance_km': float(distance)
+        }
+
+    def _check_kind(self, kind):
+        if kind is not None and kind not in set(self.kinds):
+            raise ValueError(f"Unknown kind '{kind}', expected one of {sorted(set(self.kinds))}")
+
+    def nearest(self, lat, lon, k=1, kind=None):
+        """Nearest k named points to a coordinate, optionally of one kind"""
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self._check_kind(kind)
+        if kind is None:
+            distances, indices = self.query([(lat, lon)], k=k)
+            return [self._describe(i, d) for i, d in zip(indices[0], distances[0])]
+
+        # Over-fetch then filter so the result still holds k points of the kind
+        distances, indices = self.query([(lat, lon)], k=len(self))
+        matches = [(i, d) for i, d in zip(indices[0], distances[0]) if self.kinds[i] == kind]
+        return [self._describe(i, d) for i, d in matches[:k]]
+
+    def within_radius(self, lat, lon, radius_km, kind=None):
+        """All named points within radius_km of a coordinate, nearest first"""
+        if not np.isfinite(radius_km) or radius_km < 0:
+            raise ValueError("radius_km must be a non-negative number")
+        self._check_kind(kind)
+        indices, distances = self.query_radius([(lat, lon)], radius_km)
+        return [
+            self._describe(i, d) for i, d in zip(indices[0], distances[0])
+            if kind is None or self.kinds[i] == kind
+        ]
+
+
+_location_index = None
+_river_index = None
+
+
+def get_location_index():
+    """Shared index of depots, warehouses and suburb centroids"""
+    global _location_index
+    if _location_index is None:
+        points = (
+            [(name, 'depot', lat, lon) for name, (lat, lon) in DEPOTS.items()] +
+            [(name, 'warehouse', lat, lon) for name, (lat, lon) in WAREHOUSES.items()] +
+            [(name, 'suburb', lat, lon) for name, (lat, lon) in SUBURB_CENTROIDS.items()]
+        )
+        _location_index = GeoIndex(points)
+        logger.info(f"Built location index with {len(_location_index)} points")
+    return _location_index
+
+
+def get_river_index():
+    """Shared index of densified river channel points"""
+    global _river_index
+    if _river_index is None:
+        points = []
+        for name, polyline in RIVERS.items():
+            points.extend((name, 'river', lat, lon) for lat, lon in _densify(polyline))
+        _river_index = GeoIndex(points)
+        logger.info(f"Built river index with {len(_river_index)} points")
+    return _river_index
+
+
+def distance_to_river_km(lats, lons):
+    """Vectorized distance in km from each coordinate to the nearest river channel"""
+    coords = np.column_stack([np.atleast_1d(lats), np.atleast_1d(lons)])
+    distances, _ = get_river_index().query(coords, k=1)
+    return distances[:, 0]
+
+
+def suburb_static_features(region):
+    """
+    Static flood features for a suburb: its profile plus the distance from
+    its centroid to the nearest river channel.
+    """
+    if region not in SUBURB_PROFILES:
+        raise ValueError(f"Unknown region: {region}")
+    features = dict(SUBURB_PROFILES[region])
+    features['distance_to_river_km'] = _suburb_river_distance_km(region)
+    return features
+
+
+@lru_cache(maxsize=None)
+def _suburb_river_distance_km(region):
+    """Cached distance from a suburb centroid to the nearest river channel"""
+    lat, lon = SUBURB_CENTROIDS[region]
+    return float(distance_to_river_km(lat, lon)[0])
+
+
+def resolve_location(value):
+    """
+    Resolve a named location (depot, warehouse or suburb) or a
+    {'lat': ..., 'lon': ...} mapping to a (lat, lon) tuple.
+    """
+    if isinstance(value, dict):
+        lat = value.get('lat', value.get('latitude'))
+        lon = value.get('lon', value.get('longitude'))
+        if lat is None or lon is None:
+            raise ValueError(f"Location must provide lat and lon: {value}")
+        return float(lat), float(lon)
+    for table in (DEPOTS, WAREHOUSES, SUBURB_CENTROIDS):
+        if value in table:
+            return table[value]
+    raise ValueError(f"Unknown location: {value}")
+
+
+def _endpoint(features, prefix):
+    """Coordinates for a route endpoint given as <prefix>_lat/_lon or a named <prefix>"""
+    lat, lon = features.get(f'{prefix}_lat'), features.get(f'{prefix}_lon')
+    if lat is not None and lon is not None:
+        return float(lat), float(lon)
+    if features.get(prefix) is not None:
+        return resolve_location(features[prefix])
+    return None
+
+
+def derive_route_features(items):
+    """
+    Fill in distance_km for route requests that give origin/destination
+    coordinates instead. Accepts a dict or list of dicts; returns the same
+    shape with new dicts, computing all distances in one vectorized pass.
+    """
+    single = isinstance(items, dict)
+    items = [dict(item) for item in ([items] if single else items)]
+
+    pending, coords = [], []
+    for i, item in enumerate(items):
+        if item.get('distance_km') is not None:
+            continue
+        origin, destination = _endpoint(item, 'origin'), _endpoint(item, 'destination')
+        if origin and destination:
+            pending.append(i)
+            coords.append(origin + destination)
+
+    if pending:
+        coords = np.asarray(coords, dtype=np.float64)
+        distances = road_distance_km(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3])
+        for i, distance in zip(pending, distances):
+            items[i]['distance_km'] = float(distance)
+
+    return items[0] if single else items
+
+
+def derive_flood_features(items):
+    """
+    Fill in distance_to_river_km for flood requests that give a location
+    (latitude/longitude or a suburb name in 'region') instead. Accepts a
+    dict or list of dicts; returns the same shape with new dicts.
+    """
+    single = isinstance(items, dict)
+    items = [dict(item) for item in ([items] if single else items)]
+
+    pending, coords = [], []
+    for i, item in enumerate(items):
+        if item.get('distance_to_river_km') is not None:
+            continue
+        if item.get('latitude') is not None and item.get('longitude') is not None:
+            coords.append((float(item['latitude']), float(item['longitude'])))
+        elif item.get('region') in SUBURB_CENTROIDS:
+            coords.append(SUBURB_CENTROIDS[item['region']])
+        else:
+            continue
+        pending.append(i)
+
+    if pending:
+        coords = np.asarray(coords, dtype=np.float64)
+        distances = distance_to_river_km(coords[:, 0], coords[:, 1])
+        for i, distance in zip(pending, distances):
+            items[i]['distance_to_river_km'] = float(distance)
+
+    return items[0] if single else items
+
+
+def _endpoint_columns(columns, prefix):
+    """Coordinate arrays for a route endpoint given as <prefix>_lat/_lon columns or a column of names"""
+    if f'{prefix}_lat' in columns and f'{prefix}_lon' in columns:
+        return (np.asarray(columns[f'{prefix}_lat'], dtype=np.float64),
+                np.asarray(columns[f'{prefix}_lon'], dtype=np.float64))
+    if prefix in columns:
+        coords = np.array([resolve_location(value) for value in columns[prefix]], dtype=np.float64).reshape(-1, 2)
+        return coords[:, 0], coords[:, 1]
+    return None
+
+
+def derive_route_columns(columns):
+    """
+    Columnar counterpart of derive_route_features: adds a distance_km column
+    from origin/destination coordinate or name columns when it is not
+    supplied.
+    """
+    if 'distance_km' in columns:
+        return columns
+    origin, destination = _endpoint_columns(columns, 'origin'), _endpoint_columns(columns, 'destination')
+    if origin is None or destination is None:
+        return columns
+    columns = dict(columns)
+    columns['distance_km'] = road_distance_km(origin[0], origin[1], destination[0], destination[1])
+    return columns
+
+
+def derive_flood_columns(columns):
+    """
+    Columnar counterpart of derive_flood_features: adds a
+    distance_to_river_km column from latitude/longitude columns when it is
+    not supplied.
+    """
+    if 'distance_to_river_km' in columns or 'latitude' not in columns or 'longitude' not in columns:
+        return columns
+    columns = dict(columns)
+    columns['distance_to_river_km'] = distance_to_river_km(
+        np.asarray(columns['latitude'], dtype=np.float64),
+        np.asarray(columns['longitude'], dtype=np.float64)
+    )
+    return columns
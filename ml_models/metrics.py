@@ -0,0 +1,314 @@
+"""
+ML API Metrics
+--------------
+Minimal in-process metrics (counters, gauges and histograms) rendered in
+the Prometheus text exposition format, plus per-stage latency timing for
+the prediction path.
+"""
+
+import abc
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import profiling
+
+# Latency buckets in seconds, from sub-millisecond stages to slow requests
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Training job buckets in seconds
+TRAINING_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Rows per micro-batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+# Endpoint of the request being handled on this thread/context
+current_endpoint = ContextVar('current_endpoint', default='offline')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    """Base class for labelled metrics"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    @abc.abstractmethod
+    def _samples(self):
+        """(suffix, labelnames, labelvalues, value) tuples to render"""
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for suffix, labelnames, labelvalues, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labelnames, labelvalues)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('_total', self.labelnames, key, value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Compute the value by calling fn() whenever metrics are rendered"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    def value(self, **labels):
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return [('', self.labelnames, key, value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed distribution of observations"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """(bucket counts, sum, count) for one label set"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                return [0] * (len(self.buckets) + 1), 0.0, 0
+            return list(state[0]), state[1], state[2]
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        samples = []
+        bucket_labels = self.labelnames + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', bucket_labels, key + (_format_value(bound),), cumulative))
+            samples.append(('_sum', self.labelnames, key, total))
+            samples.append(('_count', self.labelnames, key, count))
+        return samples
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+REQUESTS = counter(
+    'ml_requests', 'ML API requests by endpoint, method and status', ('endpoint', 'method', 'status')
+)
+REQUEST_LATENCY = histogram(
+    'ml_request_latency_seconds', 'ML API request latency by endpoint', ('endpoint',)
+)
+STAGE_LATENCY = histogram(
+    'ml_stage_latency_seconds',
+    'Latency of request stages (parse, validation, derive, build, inference, impact, persistence, serialize)',
+    ('endpoint', 'stage')
+)
+CACHE_REQUESTS = counter(
+    'ml_cache_requests', 'Cache lookups by cache and result (hit or miss)', ('cache', 'result')
+)
+DB_CONNECTIONS_OPEN = gauge(
+    'ml_db_connections_open', 'Open database connections by owner', ('owner',)
+)
+DB_CONNECTIONS_BUSY = gauge(
+    'ml_db_connections_busy', 'Database connections inside a transaction by owner', ('owner',)
+)
+TRAINING_DURATION = histogram(
+    'ml_training_duration_seconds', 'Model training job duration', ('model', 'status'),
+    buckets=TRAINING_BUCKETS
+)
+COALESCED_REQUESTS = counter(
+    'ml_coalesced_requests', 'Requests that shared an identical in-flight computation', ('group',)
+)
+ADMISSION_REJECTED = counter(
+    'ml_admission_rejected', 'Requests shed by admission control by class and reason', ('request_class', 'reason')
+)
+ADMISSION_QUEUE_DEPTH = gauge(
+    'ml_admission_queue_depth', 'Requests waiting for admission by class', ('request_class',)
+)
+ADMISSION_IN_FLIGHT = gauge(
+    'ml_admission_in_flight', 'Admitted requests in progress by class', ('request_class',)
+)
+BATCH_SIZE = histogram(
+    'ml_batch_size', 'Rows per micro-batched model call', ('batcher',), buckets=BATCH_SIZE_BUCKETS
+)
+BATCH_WAIT = histogram(
+    'ml_batch_wait_seconds', 'Time a row spent queued before its micro-batch was scored', ('batcher',)
+)
+
+WEATHER_READINGS = counter(
+    'ml_weather_readings', 'Raw gauge readings ingested by outcome', ('status',)
+)
+WEATHER_GAUGES = gauge(
+    'ml_weather_gauges', 'Gauges with live state in the weather feature engine'
+)
+INGESTED_ROWS = counter(
+    'ml_ingested_rows', 'Rows bulk loaded with COPY by kind and outcome', ('kind', 'status')
+)
+ROUTE_FEEDBACK = counter(
+    'ml_route_feedback', 'Completed deliveries reported for online residual correction'
+)
+RESIDUAL_CELLS = gauge(
+    'ml_route_residual_cells', 'Residual statistics cells kept by the route bias corrector'
+)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a stage of the current request into ml_stage_latency_seconds,
+    also recording it as a span when the request is being traced
+    """
+    start = time.perf_counter()
+    try:
+        with profiling.span(name):
+            yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, endpoint=current_endpoint.get(), stage=name)
+
+
+def cache_lookup(cache, hit):
+    """Record a cache hit or miss"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def render():
+    """All registered metrics in Prometheus text format"""
+    return REGISTRY.render()
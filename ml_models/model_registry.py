@@ -0,0 +1,289 @@
+"""
+Versioned Model Registry
+------------------------
+Keeps every published artifact per model type under
+<root>/<model_type>/<version>.joblib, with the active and candidate
+versions recorded in <root>/<model_type>/state.json. Artifacts and state
+are written to temporary files and renamed into place, and the model's
+legacy artifact path is an atomically swapped symlink to the active
+version, so existing loaders always read a complete, active artifact.
+
+ShadowEvaluator scores a sample of live traffic with a candidate model on
+a background thread and summarises how its outputs differ from the
+active model's before promotion.
+"""
+
+import os
+import json
+import queue
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+import numpy as np
+import joblib
+
+from flood_prediction import FloodPredictionModel
+from route_optimization import RouteOptimizationModel
+import columnar
+
+logger = logging.getLogger('model_registry')
+
+REGISTRY_ROOT = os.environ.get('ML_REGISTRY_ROOT', '/app/ml_models/registry')
+
+MODEL_CLASSES = {
+    'flood': FloodPredictionModel,
+    'route': RouteOptimizationModel
+}
+
+# Output compared between active and candidate models in shadow mode
+SHADOW_OUTPUTS = {
+    'flood': 'flood_probability',
+    'route': 'travel_time_minutes'
+}
+
+# Previous active versions kept for rollback
+HISTORY_LENGTH = 10
+
+# Most recent shadow comparisons kept for summaries
+SHADOW_WINDOW = 100000
+
+
+def _write_atomic(path, data):
+    """Write bytes to path via a temporary file and rename"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """Versioned artifacts with active/candidate pointers per model type"""
+
+    def __init__(self, root=REGISTRY_ROOT):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _dir(self, model_type):
+        if model_type not in MODEL_CLASSES:
+            raise ValueError(f"Unknown model type: {model_type}")
+        path = os.path.join(self.root, model_type)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def artifact_path(self, model_type, version):
+        return os.path.join(self._dir(model_type), f'{version}.joblib')
+
+    def staging_path(self, model_type):
+        """Scratch artifact path for a model being trained for publication"""
+        return os.path.join(self._dir(model_type), f'staging.{os.getpid()}.{threading.get_ident()}.joblib')
+
+    def versions(self, model_type):
+        """Published versions, oldest first"""
+        names = os.listdir(self._dir(model_type))
+        return sorted(
+            name[:-len('.joblib')] for name in names
+            if name.endswith('.joblib') and not name.startswith('staging.')
+        )
+
+    def state(self, model_type):
+        """{'active': version, 'candidate': version, 'history': [versions]}"""
+        path = os.path.join(self._dir(model_type), 'state.json')
+        if not os.path.exists(path):
+            return {'active': None, 'candidate': None, 'history': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_state(self, model_type, state):
+        path = os.path.join(self._dir(model_type), 'state.json')
+        _write_atomic(path, json.dumps(state, indent=2).encode())
+
+    def publish(self, model_type, model):
+        """
+        Save a trained model as a new immutable version and return it. The
+        model is not activated.
+        """
+        version = model.model_version or datetime.now().strftime('%Y%m%d%H%M%S')
+        if version in self.versions(model_type):
+            version = f"{version}-{datetime.now().strftime('%f')}"
+        model.model_version = version
+
+        staging_path = self.staging_path(model_type)
+        if not model.save_model(staging_path):
+            raise RuntimeError(f"Could not save {model_type} model version {version}")
+        os.replace(staging_path, self.artifact_path(model_type, version))
+        logger.info(f"Published {model_type} model version {version}")
+        return version
+
+    def import_legacy(self, model_type):
+        """
+        Adopt an existing stand-alone artifact at the model's default path
+        as the first active version
+        """
+        legacy_path = MODEL_CLASSES[model_type](use_db=False).model_path
+        if os.path.islink(legacy_path) or not os.path.isfile(legacy_path):
+            return None
+        with self._lock:
+            if self.versions(model_type):
+                return None
+            version = joblib.load(legacy_path).get('version') or f"{os.path.getmtime(legacy_path):.0f}"
+            artifact = self.artifact_path(model_type, version)
+            with open(legacy_path, 'rb') as f:
+                _write_atomic(artifact, f.read())
+        self.activate(model_type, version)
+        return version
+
+    def _link_active(self, model_type, version):
+        """Point the model's legacy artifact path at the active version"""
+        legacy_path = MODEL_CLASSES[model_type](use_db=False).model_path
+        artifact = self.artifact_path(model_type, version)
+        target = os.path.relpath(artifact, os.path.dirname(legacy_path))
+        tmp_link = f"{legacy_path}.link.{os.getpid()}"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(target, tmp_link)
+        os.replace(tmp_link, legacy_path)
+
+    def activate(self, model_type, version):
+        """Make a published version active, remembering the previous one"""
+        if version not in self.versions(model_type):
+            raise ValueError(f"Unknown {model_type} model version: {version}")
+        with self._lock:
+            state = self.state(model_type)
+            if state['active'] and state['active'] != version:
+                state['history'] = (state['history'] + [state['active']])[-HISTORY_LENGTH:]
+            state['active'] = version
+            if state['candidate'] == version:
+                state['candidate'] = None
+            self._save_state(model_type, state)
+            self._link_active(model_type, version)
+        logger.info(f"Activated {model_type} model version {version}")
+
+    def set_candidate(self, model_type, version):
+        """Record (or clear, with None) the candidate version"""
+        if version is not None and version not in self.versions(model_type):
+            raise ValueError(f"Unknown {model_type} model version: {version}")
+        with self._lock:
+            state = self.state(model_type)
+            state['candidate'] = version
+            self._save_state(model_type, state)
+
+    def rollback(self, model_type):
+        """Reactivate the previously active version and return it"""
+        with self._lock:
+            state = self.state(model_type)
+            if not state['history']:
+                raise ValueError(f"No previous {model_type} model version to roll back to")
+            version = state['history'].pop()
+            state['active'] = version
+            self._save_state(model_type, state)
+            self._link_active(model_type, version)
+        logger.info(f"Rolled back {model_type} model to version {version}")
+        return version
+
+    def load(self, model_type, version, use_db=False):
+        """A model instance loaded from a published version"""
+        model = MODEL_CLASSES[model_type](use_db=use_db)
+        model.load_model(self.artifact_path(model_type, version))
+        return model
+
+
+class ShadowEvaluator:
+    """
+    Scores a sampled fraction of live requests with a candidate model on a
+    background thread, comparing against the active model's outputs.
+    Offering a request never blocks: samples are dropped when the queue is
+    full.
+    """
+
+    def __init__(self, model_type, candidate, sample_rate=0.1, max_queue=1000, batch_size=256):
+        self.model_type = model_type
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.output = SHADOW_OUTPUTS[model_type]
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.compared = 0
+        self.dropped = 0
+        self.errors = 0
+        self._abs_diffs = deque(maxlen=SHADOW_WINDOW)
+        self._risk_agreements = 0
+        self._worker = threading.Thread(target=self._run, name=f'{model_type}-shadow', daemon=True)
+        self._worker.start()
+
+    def offer(self, features, active_result):
+        """Maybe queue a live request and the active model's result for comparison"""
+        if self._stopped.is_set() or random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((features, active_result))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stop(self):
+        """Stop sampling and let the worker thread exit"""
+        self._stopped.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _drain(self):
+        """Block for one sample, then take whatever else is queued up to batch_size"""
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return [sample for sample in batch if sample is not None]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._drain()
+            if not batch:
+                continue
+            try:
+                columns = columnar.columns_from_records([f for f, _ in batch], self.candidate.feature_names)
+                predictions = self.candidate.predict_columns(columns)
+                shadow = predictions[self.output]
+                # Candidates score uncorrected, so compare before any live residual correction
+                active = np.array([
+                    result[self.output] - result.get('bias_correction_minutes', 0.0) for _, result in batch
+                ], dtype=np.float64)
+                with self._lock:
+                    self.compared += len(batch)
+                    self._abs_diffs.extend(np.abs(shadow - active).tolist())
+                    if 'flood_risk' in predictions:
+                        self._risk_agreements += int(sum(
+                            risk == result['flood_risk'] for risk, (_, result) in zip(predictions['flood_risk'], batch)
+                        ))
+            except Exception as e:
+                logger.error(f"Error in shadow evaluation for {self.model_type}: {e}")
+                with self._lock:
+                    self.errors += len(batch)
+
+    def summary(self):
+        """How the candidate's outputs compare with the active model's so far"""
+        with self._lock:
+            diffs = np.array(self._abs_diffs)
+            summary = {
+                'candidate_version': self.candidate.model_version,
+                'sample_rate': self.sample_rate,
+                'compared': self.compared,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'output': self.output,
+                'mean_abs_diff': float(diffs.mean()) if len(diffs) else None,
+                'p95_abs_diff': float(np.percentile(diffs, 95)) if len(diffs) else None,
+                'max_abs_diff': float(diffs.max()) if len(diffs) else None
+            }
+            if self.model_type == 'flood':
+                summary['risk_agreement'] = self._risk_agreements / self.compared if self.compared else None
+            return summary
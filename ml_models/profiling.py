@@ -0,0 +1,183 @@
+"""
+ML API Profiling
+----------------
+Opt-in per-request trace spans and an on-demand sampling profiler that
+exports folded stacks for flame graphs. When no trace is active a span
+costs a single context variable lookup.
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Trace every request when set, or a random fraction of them
+TRACE_ALL = os.environ.get('ML_TRACE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE_RATE = float(os.environ.get('ML_TRACE_SAMPLE_RATE', 0))
+
+# Number of completed traces kept for /admin/traces
+TRACE_HISTORY = int(os.environ.get('ML_TRACE_HISTORY', 100))
+
+current_trace = ContextVar('current_trace', default=None)
+
+recent_traces = deque(maxlen=TRACE_HISTORY)
+
+
+class Trace:
+    """Timed spans recorded for one request"""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self._depth = 0
+        self.duration = None
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        recent_traces.append(self)
+        return self
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': None if self.duration is None else self.duration * 1000,
+            'spans': [
+                {'name': name, 'depth': depth, 'offset_ms': offset * 1000, 'duration_ms': duration * 1000}
+                for name, depth, offset, duration in self.spans
+            ]
+        }
+
+    def server_timing(self):
+        """Spans formatted as a Server-Timing header value"""
+        entries = [
+            f'{name.replace(" ", "_").replace(";", "_")};dur={duration * 1000:.3f}'
+            for name, _, _, duration in self.spans
+        ]
+        if self.duration is not None:
+            entries.append(f'total;dur={self.duration * 1000:.3f}')
+        return ', '.join(entries)
+
+
+def should_trace(header_value=None):
+    """Whether to trace a request given its X-Profile header"""
+    if header_value is not None:
+        return header_value.lower() in ('1', 'true', 'yes')
+    return TRACE_ALL or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+
+
+def start_trace(name):
+    """Begin tracing the current context"""
+    trace = Trace(name)
+    current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Finish and detach the current trace, if any"""
+    trace = current_trace.get()
+    if trace is None:
+        return None
+    current_trace.set(None)
+    return trace.finish()
+
+
+@contextmanager
+def span(name):
+    """Record a timed span if the current context is being traced"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    index = len(trace.spans)
+    trace.spans.append(None)
+    trace._depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace._depth -= 1
+        trace.spans[index] = (name, trace._depth, start - trace.start, time.perf_counter() - start)
+
+
+def traced(name):
+    """Decorator recording a span around each call"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads at a fixed interval and aggregates
+    them into folded stacks ("frame;frame;frame count"), the input format
+    of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+    def profile(self, seconds, interval=None):
+        """
+        Sample for `seconds` every `interval` seconds (default: the
+        profiler's interval) and return (folded_stacks, sample_count).
+        Raises RuntimeError if a profile is already running.
+        """
+        interval = self.interval if interval is None else interval
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A profile is already running')
+        try:
+            own_id = threading.get_ident()
+            names = {}
+            stacks = Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+
+            while time.perf_counter() < deadline:
+                if len(names) != threading.active_count():
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, str(thread_id)))
+                    stacks[';'.join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+
+            folded = '\n'.join(f'{stack} {count}' for stack, count in stacks.most_common())
+            return folded, samples
+        finally:
+            self._lock.release()
+
+
+profiler = SamplingProfiler()
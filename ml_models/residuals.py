@@ -0,0 +1,209 @@
+"""
+Online Residual Correction
+--------------------------
+Learns from completed deliveries between retrains. Every actual travel
+time reported back is compared with the route model's uncorrected
+prediction, and the residual (actual - predicted) updates exponentially
+weighted statistics for its (region, hour, road_type) cell, for the
+coarser (hour, road_type) cell and overall - three dictionary updates per
+delivery. At prediction time the correction is a lookup: each level's
+mean is shrunk towards the level above it in proportion to how much
+evidence it has, so sparse cells lean on their neighbours and unseen
+cells get the broader correction. No extra model evaluation is needed.
+
+Statistics belong to one model version and start again when a new version
+serves feedback. State is written to a JSON file periodically and loaded
+at startup, so a restart keeps what was learned.
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+logger = logging.getLogger('residuals')
+
+RESIDUALS_PATH = os.environ.get('ML_RESIDUALS_PATH', '/app/ml_models/route_residuals.json')
+
+# Observations in a cell after which an old residual counts half as much
+HALF_LIFE = float(os.environ.get('ML_RESIDUAL_HALF_LIFE', 200))
+
+# Pseudo-observations pulling a cell's mean towards the level above it
+PRIOR_WEIGHT = float(os.environ.get('ML_RESIDUAL_PRIOR_WEIGHT', 20))
+
+# Residuals are clipped to this many minutes so one bad report cannot dominate
+MAX_RESIDUAL = float(os.environ.get('ML_RESIDUAL_MAX_MINUTES', 60))
+
+# Seconds between saves of changed state
+SAVE_INTERVAL = float(os.environ.get('ML_RESIDUAL_SAVE_INTERVAL', 60))
+
+OVERALL = ()
+
+
+def cell_keys(features):
+    """(region, hour, road_type), (hour, road_type) and overall keys of a route request"""
+    hour = int(features.get('time_of_day') or 0)
+    road_type = int(features.get('road_type') or 0)
+    return (features.get('region'), hour, road_type), (hour, road_type), OVERALL
+
+
+class ResidualStats:
+    """Exponentially weighted mean and variance of residuals"""
+
+    __slots__ = ('weight', 'mean', 'variance')
+
+    def __init__(self, weight=0.0, mean=0.0, variance=0.0):
+        self.weight = weight
+        self.mean = mean
+        self.variance = variance
+
+    def update(self, residual, decay):
+        self.weight = self.weight * decay + 1.0
+        delta = residual - self.mean
+        rate = 1.0 / self.weight
+        self.mean += delta * rate
+        self.variance = (1.0 - rate) * (self.variance + rate * delta * delta)
+
+
+class ResidualCorrector:
+    """Per-cell residual statistics for one route model version"""
+
+    def __init__(self, path=RESIDUALS_PATH, half_life=HALF_LIFE, prior_weight=PRIOR_WEIGHT,
+                 max_residual=MAX_RESIDUAL):
+        self.path = path
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.prior_weight = prior_weight
+        self.max_residual = max_residual
+        self.model_version = None
+        self.stats = {}
+        self.observed = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._saver = None
+
+    def bind(self, model_version):
+        """Serve corrections for model_version, discarding statistics of any other"""
+        with self._lock:
+            if model_version != self.model_version:
+                if self.stats:
+                    logger.info(f"Resetting residuals learned for model version {self.model_version}")
+                self.model_version = model_version
+                self.stats = {}
+                self.observed = 0
+                self._dirty = True
+
+    def observe(self, features, predicted, actual):
+        """Record one delivery's actual travel time against its uncorrected prediction"""
+        residual = min(max(actual - predicted, -self.max_residual), self.max_residual)
+        keys = cell_keys(features)
+        with self._lock:
+            for key in keys:
+                stats = self.stats.get(key)
+                if stats is None:
+                    stats = self.stats[key] = ResidualStats()
+                stats.update(residual, self.decay)
+            self.observed += 1
+            self._dirty = True
+
+    def correction(self, features, model_version=None):
+        """Minutes to add to an uncorrected prediction; 0 if nothing was learned for this version"""
+        if model_version != self.model_version:
+            return 0.0
+        correction = 0.0
+        stats = self.stats
+        # Shrink each level towards the one above it, from overall down to the cell
+        for key in reversed(cell_keys(features)):
+            level = stats.get(key)
+            if level is None:
+                break
+            correction = (level.weight * level.mean + self.prior_weight * correction) / (level.weight + self.prior_weight)
+        return correction
+
+    def corrections(self, features_list, model_version=None):
+        return [self.correction(features, model_version) for features in features_list]
+
+    def summary(self, limit=20):
+        """Counts and the cells with the largest corrections"""
+        with self._lock:
+            cells = [(key, stats) for key, stats in self.stats.items() if len(key) == 3]
+            observed, version = self.observed, self.model_version
+            overall = self.stats.get(OVERALL)
+        cells.sort(key=lambda item: abs(item[1].mean), reverse=True)
+        return {
+            'model_version': version,
+            'observed': observed,
+            'cells': len(cells),
+            'overall_bias_minutes': overall.mean if overall else None,
+            'largest': [
+                {
+                    'region': region, 'time_of_day': hour, 'road_type': road_type,
+                    'correction_minutes': self.correction(
+                        {'region': region, 'time_of_day': hour, 'road_type': road_type}, version
+                    ),
+                    'mean_residual': stats.mean,
+                    'std_residual': math.sqrt(stats.variance),
+                    'weight': stats.weight
+                }
+                for (region, hour, road_type), stats in cells[:limit]
+            ]
+        }
+
+    def save(self, path=None):
+        """Write state to disk atomically if it changed since the last save"""
+        path = path or self.path
+        with self._lock:
+            if not self._dirty:
+                return False
+            state = {
+                'model_version': self.model_version,
+                'observed': self.observed,
+                'saved_at': time.time(),
+                'stats': [
+                    [list(key), stats.weight, stats.mean, stats.variance]
+                    for key, stats in self.stats.items()
+                ]
+            }
+            self._dirty = False
+        try:
+            tmp_path = f"{path}.tmp.{os.getpid()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+            return True
+        except Exception:
+            self._dirty = True
+            raise
+
+    def load(self, path=None):
+        """Restore saved state; False if there is none"""
+        path = path or self.path
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            state = json.load(f)
+        with self._lock:
+            self.model_version = state['model_version']
+            self.observed = state['observed']
+            self.stats = {
+                tuple(key): ResidualStats(weight, mean, variance)
+                for key, weight, mean, variance in state['stats']
+            }
+            self._dirty = False
+        logger.info(f"Loaded {self.observed} residual observations for model version {self.model_version}")
+        return True
+
+    def start_autosave(self, interval=SAVE_INTERVAL):
+        """Save changed state every interval seconds from a background thread"""
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._autosave, args=(interval,), name='residual-autosave', daemon=True)
+            self._saver.start()
+
+    def _autosave(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"Error saving residual state: {e}")
@@ -0,0 +1,122 @@
+"""
+CPU Thread Budgets
+------------------
+Explicit thread budgets per process role, so API workers, batch jobs and
+training can share a node without oversubscribing its cores. A budget is
+applied to OpenMP/BLAS through environment variables (for libraries
+loaded afterwards) and threadpoolctl (for libraries already loaded), and
+to joblib-parallel estimators through n_jobs.
+
+Budgets default to one thread per inference worker process (scale by
+adding workers), the whole node split across batch worker processes, and
+the node minus the API workers' cores for training. Override them with
+ML_THREADS_INFERENCE, ML_THREADS_BATCH and ML_THREADS_TRAINING.
+"""
+
+import os
+from contextlib import contextmanager
+
+INFERENCE = 'inference'
+BATCH = 'batch'
+TRAINING = 'training'
+
+ROLES = (INFERENCE, BATCH, TRAINING)
+
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'
+)
+
+# Role and budget applied to this process by configure()
+_active = {'role': None, 'threads': None, 'limiter': None}
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def thread_budget(role):
+    """Threads a process of the given role may use"""
+    if role not in ROLES:
+        raise ValueError(f"Unknown process role: {role}")
+    cpus = available_cpus()
+    api_workers = _env_int('ML_API_WORKERS', 1)
+    defaults = {
+        INFERENCE: 1,
+        BATCH: max(1, cpus // _env_int('ML_BATCH_WORKERS', 1)),
+        TRAINING: max(1, cpus - api_workers)
+    }
+    return max(1, _env_int(f'ML_THREADS_{role.upper()}', defaults[role]))
+
+
+def current_role():
+    """Role configured for this process, defaulting to ML_PROCESS_ROLE or inference"""
+    return _active['role'] or os.environ.get('ML_PROCESS_ROLE', INFERENCE)
+
+
+def n_jobs(role=None):
+    """n_jobs for joblib-parallel estimators in the given (or current) role"""
+    if role is None and _active['threads'] is not None:
+        return _active['threads']
+    return thread_budget(role or current_role())
+
+
+def configure(role=None, threads=None):
+    """
+    Apply a thread budget to this process. Call before importing NumPy or
+    scikit-learn where possible so native pools start at the right size.
+    Explicit thread variables already set in the environment are kept.
+    """
+    role = role or current_role()
+    threads = threads or thread_budget(role)
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+    from threadpoolctl import threadpool_limits
+    _active.update(role=role, threads=threads, limiter=threadpool_limits(limits=threads))
+    return threads
+
+
+def is_configured():
+    """Whether configure() has applied a budget to this process"""
+    return _active['threads'] is not None
+
+
+@contextmanager
+def limit(role, threads=None):
+    """Temporarily cap native thread pools to a role's budget, e.g. training inside the API"""
+    from threadpoolctl import threadpool_limits
+    with threadpool_limits(limits=threads or thread_budget(role)):
+        yield
+
+
+def report():
+    """Configured budgets and the parallelism native libraries actually use"""
+    from threadpoolctl import threadpool_info
+    import joblib
+    return {
+        'role': current_role(),
+        'threads': _active['threads'],
+        'available_cpus': available_cpus(),
+        'budgets': {role: thread_budget(role) for role in ROLES},
+        'joblib_effective_n_jobs': joblib.effective_n_jobs(n_jobs()),
+        'environment': {name: os.environ.get(name) for name in THREAD_ENV_VARS},
+        'threadpools': [
+            {
+                'library': pool.get('internal_api'),
+                'prefix': pool.get('prefix'),
+                'num_threads': pool.get('num_threads'),
+                'threading_layer': pool.get('threading_layer')
+            }
+            for pool in threadpool_info()
+        ]
+    }
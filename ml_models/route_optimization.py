@@ -16,6 +16,18 @@ import joblib
 import psycopg2
 from psycopg2.extras import execute_values
 import logging
+from datetime import datetime
+import metrics
+import profiling
+import resources
+import drift
+import explain
+import backends
+from forest_quantiles import PackedForest, DEFAULT_QUANTILES, quantile_label
+from forest_compaction import CompactForest
+from feature_schema import FeatureSchema, scale_row, forest_predict
+from batching import MicroBatcher
+from singleflight import SingleFlight
 
 # Configure logging
 logging.basicConfig(
@@ -31,9 +43,17 @@ logger = logging.getLogger('route_optimization')
 class RouteOptimizationModel:
     """Route optimization model using RandomForest algorithm"""
     
-    def __init__(self):
-        """Initialize the model"""
+    def __init__(self, use_db=True, residuals=None, backend=None):
+        """
+        Initialize the model.
+        With use_db=False no database connection is opened: training falls
+        back to synthetic data and predictions are not persisted. residuals
+        is an optional ResidualCorrector applied to every prediction, and
+        backend names the training backend (see backends.py), default from
+        ML_ROUTE_BACKEND.
+        """
         self.model = None
+        self.backend = backend or backends.configured(backends.ROUTE)
         self.scaler = StandardScaler()
         self.feature_names = [
             'time_of_day', 'day_of_week', 'is_holiday', 'rainfall_mm',
@@ -41,8 +61,20 @@ class RouteOptimizationModel:
             'construction_zones', 'special_events'
         ]
         self.model_path = '/app/ml_models/route_optimization_model.joblib'
+        self.model_version = None
+        self.schema = None
+        self.reference = None
+        self.drift = None
+        self.explainer = None
+        self.packed_forest = None
+        self.batcher = None
+        self.batching_closed = False
+        self.residuals = residuals
+        self.inflight = SingleFlight('route')
         self.conn = None
-        self.connect_db()
+        self.use_db = use_db
+        if use_db:
+            self.connect_db()
         
     def connect_db(self):
         """Connect to the PostgreSQL database"""
@@ -61,11 +93,26 @@ class RouteOptimizationModel:
     def load_training_data(self):
         """Load training data from the database"""
         try:
+            if not self.use_db:
+                return self._generate_synthetic_data()
+                
             if not self.conn or self.conn.closed:
                 self.connect_db()
                 
-            query = """
-                SELECT * FROM ml_data.training_data 
+            # Typed columns exist only where the table was created with them
+            typed_columns = self.feature_names + ['travel_time_minutes']
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = 'ml_data' AND table_name = 'training_data'
+            """)
+            has_typed = set(typed_columns) <= {row[0] for row in cursor.fetchall()}
+            cursor.close()
+            
+            columns = ['features', 'labels'] + (typed_columns if has_typed else [])
+            query = f"""
+                SELECT {', '.join(columns)}
+                FROM ml_data.training_data 
                 WHERE data_type = 'route_optimization'
                 ORDER BY time_point DESC
                 LIMIT 10000
@@ -79,16 +126,27 @@ class RouteOptimizationModel:
                 # Generate synthetic data for demonstration
                 return self._generate_synthetic_data()
             
-            # Extract features and labels from JSONB
-            X = pd.json_normalize([json.loads(f) if isinstance(f, str) else f 
-                                for f in df['features']])
-            y = pd.json_normalize([json.loads(f) if isinstance(f, str) else f 
-                               for f in df['labels']])['travel_time_minutes']
-            
-            return X, y
+            # Bulk-ingested rows carry typed columns; older rows only have JSONB
+            typed = df['travel_time_minutes'].notna() if has_typed else pd.Series(False, index=df.index)
+            X = df[typed].reindex(columns=self.feature_names).astype(np.float64)
+            y = df[typed].reindex(columns=['travel_time_minutes'])['travel_time_minutes'].astype(np.float64)
+            if not typed.all():
+                legacy = df[~typed]
+                X = pd.concat([X, pd.json_normalize([json.loads(f) if isinstance(f, str) else f 
+                                                    for f in legacy['features']])], ignore_index=True)
+                y = pd.concat([y, pd.json_normalize([json.loads(f) if isinstance(f, str) else f 
+                                                    for f in legacy['labels']])['travel_time_minutes']],
+                              ignore_index=True)
+            
+            # Optional features a delivery did not report take their training mean
+            X = X.reindex(columns=self.feature_names).astype(np.float64)
+            X = X.fillna(X.mean()).fillna(0)
+            return X.reset_index(drop=True), y.reset_index(drop=True)
             
         except Exception as e:
             logger.error(f"Error loading training data: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
             # Fall back to synthetic data for demonstration
             return self._generate_synthetic_data()
     
@@ -136,35 +194,42 @@ class RouteOptimizationModel:
                 X, y, test_size=0.2, random_state=42
             )
             
+            # Training distribution for drift monitoring
+            self.reference = drift.reference_histograms(
+                X_train.reindex(columns=self.feature_names).to_numpy(dtype=np.float64), self.feature_names
+            )
+            self._init_drift()
+            
             # Standardize features
             X_train_scaled = self.scaler.fit_transform(X_train)
             X_test_scaled = self.scaler.transform(X_test)
             
             # Train the model
-            logger.info("Training RandomForest model")
-            self.model = RandomForestRegressor(
-                n_estimators=100, 
-                max_depth=15,
-                random_state=42,
-                n_jobs=-1
-            )
-            self.model.fit(X_train_scaled, y_train)
-            
-            # Evaluate the model
-            train_score = self.model.score(X_train_scaled, y_train)
-            test_score = self.model.score(X_test_scaled, y_test)
+            logger.info(f"Training route model with the {self.backend} backend")
+            self.model = backends.make_estimator(backends.ROUTE, self.backend)
+            with resources.limit(resources.TRAINING):
+                self.model.fit(X_train_scaled, y_train)
+                
+                # Evaluate the model
+                train_score = self.model.score(X_train_scaled, y_train)
+                test_score = self.model.score(X_test_scaled, y_test)
             logger.info(f"Model trained. Train R²: {train_score:.4f}, Test R²: {test_score:.4f}")
             
+            # Serve with this process's thread budget
+            backends.set_n_jobs(self.model, resources.n_jobs())
+            
             # Save feature importances
             if self.conn and not self.conn.closed:
                 self._save_feature_importance()
             
             # Save the model
+            self.model_version = datetime.now().strftime('%Y%m%d%H%M%S')
             self.save_model()
             
             return {
                 'train_score': train_score,
                 'test_score': test_score,
+                'backend': self.backend,
                 'model_path': self.model_path
             }
             
@@ -193,7 +258,10 @@ class RouteOptimizationModel:
             model_id = result[0]
             
             # Prepare feature importance data
-            importances = self.model.feature_importances_
+            importances = backends.feature_importances(self.model)
+            if importances is None:
+                logger.info(f"The {self.backend} backend reports no feature importances")
+                return
             feature_importance_data = []
             
             for feature_name, importance in zip(self.feature_names, importances):
@@ -219,46 +287,311 @@ class RouteOptimizationModel:
             logger.error(f"Error saving feature importances: {e}")
             self.conn.rollback()
     
+    def enable_batching(self, max_batch_size=64, max_latency_ms=2.0):
+        """
+        Score concurrent predict() calls together through a micro-batcher,
+        holding a batch open for at most max_latency_ms
+        """
+        if self.batcher is None and not self.batching_closed:
+            self.batcher = MicroBatcher(self._score_scaled, 'route', max_batch_size, max_latency_ms)
+        return self.batcher
+    
+    def disable_batching(self):
+        """
+        Stop the micro-batcher's worker for good, e.g. when this instance is
+        swapped out; predict() then scores each call directly
+        """
+        self.batching_closed = True
+        batcher, self.batcher = self.batcher, None
+        if batcher is not None:
+            batcher.close()
+    
+    def _score_scaled(self, X):
+        """Travel times for already scaled feature rows"""
+        if isinstance(self.model, RandomForestRegressor):
+            return forest_predict(self.model, X)
+        return self.model.predict(X)
+    
+    def _init_drift(self):
+        """Monitor live features against this model's training distribution"""
+        self.drift = drift.DriftMonitor(self.feature_names, self.reference) if self.reference else None
+    
+    def _get_explainer(self):
+        """TreeSHAP explainer for the current model version, built on first use"""
+        if self.explainer is None or self.explainer.version != self.model_version:
+            if not isinstance(self.model, RandomForestRegressor):
+                raise ValueError(f"Explanations are not supported for {type(self.model).__name__}")
+            self.explainer = explain.for_forest(self.model, len(self.feature_names), self.model_version)
+        return self.explainer
+    
+    def _correction(self, features):
+        """Online residual correction in minutes for one request"""
+        if self.residuals is None:
+            return 0.0
+        return self.residuals.correction(features, self.model_version)
+    
+    def _get_packed_forest(self):
+        """Per-tree scoring arrays for the current model version, built on first use"""
+        if isinstance(self.model, CompactForest):
+            return self.model
+        if self.packed_forest is None or self.packed_forest.version != self.model_version:
+            if not isinstance(self.model, RandomForestRegressor):
+                raise ValueError(f"Prediction quantiles are not supported for {type(self.model).__name__}")
+            self.packed_forest = PackedForest(self.model, self.model_version)
+        return self.packed_forest
+    
+    def _get_schema(self):
+        """Feature schema for the current feature names, rebuilt when they change"""
+        if self.schema is None or self.schema.feature_names != self.feature_names:
+            self.schema = FeatureSchema(self.feature_names)
+        return self.schema
+    
+    @profiling.traced('route.predict')
     def predict(self, features):
         """Make predictions for route optimization"""
         try:
             if not self.model:
                 self.load_model()
                 
-            # Ensure features are in correct format
-            df = pd.DataFrame([features])
-            
-            # Check if all required features are present
-            missing_features = set(self.feature_names) - set(df.columns)
-            if missing_features:
-                logger.warning(f"Missing features: {missing_features}. Using defaults.")
-                for feature in missing_features:
-                    df[feature] = 0
-                    
-            # Ensure correct order of features
-            df = df[self.feature_names]
+            with metrics.stage('build'):
+                # Map features straight into a model-ordered row
+                row, missing_features = self._get_schema().row(features)
+                if missing_features:
+                    logger.warning(f"Missing features: {missing_features}. Using defaults.")
+                if self.drift is not None:
+                    self.drift.update_row(row[0])
+            
+            # Identical concurrent requests share one computation and record
+            key = (self.model_version, features.get('region'), tuple(row[0].tolist()))
+            return self.inflight.do(key, lambda: self._predict_row(features, row))
             
+        except Exception as e:
+            logger.error(f"Error making prediction: {e}")
+            raise
+    
+    def _predict_row(self, features, row):
+        """Score one built feature row and persist the prediction"""
+        with metrics.stage('inference'):
             # Scale features
-            df_scaled = self.scaler.transform(df)
+            with profiling.span('scaler.transform'):
+                row = scale_row(row, self.scaler)
             
             # Make prediction
-            travel_time = float(self.model.predict(df_scaled)[0])
-            
-            # Save prediction to database if connected
-            if self.conn and not self.conn.closed:
+            with profiling.span('model.predict'):
+                batcher = self.batcher
+                if batcher is not None:
+                    travel_time = float(batcher.submit(row))
+                else:
+                    travel_time = float(self._score_scaled(row)[0])
+            correction = self._correction(features)
+            travel_time += correction
+        
+        # Save prediction to database if connected
+        if self.conn and not self.conn.closed:
+            with metrics.stage('persistence'):
                 self._save_prediction(features, travel_time)
+        
+        return {
+            'travel_time_minutes': travel_time,
+            'bias_correction_minutes': correction,
+            'features_used': self.feature_names
+        }
+    
+    def predict_batch(self, features_list):
+        """
+        Make route predictions for a list of feature dicts in one model call.
+        Returns a list of results in the same format as predict().
+        """
+        try:
+            if not self.model:
+                self.load_model()
+                
+            # Build the feature matrix, defaulting missing features to 0
+            with metrics.stage('build'):
+                df = pd.DataFrame(list(features_list))
+                missing_features = set(self.feature_names) - set(df.columns)
+                if missing_features:
+                    logger.warning(f"Missing features: {missing_features}. Using defaults.")
+                df = df.reindex(columns=self.feature_names).fillna(0)
+                if self.drift is not None:
+                    self.drift.update(df.to_numpy(dtype=np.float64))
+            
+            # Scale features and predict
+            with metrics.stage('inference'):
+                travel_times = self.model.predict(self.scaler.transform(df))
+                corrections = [self._correction(features) for features in features_list]
+            
+            records = [(features, float(t) + c) for features, t, c in zip(features_list, travel_times, corrections)]
+            
+            # Save predictions to database if connected
+            if records and self.conn and not self.conn.closed:
+                with metrics.stage('persistence'):
+                    self._save_predictions(records)
+            
+            return [
+                {
+                    'travel_time_minutes': travel_time,
+                    'bias_correction_minutes': correction,
+                    'features_used': self.feature_names
+                } for (_, travel_time), correction in zip(records, corrections)
+            ]
             
-            return {
-                'travel_time_minutes': travel_time,
-                'features_used': self.feature_names
-            }
+        except Exception as e:
+            logger.error(f"Error making batch prediction: {e}")
+            raise
+    
+    def predict_columns(self, columns):
+        """
+        Predict travel times for a batch given as {feature: array} columns in
+        one model call. Returns a travel_time_minutes column.
+        """
+        try:
+            if not self.model:
+                self.load_model()
+                
+            with metrics.stage('build'):
+                X, missing_features = self._get_schema().matrix(columns)
+                if missing_features:
+                    logger.warning(f"Missing features: {missing_features}. Using defaults.")
+                if self.drift is not None:
+                    self.drift.update(X)
+            
+            with metrics.stage('inference'):
+                travel_times = self.model.predict(scale_row(X.copy(), self.scaler))
+                if self.residuals is not None:
+                    travel_times = travel_times + self._column_corrections(columns, X)
+            
+            # Save predictions to database if connected
+            if len(X) and self.conn and not self.conn.closed:
+                with metrics.stage('persistence'):
+                    self._save_predictions([
+                        (dict(zip(self.feature_names, row)), travel_time)
+                        for row, travel_time in zip(X.tolist(), travel_times.tolist())
+                    ])
+            
+            return {'travel_time_minutes': travel_times}
             
         except Exception as e:
-            logger.error(f"Error making prediction: {e}")
+            logger.error(f"Error making columnar prediction: {e}")
+            raise
+    
+    def predict_quantiles(self, features_list, quantiles=DEFAULT_QUANTILES):
+        """
+        Route predictions with travel time quantiles taken across the forest's
+        trees, all trees scored in one pass. Returns results in the format of
+        predict() with a 'quantiles' dict such as {'p10': ..., 'p90': ...}.
+        """
+        try:
+            if not self.model:
+                self.load_model()
+                
+            with metrics.stage('build'):
+                schema = self._get_schema()
+                X, _ = schema.rows(features_list)
+                if self.drift is not None:
+                    self.drift.update(X)
+            
+            with metrics.stage('inference'):
+                travel_times, values = self._get_packed_forest().predict_quantiles(
+                    scale_row(X, self.scaler), quantiles
+                )
+                corrections = [self._correction(features) for features in features_list]
+            
+            records = [(features, float(t) + c) for features, t, c in zip(features_list, travel_times, corrections)]
+            
+            # Save predictions to database if connected
+            if records and self.conn and not self.conn.closed:
+                with metrics.stage('persistence'):
+                    self._save_predictions(records)
+            
+            labels = [quantile_label(q) for q in quantiles]
+            return [
+                {
+                    'travel_time_minutes': travel_time,
+                    'quantiles': dict(zip(labels, (row + correction).tolist())),
+                    'bias_correction_minutes': correction,
+                    'features_used': self.feature_names
+                } for (_, travel_time), row, correction in zip(records, values, corrections)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Error making quantile prediction: {e}")
+            raise
+    
+    def _column_corrections(self, columns, X):
+        """Residual corrections for a columnar batch, keyed by its region column if any"""
+        regions = columns.get('region')
+        regions = [None] * len(X) if regions is None else list(regions)
+        hours = X[:, self.feature_names.index('time_of_day')].tolist()
+        road_types = X[:, self.feature_names.index('road_type')].tolist()
+        return np.array(self.residuals.corrections(
+            [
+                {'region': region, 'time_of_day': hour, 'road_type': road_type}
+                for region, hour, road_type in zip(regions, hours, road_types)
+            ],
+            self.model_version
+        ))
+    
+    def observe_actuals(self, features_list, actual_minutes):
+        """
+        Update the residual corrector with completed deliveries: actual travel
+        times against this model's uncorrected predictions, scored in one call
+        """
+        if not self.model:
+            self.load_model()
+        if self.residuals is None:
+            raise ValueError("Residual correction is not enabled")
+            
+        with metrics.stage('build'):
+            schema = self._get_schema()
+            X, _ = schema.rows(features_list)
+        with metrics.stage('inference'):
+            predicted = self._score_scaled(scale_row(X, self.scaler))
+        
+        self.residuals.bind(self.model_version)
+        for features, base, actual in zip(features_list, predicted.tolist(), actual_minutes):
+            self.residuals.observe(features, base, actual)
+        return predicted
+    
+    def explain_batch(self, features_list):
+        """
+        Per-feature TreeSHAP attributions of travel time for a list of feature
+        dicts. Attributions sum to travel_time_minutes - expected_minutes.
+        """
+        try:
+            if not self.model:
+                self.load_model()
+                
+            with metrics.stage('build'):
+                schema = self._get_schema()
+                X, _ = schema.rows(features_list)
+            
+            with metrics.stage('inference'):
+                X = scale_row(X, self.scaler)
+                explainer = self._get_explainer()
+                attributions = explainer.shap_values(X)
+                travel_times = self._score_scaled(X)
+            
+            return [
+                {
+                    'travel_time_minutes': float(travel_time),
+                    'expected_minutes': explainer.expected_value,
+                    'attributions': dict(zip(self.feature_names, phi.tolist()))
+                }
+                for travel_time, phi in zip(travel_times, attributions)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Error explaining predictions: {e}")
             raise
     
+    @profiling.traced('_save_prediction')
     def _save_prediction(self, features, prediction):
         """Save prediction to database"""
+        self._save_predictions([(features, prediction)])
+    
+    def _save_predictions(self, records):
+        """Save (features, travel_time) records to the database in one insert"""
         try:
             # Get model ID
             cursor = self.conn.cursor()
@@ -274,36 +607,47 @@ class RouteOptimizationModel:
             model_id = result[0]
             
             # Prepare prediction data
-            prediction_data = {
-                'input_features': features,
-                'travel_time_minutes': prediction
-            }
-            
-            # Insert prediction
-            cursor.execute(
-                """
-                INSERT INTO ml_data.model_predictions 
-                (model_id, model_name, prediction_type, confidence, prediction_data)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
+            prediction_rows = [
                 (
                     model_id, 
                     'Parramatta Route Optimization', 
                     'routing', 
                     0.89, 
-                    json.dumps(prediction_data)
-                )
+                    json.dumps({
+                        'input_features': features,
+                        'travel_time_minutes': prediction
+                    })
+                ) for features, prediction in records
+            ]
+            
+            # Insert predictions
+            execute_values(
+                cursor,
+                """
+                INSERT INTO ml_data.model_predictions 
+                (model_id, model_name, prediction_type, confidence, prediction_data)
+                VALUES %s
+                """,
+                prediction_rows
             )
             
             self.conn.commit()
-            logger.info("Saved prediction to database")
+            if len(records) == 1:
+                logger.info("Saved prediction to database")
+            else:
+                logger.info(f"Saved {len(records)} predictions to database")
             
         except Exception as e:
             logger.error(f"Error saving prediction: {e}")
             self.conn.rollback()
     
-    def save_model(self):
-        """Save the model to disk"""
+    def save_model(self, path=None):
+        """
+        Save the model to disk (default: model_path). The artifact is written
+        to a temporary file and renamed into place, so readers never see a
+        partially written file.
+        """
+        path = path or self.model_path
         try:
             if not self.model:
                 logger.warning("No model to save")
@@ -312,33 +656,50 @@ class RouteOptimizationModel:
             model_data = {
                 'model': self.model,
                 'scaler': self.scaler,
-                'feature_names': self.feature_names
+                'feature_names': self.feature_names,
+                'version': self.model_version,
+                'reference': self.reference
             }
             
-            joblib.dump(model_data, self.model_path)
-            logger.info(f"Model saved to {self.model_path}")
+            tmp_path = f"{path}.tmp.{os.getpid()}"
+            joblib.dump(model_data, tmp_path)
+            os.replace(tmp_path, path)
+            logger.info(f"Model saved to {path}")
             return True
             
         except Exception as e:
             logger.error(f"Error saving model: {e}")
             return False
     
-    def load_model(self):
-        """Load the model from disk"""
+    def load_model(self, path=None):
+        """
+        Load the model from disk (default: model_path). A missing or
+        unreadable default artifact is replaced by training a new model; an
+        explicit path must load.
+        """
+        explicit = path is not None
+        path = path or self.model_path
         try:
-            if not os.path.exists(self.model_path):
-                logger.warning(f"Model file not found at {self.model_path}. Training new model.")
+            if not explicit and not os.path.exists(path):
+                logger.warning(f"Model file not found at {path}. Training new model.")
                 self.train()
                 return
                 
-            model_data = joblib.load(self.model_path)
+            model_data = joblib.load(path)
             self.model = model_data['model']
             self.scaler = model_data['scaler']
             self.feature_names = model_data['feature_names']
-            logger.info(f"Model loaded from {self.model_path}")
+            self.backend = backends.backend_of(self.model)
+            backends.set_n_jobs(self.model, resources.n_jobs())
+            self.model_version = model_data.get('version') or f"{os.path.getmtime(path):.0f}"
+            self.reference = model_data.get('reference')
+            self._init_drift()
+            logger.info(f"Model loaded from {path}")
             
         except Exception as e:
             logger.error(f"Error loading model: {e}")
+            if explicit:
+                raise
             logger.info("Training new model instead")
             self.train()
 
@@ -0,0 +1,61 @@
+"""
+In-Flight Request Coalescing
+----------------------------
+Single-flight deduplication: concurrent calls with the same key share one
+execution of the underlying function, and every caller receives its
+result (or exception). Keys are forgotten as soon as the call finishes,
+so this never serves stale results.
+"""
+
+import threading
+
+import metrics
+
+
+class _Call:
+    """An in-progress call that followers wait on"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls by key"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call with the same key is already in flight, in
+        which case wait for and share its result
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.COALESCED_REQUESTS.inc(group=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -8,7 +8,12 @@ This script starts the Flask API server for the ML models.
 import os
 import sys
 import logging
-from api import app
+
+# Apply the thread budget before NumPy and scikit-learn are loaded
+import resources
+resources.configure()
+
+from api import app, init_app
 
 # Configure logging
 logging.basicConfig(
@@ -27,13 +32,47 @@ if __name__ == '__main__':
     
     # Log startup
     logger.info(f"Starting ML API server on port {port}")
+    logger.info(f"Process role '{resources.current_role()}' with {resources.n_jobs()} thread(s) "
+                f"of {resources.available_cpus()} available CPUs")
     logger.info("Available endpoints:")
     logger.info("  GET  /health                - Health check")
+    logger.info("  GET  /metrics               - Prometheus metrics")
+    logger.info("  GET  /admin/traces          - Recent request traces")
+    logger.info("  POST /admin/profile         - Sampling profile as folded stacks")
+    logger.info("  GET  /admin/queues          - Admission queue depths per request class")
+    logger.info("  GET  /admin/resources       - Thread budgets and effective parallelism")
     logger.info("  GET  /models/info           - Get model information")
-    logger.info("  POST /predict/flood         - Make flood prediction")
-    logger.info("  POST /predict/route         - Make route optimization prediction")
-    logger.info("  POST /models/train          - Train or retrain a model")
+    logger.info("  POST /predict/flood         - Make flood prediction (features or just a region)")
+    logger.info("  POST /predict/route         - Make route optimization prediction (?quantiles=0.1,0.9)")
+    logger.info("  POST /predict/flood/batch   - Make flood predictions for a batch (JSON, Arrow or MessagePack)")
+    logger.info("  POST /predict/flood/ensemble - Monte Carlo flood forecast")
+    logger.info("  POST /predict/route/batch   - Make route predictions for a batch (JSON, Arrow or MessagePack)")
+    logger.info("  POST /predict/flood/stream  - Stream flood predictions for NDJSON input")
+    logger.info("  POST /predict/route/stream  - Stream route predictions for NDJSON input")
+    logger.info("  POST /explain/flood         - Per-feature attributions for flood predictions")
+    logger.info("  POST /explain/route         - Per-feature attributions for route travel times")
+    logger.info("  POST /feedback/route        - Report actual travel times for online bias correction")
+    logger.info("  POST /weather/readings      - Ingest raw rainfall and river gauge readings")
+    logger.info("  POST /ingest/weather        - Bulk load gauge readings into the database (COPY)")
+    logger.info("  POST /ingest/deliveries     - Bulk load completed deliveries as route training data")
+    logger.info("  GET  /weather/features      - Live weather features per region")
+    logger.info("  POST /forecast/flood/inputs - Submit weather inputs for the flood forecast grid")
+    logger.info("  GET  /forecast/flood        - Look up precomputed flood forecast")
+    logger.info("  GET  /whatif/flood          - Instant flood what-if from the surrogate lookup table")
+    logger.info("  POST /whatif/flood/build    - Rebuild the what-if table from the flood model")
+    logger.info("  POST /scenarios/evaluate    - Evaluate flood/route what-if scenarios")
+    logger.info("  GET  /geo/nearest           - Find nearest depots, warehouses and suburbs")
+    logger.info("  POST /models/train          - Train and publish a model version (optionally in shadow or only if drifted)")
+    logger.info("  GET  /models/drift          - Feature drift (PSI/KS) against training data")
+    logger.info("  GET  /models/residuals      - Online route residual corrections")
+    logger.info("  GET  /models/registry       - Model versions, active/candidate and shadow comparison")
+    logger.info("  POST /models/registry/candidate - Shadow-evaluate a published version")
+    logger.info("  POST /models/registry/promote - Activate and hot-swap the candidate version")
+    logger.info("  POST /models/registry/rollback - Reactivate the previous version")
     logger.info("  POST /schedule              - Schedule model training")
     
+    # Models, forecast, residual and weather state, as when api.py runs directly
+    init_app()
+    
     # Start the server
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Flood What-If Surrogate
+-----------------------
+Lookup tables that answer weather-impact slider queries without a model
+call. An offline sweep scores the flood model over a dense grid of its
+most influential weather features for every suburb, with the remaining
+features held at the suburb's static profile and the weather defaults,
+and stores the probabilities as a compact NumPy table. A query is then
+multilinear interpolation between the 2^d surrounding grid points.
+
+Tree ensembles are step functions, and interpolating across a step is
+where a plain uniform grid goes wrong. Each axis therefore also gets a
+pair of points straddling every split threshold the model uses on that
+feature, which confines the error at a step to a sliver of the axis.
+
+The sweep also scores random off-grid points with the real model and
+records the interpolation error, so every answer carries the table's
+measured error bound alongside the spread of its own grid cell.
+
+Build a table from the command line, or with POST /whatif/flood/build:
+
+    python surrogate.py --points 33 --axes rainfall_mm_24h,river_level_m
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import argparse
+import itertools
+import numpy as np
+
+# Add the current directory to the path so we can import the ML models
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import geo
+from flood_ensemble import WEATHER_DEFAULTS
+from feature_schema import split_scaler, scale_row
+import backends
+
+logger = logging.getLogger('surrogate')
+
+SURROGATE_PATH = os.environ.get('ML_SURROGATE_PATH', '/app/ml_models/flood_surrogate.npz')
+
+# Features a slider can move; static suburb features never vary
+WEATHER_FEATURES = [
+    'rainfall_mm_24h', 'rainfall_mm_72h', 'river_level_m',
+    'soil_moisture', 'temperature_c', 'wind_speed_kmh'
+]
+
+DEFAULT_AXES = 3
+DEFAULT_POINTS = 33
+
+# Uniform grid points per axis are clamped to this
+MAX_POINTS = 129
+
+# Largest grid swept per region, split points included; the sweep holds
+# a float64 feature row for every cell
+MAX_GRID_CELLS = 1000000
+
+# Training data quantiles spanned by each axis
+AXIS_QUANTILES = (0.0, 0.995)
+
+# Random off-grid points per region scored to measure interpolation error
+VALIDATION_POINTS = 2000
+
+# Rows per model call during the sweep
+SWEEP_CHUNK = 100000
+
+# Most split thresholds per axis given their own pair of grid points
+MAX_SPLIT_POINTS = 256
+
+# Relative offset of the grid points either side of a split threshold
+SPLIT_OFFSET = 1e-6
+
+
+def influential_features(model, count=DEFAULT_AXES):
+    """
+    The count weather features the flood classifier relies on most, in
+    WEATHER_FEATURES order if the backend reports no importances
+    """
+    _, classifier = split_scaler(model.model)
+    importances = backends.feature_importances(classifier)
+    if importances is None:
+        return WEATHER_FEATURES[:count]
+    importances = dict(zip(model.feature_names, importances))
+    return sorted(WEATHER_FEATURES, key=lambda name: importances.get(name, 0.0), reverse=True)[:count]
+
+
+def split_thresholds(model, name):
+    """
+    Thresholds, in raw feature units, at which the flood model's trees split
+    on a feature; empty for models that are not sklearn tree ensembles
+    """
+    scaler, classifier = split_scaler(model.model)
+    estimators = np.ravel(getattr(classifier, 'estimators_', []))
+    trees = [estimator.tree_ for estimator in estimators if hasattr(estimator, 'tree_')]
+    if not trees:
+        return np.array([])
+    i = model.feature_names.index(name)
+    thresholds = np.unique(np.concatenate([tree.threshold[tree.feature == i] for tree in trees]))
+    if scaler is not None:
+        if scaler.with_std:
+            thresholds = thresholds * scaler.scale_[i]
+        if scaler.with_mean:
+            thresholds = thresholds + scaler.mean_[i]
+    return thresholds
+
+
+def axis_grid(low, high, points, thresholds=()):
+    """Uniform grid over [low, high] plus a close pair of points around each threshold inside it"""
+    thresholds = [t for t in thresholds if low < t < high]
+    if len(thresholds) > MAX_SPLIT_POINTS:
+        thresholds = [thresholds[int(k)] for k in np.linspace(0, len(thresholds) - 1, MAX_SPLIT_POINTS)]
+    offset = SPLIT_OFFSET * max(high - low, 1e-12)
+    extra = [t + side * offset for t in thresholds for side in (-1, 1)]
+    return np.unique(np.concatenate([np.linspace(low, high, points), extra]))
+
+
+def region_defaults(region):
+    """Feature values held fixed for a region: weather defaults and its static profile"""
+    features = dict(WEATHER_DEFAULTS)
+    features.update(geo.suburb_static_features(region))
+    return features
+
+
+def _probabilities(model, X):
+    """Flood probabilities for model-ordered rows, without persistence or drift tracking"""
+    scaler, classifier = split_scaler(model.model)
+    out = np.empty(len(X))
+    for start in range(0, len(X), SWEEP_CHUNK):
+        chunk = X[start:start + SWEEP_CHUNK].copy()
+        out[start:start + SWEEP_CHUNK] = classifier.predict_proba(scale_row(chunk, scaler))[:, 1]
+    return out
+
+
+class FloodSurrogate:
+    """Per-region probability tables over a grid of slider features"""
+
+    def __init__(self, axes, grids, regions, table, defaults, model_version=None, validation=None, built_at=None):
+        self.axes = list(axes)
+        self.grids = [np.asarray(grid, dtype=np.float64) for grid in grids]
+        self.regions = list(regions)
+        self.region_index = {region: i for i, region in enumerate(self.regions)}
+        self.table = np.asarray(table, dtype=np.float32)
+        self.defaults = defaults
+        self.model_version = model_version
+        self.validation = validation or {}
+        self.built_at = built_at
+        self._grid_lists = [grid.tolist() for grid in self.grids]
+        self._tables = [self.table[i].tolist() for i in range(len(self.regions))]
+
+    @classmethod
+    def build(cls, model, axes=None, points=DEFAULT_POINTS, regions=None, training_data=None,
+              validation_points=VALIDATION_POINTS, seed=42):
+        """Sweep a loaded FloodPredictionModel over the grid and measure interpolation error"""
+        axes = list(axes or influential_features(model))
+        unknown = [name for name in axes if name not in WEATHER_FEATURES]
+        if unknown:
+            raise ValueError(f"Axes must be weather features {WEATHER_FEATURES}, got {unknown}")
+        points = min(int(points), MAX_POINTS)
+        if points < 2:
+            raise ValueError("points must be at least 2")
+        regions = list(regions or geo.SUBURB_PROFILES)
+        X_train = training_data if training_data is not None else model.load_training_data()[0]
+
+        grids = []
+        for name in axes:
+            low, high = np.quantile(X_train[name].to_numpy(dtype=np.float64), AXIS_QUANTILES)
+            grids.append(axis_grid(low, high, points, split_thresholds(model, name)))
+        cells = int(np.prod([len(grid) for grid in grids]))
+        if cells > MAX_GRID_CELLS:
+            raise ValueError(
+                f"Grid of {cells} cells per region exceeds {MAX_GRID_CELLS}; use fewer axes or points"
+            )
+        mesh = np.stack(np.meshgrid(*grids, indexing='ij'), axis=-1).reshape(-1, len(axes))
+        columns = [model.feature_names.index(name) for name in axes]
+
+        started = time.perf_counter()
+        defaults = {}
+        table = np.empty((len(regions),) + tuple(len(grid) for grid in grids), dtype=np.float32)
+        for i, region in enumerate(regions):
+            defaults[region] = region_defaults(region)
+            X = np.tile([defaults[region].get(name, 0.0) for name in model.feature_names], (len(mesh), 1))
+            X[:, columns] = mesh
+            table[i] = _probabilities(model, X).reshape(table.shape[1:])
+        logger.info(f"Swept {table.size} grid points in {time.perf_counter() - started:.1f}s")
+
+        surrogate = cls(axes, grids, regions, table, defaults, model.model_version, built_at=time.time())
+        surrogate.validation = surrogate.validate(model, validation_points, seed)
+        return surrogate
+
+    def validate(self, model, points=VALIDATION_POINTS, seed=42):
+        """Interpolation error against the real model at random points inside the grid"""
+        rng = np.random.default_rng(seed)
+        columns = [model.feature_names.index(name) for name in self.axes]
+        errors = {}
+        for region in self.regions:
+            values = np.column_stack([rng.uniform(grid[0], grid[-1], points) for grid in self.grids])
+            X = np.tile([self.defaults[region].get(name, 0.0) for name in model.feature_names], (points, 1))
+            X[:, columns] = values
+            errors[region] = np.abs(self.lookup_batch(region, values) - _probabilities(model, X))
+
+        def summary(e):
+            return {'max': float(e.max()), 'p99': float(np.quantile(e, 0.99)), 'mean': float(e.mean())}
+
+        return {
+            'points': points * len(self.regions),
+            'overall': summary(np.concatenate(list(errors.values()))),
+            'regions': {region: summary(e) for region, e in errors.items()}
+        }
+
+    def _cell(self, values):
+        """Per axis: lower grid index, interpolation weight and whether the value was clamped"""
+        cell = []
+        clamped = False
+        for grid, value in zip(self._grid_lists, values):
+            clamped = clamped or not grid[0] <= value <= grid[-1]
+            value = min(max(value, grid[0]), grid[-1])
+            j = min(max(bisect.bisect_right(grid, value) - 1, 0), len(grid) - 2)
+            cell.append((j, (value - grid[j]) / (grid[j + 1] - grid[j])))
+        return cell, clamped
+
+    def lookup(self, region, values):
+        """
+        Interpolated flood probability for one region and a sequence of axis
+        values, with the min/max of the surrounding grid points and whether
+        any value fell outside the grid and was clamped to its edge
+        """
+        index = self.region_index.get(region)
+        if index is None:
+            raise KeyError(region)
+        cell, clamped = self._cell(values)
+
+        probability, low, high = 0.0, 1.0, 0.0
+        for corner in itertools.product((0, 1), repeat=len(cell)):
+            node, weight = self._tables[index], 1.0
+            for (j, t), side in zip(cell, corner):
+                node = node[j + side]
+                weight *= t if side else 1.0 - t
+            probability += weight * node
+            low, high = min(low, node), max(high, node)
+        return probability, low, high, clamped
+
+    def lookup_batch(self, region, values):
+        """Interpolated probabilities for an (n, len(axes)) array of axis values"""
+        table = self.table[self.region_index[region]]
+        values = np.asarray(values, dtype=np.float64)
+        lower, weights = [], []
+        for k, grid in enumerate(self.grids):
+            v = np.clip(values[:, k], grid[0], grid[-1])
+            j = np.clip(np.searchsorted(grid, v, side='right') - 1, 0, len(grid) - 2)
+            lower.append(j)
+            weights.append((v - grid[j]) / (grid[j + 1] - grid[j]))
+
+        result = np.zeros(len(values))
+        for corner in itertools.product((0, 1), repeat=len(self.grids)):
+            weight = np.ones(len(values))
+            for w, side in zip(weights, corner):
+                weight *= w if side else 1.0 - w
+            result += weight * table[tuple(j + side for j, side in zip(lower, corner))]
+        return result
+
+    def describe(self):
+        return {
+            'axes': {name: {'min': float(grid[0]), 'max': float(grid[-1]), 'points': len(grid)}
+                     for name, grid in zip(self.axes, self.grids)},
+            'regions': self.regions,
+            'model_version': self.model_version,
+            'table_bytes': int(self.table.nbytes),
+            'validation': self.validation,
+            'built_at': self.built_at
+        }
+
+    def save(self, path=SURROGATE_PATH):
+        """Write the table and its metadata to an .npz file, atomically"""
+        metadata = {
+            'axes': self.axes,
+            'regions': self.regions,
+            'defaults': self.defaults,
+            'model_version': self.model_version,
+            'validation': self.validation,
+            'built_at': self.built_at
+        }
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez_compressed(
+            tmp_path, table=self.table, metadata=np.array(json.dumps(metadata)),
+            **{f'grid_{k}': grid for k, grid in enumerate(self.grids)}
+        )
+        os.replace(tmp_path, path)
+        logger.info(f"Surrogate saved to {path}")
+
+    @classmethod
+    def load(cls, path=SURROGATE_PATH):
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            grids = [data[f'grid_{k}'] for k in range(len(metadata['axes']))]
+            table = data['table']
+        return cls(
+            metadata['axes'], grids, metadata['regions'], table, metadata['defaults'],
+            metadata['model_version'], metadata['validation'], metadata['built_at']
+        )
+
+
+def main():
+    """Build a surrogate table from the current flood model"""
+    parser = argparse.ArgumentParser(description='Build the flood what-if lookup table')
+    parser.add_argument('--output', type=str, default=SURROGATE_PATH, help='Table file to write')
+    parser.add_argument('--axes', type=str, help='Comma-separated slider features (default: most influential)')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS, help='Grid points per axis')
+    parser.add_argument('--validation-points', type=int, default=VALIDATION_POINTS, help='Error check points per region')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    from flood_prediction import FloodPredictionModel
+    model = FloodPredictionModel()
+    model.load_model()
+    axes = args.axes.split(',') if args.axes else None
+    surrogate = FloodSurrogate.build(model, axes, args.points, validation_points=args.validation_points)
+    surrogate.save(args.output)
+    print(json.dumps(surrogate.describe(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
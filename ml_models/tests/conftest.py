@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flood_prediction import FloodPredictionModel
+from route_optimization import RouteOptimizationModel
+
+
+ROUTE_A = {
+    'time_of_day': 3, 'day_of_week': 2, 'is_holiday': 0, 'rainfall_mm': 0.0,
+    'temperature': 22.0, 'traffic_index': 30.0, 'road_type': 1, 'distance_km': 5.0,
+    'construction_zones': 0, 'special_events': 0
+}
+ROUTE_B = {
+    'time_of_day': 17, 'day_of_week': 4, 'is_holiday': 1, 'rainfall_mm': 8.0,
+    'temperature': 15.0, 'traffic_index': 80.0, 'road_type': 3, 'distance_km': 25.0,
+    'construction_zones': 2, 'special_events': 1
+}
+FLOOD_LOW = {
+    'rainfall_mm_24h': 2.0, 'rainfall_mm_72h': 5.0, 'river_level_m': 0.8,
+    'soil_moisture': 0.2, 'temperature_c': 24.0, 'wind_speed_kmh': 10.0,
+    'elevation_m': 40.0, 'distance_to_river_km': 3.0, 'impervious_surface_pct': 20.0,
+    'drainage_capacity': 0.9
+}
+FLOOD_HIGH = {
+    'rainfall_mm_24h': 150.0, 'rainfall_mm_72h': 300.0, 'river_level_m': 4.5,
+    'soil_moisture': 0.95, 'temperature_c': 18.0, 'wind_speed_kmh': 60.0,
+    'elevation_m': 2.0, 'distance_to_river_km': 0.1, 'impervious_surface_pct': 90.0,
+    'drainage_capacity': 0.1
+}
+
+
+@pytest.fixture(scope='session')
+def route_model(tmp_path_factory):
+    """Route model trained on synthetic data, without a database"""
+    model = RouteOptimizationModel(use_db=False)
+    model.model_path = str(tmp_path_factory.mktemp('route') / 'route.joblib')
+    model.train()
+    return model
+
+
+@pytest.fixture(scope='session')
+def flood_model(tmp_path_factory):
+    """Flood model trained on synthetic data, without a database"""
+    model = FloodPredictionModel(use_db=False)
+    model.model_path = str(tmp_path_factory.mktemp('flood') / 'flood.joblib')
+    model.train()
+    return model
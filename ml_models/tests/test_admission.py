@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from admission import BATCH, INTERACTIVE, AdmissionController, Rejected
+
+
+def _controller(total_slots=1, **overrides):
+    classes = {
+        INTERACTIVE: {'priority': 0, 'max_concurrent': 1, 'max_queue': 4, 'deadline': 2.0},
+        BATCH: {'priority': 1, 'max_concurrent': 1, 'max_queue': 4, 'deadline': 2.0}
+    }
+    for name, config in overrides.items():
+        classes[name].update(config)
+    return AdmissionController(classes, total_slots=total_slots)
+
+
+def _acquire_later(controller, class_name, order, timeout=None):
+    def run():
+        ticket = controller.acquire(class_name, timeout)
+        order.append(class_name)
+        ticket.release()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_queued(controller, class_name, depth=1):
+    for _ in range(200):
+        if controller.queue_depth(class_name) >= depth:
+            return
+        time.sleep(0.005)
+    pytest.fail(f'{class_name} request was never queued')
+
+
+def test_interactive_waiters_are_served_before_batch():
+    controller = _controller()
+    held = controller.acquire(BATCH)
+    order = []
+    batch = _acquire_later(controller, BATCH, order)
+    _wait_queued(controller, BATCH)
+    interactive = _acquire_later(controller, INTERACTIVE, order)
+    _wait_queued(controller, INTERACTIVE)
+
+    held.release()
+    batch.join()
+    interactive.join()
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_full_queue_is_rejected():
+    controller = _controller(**{BATCH: {'max_queue': 1}})
+    held = controller.acquire(BATCH)
+    order = []
+    waiter = _acquire_later(controller, BATCH, order)
+    _wait_queued(controller, BATCH)
+
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire(BATCH)
+    assert rejected.value.reason == 'queue_full'
+    held.release()
+    waiter.join()
+    assert order == [BATCH]
+
+
+def test_expected_wait_beyond_deadline_is_shed_up_front():
+    controller = _controller()
+    controller.classes[BATCH].service_time = 5.0
+    held = controller.acquire(BATCH)
+
+    started = time.perf_counter()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire(BATCH, timeout=1.0)
+    assert rejected.value.reason == 'deadline'
+    assert rejected.value.retry_after >= 5
+    assert time.perf_counter() - started < 0.5
+    held.release()
+
+
+def test_client_deadline_cannot_extend_class_deadline():
+    controller = _controller(**{BATCH: {'deadline': 0.05}})
+    held = controller.acquire(BATCH)
+
+    started = time.perf_counter()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire(BATCH, timeout=30.0)
+    assert rejected.value.reason == 'timeout'
+    assert time.perf_counter() - started < 1.0
+    held.release()
+
+
+def test_api_sheds_with_503_and_retry_after(monkeypatch):
+    import api
+    controller = _controller(**{INTERACTIVE: {'max_queue': 0}})
+    monkeypatch.setattr(api, 'admission_controller', controller)
+    monkeypatch.setattr(api, 'ADMISSION_ENABLED', True)
+    held = controller.acquire(INTERACTIVE)
+    try:
+        response = api.app.test_client().post('/predict/route', json={})
+    finally:
+        held.release()
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['reason'] == 'queue_full'
+    assert controller.classes[INTERACTIVE].rejected == 1
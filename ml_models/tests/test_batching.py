@@ -0,0 +1,77 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+def _submit_all(batcher, rows):
+    results = [None] * len(rows)
+    errors = [None] * len(rows)
+
+    def run(i):
+        try:
+            results[i] = batcher.submit(rows[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_rows_get_their_own_results():
+    sizes = []
+
+    def score(X):
+        sizes.append(len(X))
+        time.sleep(0.005)
+        return X.sum(axis=1)
+
+    batcher = MicroBatcher(score, 'test', max_batch_size=8, max_latency_ms=5)
+    rows = [np.array([[float(i), 1.0]]) for i in range(40)]
+    results, errors = _submit_all(batcher, rows)
+    batcher.close()
+
+    assert errors == [None] * 40
+    assert results == [i + 1.0 for i in range(40)]
+    assert max(sizes) > 1
+    assert max(sizes) <= 8
+
+
+def test_scoring_error_reaches_every_row_of_the_batch():
+    def score(X):
+        raise ValueError('bad batch')
+
+    batcher = MicroBatcher(score, 'test')
+    results, errors = _submit_all(batcher, [np.zeros((1, 2)) for _ in range(5)])
+    batcher.close()
+
+    assert results == [None] * 5
+    assert all(isinstance(e, ValueError) and str(e) == 'bad batch' for e in errors)
+
+
+def test_close_stops_worker_and_scores_later_rows_inline():
+    batcher = MicroBatcher(lambda X: X[:, 0] * 2, 'test')
+    assert batcher.submit(np.array([[1.0]])) == 2.0
+
+    batcher.close()
+    assert not batcher._worker.is_alive()
+    assert batcher.submit(np.array([[3.0]])) == pytest.approx(6.0)
+    batcher.close()
+
+
+def test_swapped_out_route_model_stops_batching(route_model):
+    route_model.batching_closed = False
+    batcher = route_model.enable_batching()
+    try:
+        route_model.disable_batching()
+        assert not batcher._worker.is_alive()
+        assert route_model.enable_batching() is None
+    finally:
+        route_model.batching_closed = False
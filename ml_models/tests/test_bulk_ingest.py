@@ -0,0 +1,110 @@
+import io
+
+import pandas as pd
+import pytest
+
+import bulk_ingest
+from bulk_ingest import BulkIngestor, DELIVERIES, WEATHER, validate
+
+
+def _delivery(**overrides):
+    row = {
+        'time': '2026-03-01T08:00:00Z', 'time_of_day': 8, 'day_of_week': 6, 'is_holiday': 0,
+        'rainfall_mm': 1.5, 'temperature': 21.0, 'traffic_index': 55.0, 'road_type': 2,
+        'distance_km': 12.5, 'construction_zones': 1, 'special_events': 0, 'travel_time_minutes': 31.0
+    }
+    row.update(overrides)
+    return row
+
+
+class _FakeCursor:
+    def __init__(self):
+        self.statements = []
+
+    def copy_expert(self, sql, buffer):
+        self.statements.append((sql, buffer.read()))
+
+
+class _FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.cursor_ = _FakeCursor()
+        self.commits = self.rollbacks = 0
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_valid_deliveries_pass():
+    valid, rejected, errors = validate(DELIVERIES, pd.DataFrame([_delivery(), _delivery(road_type=0)]))
+    assert (len(valid), rejected, errors) == (2, 0, [])
+    assert valid['region'].isna().all()
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'distance_km': None}, 'missing distance_km'),
+    ({'traffic_index': 'busy'}, 'invalid traffic_index'),
+    ({'rainfall_mm': float('inf')}, 'invalid rainfall_mm'),
+    ({'time_of_day': 24}, 'invalid time_of_day'),
+    ({'road_type': 1.5}, 'invalid road_type'),
+    ({'time': 'yesterday'}, 'invalid time'),
+])
+def test_invalid_deliveries_are_rejected(overrides, message):
+    frame = pd.DataFrame([_delivery(), _delivery(**overrides), _delivery()])
+    valid, rejected, errors = validate(DELIVERIES, frame)
+    assert len(valid) == 2
+    assert rejected == 1
+    assert errors == [f'Row 1: {message}']
+
+
+def test_errors_are_capped_but_every_row_is_counted():
+    frame = pd.DataFrame([_delivery(day_of_week=-1, distance_km=None)] * (bulk_ingest.MAX_ERRORS + 5))
+    valid, rejected, errors = validate(DELIVERIES, frame)
+    assert valid.empty
+    assert rejected == bulk_ingest.MAX_ERRORS + 5
+    assert len(errors) == bulk_ingest.MAX_ERRORS
+    assert errors[0] == 'Row 0: missing distance_km, invalid day_of_week'
+
+
+def test_weather_rows_need_a_reading():
+    frame = pd.DataFrame([
+        {'gauge_id': 7, 'region': 'Parramatta', 'rainfall_mm': 3.0},
+        {'gauge_id': 8, 'region': 'Parramatta'},
+        {'region': 'Parramatta', 'rainfall_mm': 1.0},
+    ])
+    valid, rejected, errors = validate(WEATHER, frame)
+    assert valid['gauge_id'].tolist() == ['7']
+    assert rejected == 2
+    assert sorted(errors) == ['Row 1: no readings', 'Row 2: missing gauge_id']
+
+
+def test_copy_writes_integer_columns_without_decimals():
+    cursor = _FakeCursor()
+    frame = pd.DataFrame({'road_type': [2.0, None], 'distance_km': [12.5, 3.0]})
+    bulk_ingest._copy(cursor, 'ml_data.training_data', frame)
+    [(sql, csv)] = cursor.statements
+    assert sql == 'COPY ml_data.training_data (road_type, distance_km) FROM STDIN WITH (FORMAT csv)'
+    assert csv.splitlines() == ['2,12.5', ',3.0']
+
+
+def test_delivery_write_copies_typed_columns_and_json():
+    valid, _, _ = validate(DELIVERIES, pd.DataFrame([_delivery()]))
+    ingestor = BulkIngestor()
+    ingestor.conn = _FakeConnection()
+    batch_id = ingestor.write(DELIVERIES, valid, source='test')
+
+    [(sql, csv)] = ingestor.conn.cursor_.statements
+    columns = sql[sql.index('(') + 1:sql.index(')')].split(', ')
+    [row] = pd.read_csv(io.StringIO(csv), header=None, names=columns, dtype=str).to_dict('records')
+    assert ingestor.conn.commits == 1
+    assert row['batch_id'] == batch_id and row['source'] == 'test'
+    assert row['road_type'] == '2' and row['time_of_day'] == '8'
+    assert '"road_type":2,' in row['features']
+    assert row['labels'] == '{"travel_time_minutes":31.0}'
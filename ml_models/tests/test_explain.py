@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import FLOOD_HIGH, FLOOD_LOW, ROUTE_A, ROUTE_B
+
+
+def test_route_explain_batch_matches_single_predictions(route_model):
+    explained = route_model.explain_batch([ROUTE_A, ROUTE_B])
+    for features, result in zip([ROUTE_A, ROUTE_B], explained):
+        expected = route_model.predict(features)['travel_time_minutes']
+        assert result['travel_time_minutes'] == pytest.approx(expected)
+        total = result['expected_minutes'] + sum(result['attributions'].values())
+        assert total == pytest.approx(expected, abs=1e-6)
+
+
+def test_flood_explain_batch_matches_single_predictions(flood_model):
+    explained = flood_model.explain_batch([FLOOD_LOW, FLOOD_HIGH])
+    for features, result in zip([FLOOD_LOW, FLOOD_HIGH], explained):
+        expected = flood_model.predict(features)['flood_probability']
+        assert result['flood_probability'] == pytest.approx(expected)
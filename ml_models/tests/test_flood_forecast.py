@@ -0,0 +1,36 @@
+import pytest
+
+from flood_forecast import FloodForecastService
+
+
+@pytest.mark.parametrize('regions, message', [
+    ({'Parramatta': {'rainfall_mm_24h': 5}}, 'must be a list'),
+    ({'Parramatta': [5]}, 'must be an object'),
+    ({'Parramatta': [{'rainfall_mm_24h': 'heavy'}]}, 'must be numeric'),
+    ({'Parramatta': [{'river_level_m': 'nan'}]}, 'must be finite'),
+    (['Parramatta'], 'must map each region'),
+])
+def test_malformed_inputs_are_rejected(flood_model, regions, message):
+    with pytest.raises(ValueError, match=message):
+        FloodForecastService(flood_model).validate_inputs(regions)
+
+
+def test_validated_inputs_precompute(flood_model):
+    service = FloodForecastService(flood_model, hours=3)
+    regions = service.validate_inputs({
+        'Parramatta': [{'rainfall_mm_24h': '80', 'unknown': 'ignored'}, None, {'river_level_m': 3}]
+    })
+    assert regions == {'Parramatta': [{'rainfall_mm_24h': 80.0}, None, {'river_level_m': 3.0}]}
+    grid = service.precompute(regions)
+    assert len(grid.query('Parramatta')) == 3
+
+
+def test_api_returns_400_before_queueing(flood_model, monkeypatch):
+    import api
+    service = FloodForecastService(flood_model)
+    monkeypatch.setattr(api, '_get_flood_forecast', lambda: service)
+    monkeypatch.setattr(service, 'submit', lambda *args: pytest.fail('malformed inputs were queued'))
+
+    response = api.app.test_client().post('/forecast/flood/inputs', json={'regions': {'Parramatta': {'h': 1}}})
+    assert response.status_code == 400
+    assert 'must be a list' in response.get_json()['error']
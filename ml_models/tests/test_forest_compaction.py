@@ -0,0 +1,40 @@
+import json
+import runpy
+import sys
+
+import pytest
+
+import backends
+import forest_compaction
+from conftest import ROUTE_A, ROUTE_B
+from route_optimization import RouteOptimizationModel
+
+
+def test_cli_artifact_loads_in_server(route_model, tmp_path, monkeypatch):
+    output = tmp_path / 'route.compact.joblib'
+    report = tmp_path / 'report.json'
+    monkeypatch.setattr(RouteOptimizationModel, 'connect_db', lambda self: setattr(self, 'use_db', False))
+    monkeypatch.setattr(sys, 'argv', [
+        'forest_compaction.py', '--model', route_model.model_path, '--output', str(output),
+        '--report', str(report), '--tolerances', '0.01'
+    ])
+    # As `python forest_compaction.py`, where the module runs as __main__
+    runpy.run_path(forest_compaction.__file__, run_name='__main__')
+
+    loaded = RouteOptimizationModel(use_db=False)
+    loaded.load_model(str(output))
+    assert type(loaded.model).__module__ == 'forest_compaction'
+    assert backends.backend_of(loaded.model) == backends.COMPACT
+    assert loaded.model_version == json.loads(report.read_text())['artifact_version']
+
+    for features in (ROUTE_A, ROUTE_B):
+        compact_minutes = loaded.predict(features)['travel_time_minutes']
+        assert compact_minutes == pytest.approx(route_model.predict(features)['travel_time_minutes'], rel=0.25)
+
+    results = loaded.predict_quantiles([ROUTE_A, ROUTE_B], [0.1, 0.5, 0.9])
+    assert len(results) == 2
+    for features, result in zip((ROUTE_A, ROUTE_B), results):
+        quantiles = result['quantiles']
+        assert list(quantiles) == ['p10', 'p50', 'p90']
+        assert quantiles['p10'] <= quantiles['p50'] <= quantiles['p90']
+        assert result['travel_time_minutes'] == pytest.approx(loaded.predict(features)['travel_time_minutes'])
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROUTE_A, ROUTE_B
+from forest_quantiles import quantile_label
+
+
+def test_predict_quantiles_per_row(route_model):
+    quantiles = [0.1, 0.5, 0.9]
+    results = route_model.predict_quantiles([ROUTE_A, ROUTE_B], quantiles)
+    for features, result in zip([ROUTE_A, ROUTE_B], results):
+        X = route_model.scaler.transform(pd.DataFrame([features], columns=route_model.feature_names))
+        outputs = [tree.predict(X)[0] for tree in route_model.model.estimators_]
+        expected = np.quantile(outputs, quantiles)
+        for q, value in zip(quantiles, expected):
+            assert result['quantiles'][quantile_label(q)] == pytest.approx(value)
+        assert result['travel_time_minutes'] == pytest.approx(route_model.predict(features)['travel_time_minutes'])
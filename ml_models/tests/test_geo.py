@@ -0,0 +1,24 @@
+import pytest
+
+import geo
+
+
+@pytest.mark.parametrize('query, message', [
+    ('k=0', 'k must be at least 1'),
+    ('radius_km=-1', 'radius_km must be a non-negative number'),
+    ('radius_km=nan', 'radius_km must be a non-negative number'),
+    ('kind=airport', "Unknown kind 'airport'"),
+    ('kind=airport&radius_km=5', "Unknown kind 'airport'"),
+])
+def test_nearest_rejects_bad_queries(query, message):
+    import api
+    response = api.app.test_client().get(f'/geo/nearest?lat=-33.87&lon=151.21&{query}')
+    assert response.status_code == 400
+    assert message in response.get_json()['error']
+
+
+def test_nearest_filters_by_kind():
+    locations = geo.get_location_index().nearest(-33.87, 151.21, k=3, kind='depot')
+    assert len(locations) == 3
+    assert {location['kind'] for location in locations} == {'depot'}
+    assert [l['distance_km'] for l in locations] == sorted(l['distance_km'] for l in locations)
@@ -0,0 +1,21 @@
+import pytest
+
+from conftest import ROUTE_A, ROUTE_B
+from residuals import ResidualCorrector
+
+
+def test_observe_actuals_scores_each_delivery(route_model, tmp_path):
+    route_model.residuals = ResidualCorrector(path=str(tmp_path / 'residuals.json'))
+    try:
+        expected = [route_model.predict(f)['travel_time_minutes'] for f in (ROUTE_A, ROUTE_B)]
+        predicted = route_model.observe_actuals([ROUTE_A, ROUTE_B], [expected[0] + 5, expected[1] - 5])
+        assert predicted.tolist() == pytest.approx(expected)
+
+        # Each cell learns its own delivery's residual
+        cells = route_model.residuals.stats
+        key_a = (None, ROUTE_A['time_of_day'], ROUTE_A['road_type'])
+        key_b = (None, ROUTE_B['time_of_day'], ROUTE_B['road_type'])
+        assert cells[key_a].mean == pytest.approx(5)
+        assert cells[key_b].mean == pytest.approx(-5)
+    finally:
+        route_model.residuals = None
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+import metrics
+from singleflight import SingleFlight
+
+
+def _followers(group, key, fn, count):
+    """Start count callers of group.do(key, fn); returns (threads, outcomes)"""
+    outcomes = [None] * count
+
+    def run(i):
+        try:
+            outcomes[i] = ('result', group.do(key, fn))
+        except Exception as e:
+            outcomes[i] = ('error', e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def _wait_for_followers(group, count):
+    """Block until count followers are waiting on the leader's call"""
+    deadline = time.monotonic() + 5
+    while metrics.COALESCED_REQUESTS.value(group=group.name) < count:
+        assert time.monotonic() < deadline, 'followers never joined the call'
+        time.sleep(0.01)
+
+
+def _leader_fn(release, started, calls, outcome):
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return outcome()
+    return fn
+
+
+def test_concurrent_calls_share_one_execution():
+    group = SingleFlight('test-share')
+    release, started, calls = threading.Event(), threading.Event(), []
+    fn = _leader_fn(release, started, calls, lambda: {'value': 42})
+
+    leader, leader_outcome = _followers(group, 'k', fn, 1)
+    started.wait(5)
+    threads, outcomes = _followers(group, 'k', fn, 4)
+    _wait_for_followers(group, 4)
+    release.set()
+    for thread in leader + threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert leader_outcome + outcomes == [('result', {'value': 42})] * 5
+
+
+def test_leader_error_reaches_every_follower():
+    group = SingleFlight('test-error')
+    release, started, calls = threading.Event(), threading.Event(), []
+
+    def fail():
+        raise ValueError('model unavailable')
+
+    fn = _leader_fn(release, started, calls, fail)
+    leader, leader_outcome = _followers(group, 'k', fn, 1)
+    started.wait(5)
+    threads, outcomes = _followers(group, 'k', fn, 3)
+    _wait_for_followers(group, 3)
+    release.set()
+    for thread in leader + threads:
+        thread.join()
+
+    assert len(calls) == 1
+    for kind, error in leader_outcome + outcomes:
+        assert kind == 'error'
+        assert isinstance(error, ValueError) and str(error) == 'model unavailable'
+
+
+def test_keys_are_forgotten_after_the_call():
+    group = SingleFlight('test')
+    with pytest.raises(ValueError):
+        group.do('k', lambda: (_ for _ in ()).throw(ValueError('first')))
+    assert group.do('k', lambda: 'second') == 'second'
+    assert group.do('other', lambda: 'independent') == 'independent'
@@ -0,0 +1,38 @@
+import pytest
+
+import api
+from conftest import ROUTE_A
+from residuals import ResidualCorrector
+
+
+def test_restart_reloads_saved_corrections(route_model, flood_model, tmp_path, monkeypatch):
+    path = str(tmp_path / 'residuals.json')
+    before = ResidualCorrector(path=path)
+    before.bind(route_model.model_version)
+    for _ in range(50):
+        before.observe(ROUTE_A, 20.0, 26.0)
+    before.save()
+    expected = before.correction(ROUTE_A, route_model.model_version)
+    assert expected > 0
+
+    def route_model_class(residuals=None):
+        route_model.residuals = residuals
+        return route_model
+
+    # A restarted process: empty corrector, models and stored state from disk
+    monkeypatch.setattr(api, 'residual_corrector', ResidualCorrector(path=path))
+    monkeypatch.setattr(api, 'flood_model', None)
+    monkeypatch.setattr(api, 'route_model', None)
+    monkeypatch.setattr(api, 'FloodPredictionModel', lambda: flood_model)
+    monkeypatch.setattr(api, 'RouteOptimizationModel', route_model_class)
+    monkeypatch.setattr(api, '_get_flood_forecast', lambda: None)
+    monkeypatch.setattr(api.registry, 'import_legacy', lambda model_type: None)
+    monkeypatch.setattr(api.ingestor, 'recent_weather_readings', lambda: [])
+    monkeypatch.setattr(ResidualCorrector, 'start_autosave', lambda self, interval=None: None)
+    try:
+        api.init_app()
+        assert api.route_model is route_model
+        result = api.route_model.predict(ROUTE_A)
+        assert result['bias_correction_minutes'] == pytest.approx(expected)
+    finally:
+        route_model.residuals = None
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from surrogate import FloodSurrogate
+
+
+@pytest.fixture
+def whatif_client(monkeypatch):
+    import api
+    table = FloodSurrogate(
+        ['rainfall_mm_24h', 'river_level_m'], [[0.0, 100.0], [0.0, 5.0]], ['Parramatta'],
+        np.array([[[0.0, 0.5], [0.5, 1.0]]]), {'Parramatta': {'rainfall_mm_24h': 0.0, 'river_level_m': 1.0}}
+    )
+    monkeypatch.setattr(api, 'flood_surrogate', table)
+    return api.app.test_client()
+
+
+def test_lookup_interpolates_between_grid_points(whatif_client):
+    response = whatif_client.get('/whatif/flood?region=Parramatta&rainfall_mm_24h=50&river_level_m=2.5')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['flood_probability'] == pytest.approx(0.5)
+    assert body['cell_range'] == [0.0, 1.0]
+    assert body['clamped'] is False
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf'])
+def test_non_finite_sliders_are_rejected(whatif_client, value):
+    response = whatif_client.get(f'/whatif/flood?region=Parramatta&rainfall_mm_24h={value}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "Slider values must be finite: ['rainfall_mm_24h']"
@@ -0,0 +1,247 @@
+"""
+Live Weather Features
+---------------------
+Streaming feature engine for flood predictions. Raw gauge readings
+(rainfall, river level and optionally soil moisture, temperature and
+wind) are ingested as they arrive. Each gauge keeps a 72-slot hourly ring
+buffer of rainfall with running 24h and 72h totals, updated in O(1) per
+reading, plus its latest instantaneous values. /predict/flood can then be
+called with just a region: the feature vector is assembled from the
+region's gauges and the suburb's static profile.
+"""
+
+import os
+import math
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import geo
+from flood_ensemble import WEATHER_DEFAULTS
+
+logger = logging.getLogger('weather_features')
+
+RAIN_WINDOW_HOURS = 72
+SHORT_RAIN_WINDOW_HOURS = 24
+
+# Instantaneous readings older than this are ignored when assembling features
+STALE_HOURS = float(os.environ.get('ML_WEATHER_STALE_HOURS', 6))
+
+INSTANT_FEATURES = ('river_level_m', 'soil_moisture', 'temperature_c', 'wind_speed_kmh')
+READING_FIELDS = ('rainfall_mm',) + INSTANT_FEATURES
+
+
+def _epoch_hour(timestamp):
+    return int(timestamp.timestamp() // 3600)
+
+
+def parse_timestamp(value):
+    """
+    Reading time from an ISO 8601 string or epoch seconds as a naive local
+    datetime, defaulting to now
+    """
+    if value is None:
+        return datetime.now()
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class GaugeState:
+    """Rainfall ring buffer and latest instantaneous readings for one gauge"""
+
+    __slots__ = ('gauge_id', 'region', 'rain', 'head', 'rain_24h', 'rain_72h',
+                 'reports_rain', 'latest', 'last_reading')
+
+    def __init__(self, gauge_id, region):
+        self.gauge_id = gauge_id
+        self.region = region
+        self.rain = [0.0] * RAIN_WINDOW_HOURS
+        self.head = None
+        self.rain_24h = 0.0
+        self.rain_72h = 0.0
+        self.reports_rain = False
+        self.latest = {}
+        self.last_reading = None
+
+    def advance(self, hour):
+        """Move the buffer head forward to hour, expiring rain that left each window"""
+        if self.head is None or hour - self.head >= RAIN_WINDOW_HOURS:
+            self.rain = [0.0] * RAIN_WINDOW_HOURS
+            self.rain_24h = self.rain_72h = 0.0
+            self.head = hour
+            return
+        for h in range(self.head + 1, hour + 1):
+            self.rain_24h -= self.rain[(h - SHORT_RAIN_WINDOW_HOURS) % RAIN_WINDOW_HOURS]
+            slot = h % RAIN_WINDOW_HOURS
+            self.rain_72h -= self.rain[slot]
+            self.rain[slot] = 0.0
+        self.head = max(self.head, hour)
+
+    def add_rainfall(self, hour, mm):
+        """Add rain that fell in an hour; False if it is already outside the 72h window"""
+        if self.head is None or hour > self.head:
+            self.advance(hour)
+        age = self.head - hour
+        if age >= RAIN_WINDOW_HOURS:
+            return False
+        self.rain[hour % RAIN_WINDOW_HOURS] += mm
+        self.rain_72h += mm
+        if age < SHORT_RAIN_WINDOW_HOURS:
+            self.rain_24h += mm
+        self.reports_rain = True
+        return True
+
+    def record(self, timestamp, values):
+        """Apply one reading; False if nothing in it could be used"""
+        used = False
+        if 'rainfall_mm' in values:
+            used = self.add_rainfall(_epoch_hour(timestamp), values['rainfall_mm'])
+        for name in INSTANT_FEATURES:
+            if name in values:
+                previous = self.latest.get(name)
+                if previous is None or timestamp >= previous[0]:
+                    self.latest[name] = (timestamp, values[name])
+                used = True
+        if used and (self.last_reading is None or timestamp > self.last_reading):
+            self.last_reading = timestamp
+        return used
+
+
+class WeatherFeatureEngine:
+    """Per-gauge live weather state, aggregated into flood features per region"""
+
+    def __init__(self, stale_hours=STALE_HOURS):
+        self.stale_hours = stale_hours
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def _parse(self, reading):
+        """(gauge_id, region, timestamp, values) from a raw reading dict"""
+        if not isinstance(reading, dict):
+            raise ValueError("reading must be an object")
+        gauge_id = reading.get('gauge_id')
+        if gauge_id is None:
+            raise ValueError("missing gauge_id")
+
+        region = reading.get('region')
+        if region is None and reading.get('latitude') is not None and reading.get('longitude') is not None:
+            nearest = geo.get_location_index().nearest(
+                float(reading['latitude']), float(reading['longitude']), kind='suburb'
+            )
+            region = nearest[0]['name']
+
+        values = {name: float(reading[name]) for name in READING_FIELDS if reading.get(name) is not None}
+        for name, value in values.items():
+            # One NaN would poison the gauge's running totals until it ages out
+            if not math.isfinite(value):
+                raise ValueError(f"{name} must be a finite number, got {reading[name]!r}")
+        if not values:
+            raise ValueError(f"no readings among {list(READING_FIELDS)}")
+        if values.get('rainfall_mm', 0.0) < 0:
+            raise ValueError("rainfall_mm must not be negative")
+        return str(gauge_id), region, parse_timestamp(reading.get('time')), values
+
+    def ingest(self, readings):
+        """Apply a list of raw readings. Returns (accepted count, error messages)."""
+        parsed, errors = [], []
+        for i, reading in enumerate(readings):
+            try:
+                parsed.append((i,) + self._parse(reading))
+            except (TypeError, ValueError) as e:
+                errors.append(f"Reading {i}: {e}")
+
+        accepted = 0
+        with self._lock:
+            for i, gauge_id, region, timestamp, values in parsed:
+                gauge = self.gauges.get(gauge_id)
+                if gauge is None:
+                    if region is None:
+                        errors.append(f"Reading {i}: unknown gauge {gauge_id} needs a region or coordinates")
+                        continue
+                    gauge = self.gauges[gauge_id] = GaugeState(gauge_id, region)
+                elif region is not None:
+                    gauge.region = region
+                if gauge.record(timestamp, values):
+                    accepted += 1
+                else:
+                    errors.append(f"Reading {i}: older than the {RAIN_WINDOW_HOURS}h window")
+        return accepted, errors
+
+    def regions(self):
+        with self._lock:
+            return sorted({gauge.region for gauge in self.gauges.values()})
+
+    def region_features(self, region, now=None):
+        """
+        Live weather features for a region: mean rainfall totals over its
+        rain gauges, the highest recent river level and the mean of other
+        recent readings. Raises KeyError if the region has no gauges.
+        """
+        now = now or datetime.now()
+        hour = _epoch_hour(now)
+        cutoff = now - timedelta(hours=self.stale_hours)
+
+        with self._lock:
+            gauges = [gauge for gauge in self.gauges.values() if gauge.region == region]
+            if not gauges:
+                raise KeyError(region)
+            rain_24h, rain_72h = [], []
+            for gauge in gauges:
+                if gauge.reports_rain:
+                    gauge.advance(hour)
+                    rain_24h.append(max(gauge.rain_24h, 0.0))
+                    rain_72h.append(max(gauge.rain_72h, 0.0))
+            instant = {
+                name: [
+                    gauge.latest[name][1] for gauge in gauges
+                    if name in gauge.latest and gauge.latest[name][0] >= cutoff
+                ]
+                for name in INSTANT_FEATURES
+            }
+            last_reading = max((g.last_reading for g in gauges if g.last_reading), default=None)
+
+        features = {}
+        if rain_24h:
+            features['rainfall_mm_24h'] = sum(rain_24h) / len(rain_24h)
+            features['rainfall_mm_72h'] = sum(rain_72h) / len(rain_72h)
+        for name, values in instant.items():
+            if values:
+                features[name] = max(values) if name == 'river_level_m' else sum(values) / len(values)
+        return features, {
+            'gauges': len(gauges),
+            'rain_gauges': len(rain_24h),
+            'last_reading': last_reading.isoformat() if last_reading else None
+        }
+
+    def flood_features(self, item):
+        """
+        Complete a flood request that names a region: live features fill in
+        anything the request leaves out, then the suburb profile and weather
+        defaults. Raises ValueError if the region has no live readings.
+        """
+        region = item.get('region')
+        try:
+            live, _ = self.region_features(region)
+        except KeyError:
+            raise ValueError(f"No live weather readings for region: {region}")
+
+        features = dict(WEATHER_DEFAULTS)
+        if region in geo.SUBURB_PROFILES:
+            features.update(geo.suburb_static_features(region))
+        features.update(live)
+        features.update(item)
+        return features
+
+    def snapshot(self, region=None):
+        """Live features and gauge counts for one region or all of them"""
+        regions = [region] if region is not None else self.regions()
+        result = {}
+        for name in regions:
+            features, info = self.region_features(name)
+            result[name] = {'features': features, **info}
+        return result
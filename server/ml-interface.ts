@@ -8,6 +8,7 @@
 import { exec } from 'child_process';
 import { promisify } from 'util';
 import axios from 'axios';
+import { decode as msgpackDecode, encode as msgpackEncode } from '@msgpack/msgpack';
 import { log } from './vite';
 
 const execAsync = promisify(exec);
@@ -140,6 +141,120 @@ async function getPredictionViaPython(request: MLPredictionRequest): Promise<MLP
   }
 }
 
+/**
+ * Columnar batch encoding, matching ml_models/columnar.py.
+ *
+ * A batch is sent as a MessagePack map {length, columns} where numeric
+ * columns are bins of little-endian float64 values ("<f8") and text columns
+ * are arrays of strings. This avoids repeating every feature name per row.
+ * Only MessagePack is used from Node; the Arrow IPC format the API also
+ * accepts is meant for Python clients.
+ */
+const MSGPACK_CONTENT_TYPE = 'application/msgpack';
+
+export type ColumnarBatch = Record<string, Float64Array | number[] | string[]>;
+export type ColumnarResult = Record<string, Float64Array | unknown[]>;
+
+const FLOAT64_BYTES = 8;
+
+/**
+ * Little-endian float64 bytes of a numeric column
+ */
+function float64Bytes(values: Float64Array | number[]): Uint8Array {
+  const bytes = new Uint8Array(values.length * FLOAT64_BYTES);
+  const view = new DataView(bytes.buffer);
+  for (let i = 0; i < values.length; i++) {
+    view.setFloat64(i * FLOAT64_BYTES, values[i], true);
+  }
+  return bytes;
+}
+
+/**
+ * Float64Array from a bin column of little-endian float64 values
+ */
+function float64Column(name: string, bytes: Uint8Array): Float64Array {
+  if (bytes.byteLength % FLOAT64_BYTES !== 0) {
+    throw new Error(`Column '${name}' has ${bytes.byteLength} bytes, not a whole number of float64 values`);
+  }
+  const values = new Float64Array(bytes.byteLength / FLOAT64_BYTES);
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  for (let i = 0; i < values.length; i++) {
+    values[i] = view.getFloat64(i * FLOAT64_BYTES, true);
+  }
+  return values;
+}
+
+/**
+ * Encode feature columns as a MessagePack columnar batch
+ */
+export function encodeColumns(columns: ColumnarBatch): Buffer {
+  const names = Object.keys(columns);
+  const length = names.length ? columns[names[0]].length : 0;
+  const packed: Record<string, Uint8Array | string[]> = {};
+  for (const name of names) {
+    const values = columns[name];
+    packed[name] = values.length && typeof values[0] === 'string'
+      ? values as string[]
+      : float64Bytes(values as Float64Array | number[]);
+  }
+  const bytes = msgpackEncode({ length, columns: packed });
+  return Buffer.from(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+}
+
+/**
+ * Decode a MessagePack columnar batch; numeric columns become Float64Arrays
+ */
+export function decodeColumns(data: Buffer | ArrayBuffer): ColumnarResult {
+  const payload = msgpackDecode(data) as { length?: number; columns?: Record<string, unknown> } | null;
+  if (!payload || typeof payload.columns !== 'object' || payload.columns === null) {
+    throw new Error('Columnar response is missing its columns map');
+  }
+
+  const columns: ColumnarResult = {};
+  for (const [name, values] of Object.entries(payload.columns)) {
+    if (values instanceof Uint8Array) {
+      columns[name] = float64Column(name, values);
+    } else if (Array.isArray(values)) {
+      columns[name] = values;
+    } else {
+      throw new Error(`Column '${name}' must be a float64 bin or an array`);
+    }
+    if (payload.length !== undefined && columns[name].length !== payload.length) {
+      throw new Error(`Column '${name}' has ${columns[name].length} values, expected ${payload.length}`);
+    }
+  }
+  return columns;
+}
+
+/**
+ * Get batch predictions via the API using the columnar MessagePack encoding
+ */
+export async function getBatchPredictionsColumnar(
+  model: 'flood' | 'route',
+  columns: ColumnarBatch
+): Promise<{ success: boolean; predictions?: ColumnarResult; error?: string }> {
+  try {
+    const response = await axios.post(`${ML_API_URL}/predict/${model}/batch`, encodeColumns(columns), {
+      headers: {
+        'Content-Type': MSGPACK_CONTENT_TYPE,
+        'Accept': MSGPACK_CONTENT_TYPE
+      },
+      responseType: 'arraybuffer'
+    });
+
+    return {
+      success: true,
+      predictions: decodeColumns(response.data)
+    };
+  } catch (error) {
+    log(`Columnar batch prediction error: ${error}`, 'ml');
+    return {
+      success: false,
+      error: `Columnar batch prediction failed: ${error}`
+    };
+  }
+}
+
 /**
  * Get information about available ML models
  */